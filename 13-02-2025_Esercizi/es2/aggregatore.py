@@ -0,0 +1,256 @@
+"""
+Somma dei numeri pari e prodotto dei numeri dispari su sequenze di qualsiasi lunghezza.
+
+I numeri vengono letti a blocchi (da file o da stdin) e ogni blocco è elaborato con
+NumPy: la somma dei pari è esatta anche quando supererebbe int64, i dispari vengono
+moltiplicati a coppie finché i prodotti stanno in int64 e poi con un albero bilanciato
+di interi Python. Moltiplicare sempre numeri di dimensioni simili evita il costo
+quadratico del prodotto da sinistra a destra, in cui il risultato parziale enorme
+viene moltiplicato per un fattore piccolo alla volta. Ai livelli alti dell'albero,
+dove i fattori hanno milioni di bit, la moltiplicazione usa la FFT di NumPy.
+"""
+import math
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+# Caratteri letti alla volta da un file; in un blocco stanno circa 500 mila numeri di 6-7 cifre
+DIMENSIONE_BLOCCO = 1 << 22
+SEPARATORI = str.maketrans(",;", "  ")
+# Oltre questo valore il prodotto di due numeri può non stare in int64 (floor(sqrt(2^63 - 1)))
+LIMITE_COPPIE = 3_037_000_499
+INT64_MIN, INT64_MAX = np.iinfo(np.int64).min, np.iinfo(np.int64).max
+# Sotto questa dimensione (in bit del fattore più piccolo) la moltiplicazione di Python è più veloce della FFT
+SOGLIA_FFT = 1 << 17
+# Lunghezza massima della FFT: circa 128 MB per array, oltre si divide il fattore più grande
+MAX_PUNTI_FFT = 1 << 24
+# Primo di Mersenne usato per controllare il risultato della FFT
+MODULO_CONTROLLO = (1 << 61) - 1
+
+
+def _moltiplica_fft(a: int, b: int) -> int:
+    """
+    Prodotto di due interi non negativi con la FFT: le cifre in base 256 dei due numeri
+    vengono convolute in virgola mobile e poi arrotondate, quindi si controlla il risultato
+    modulo un primo e, nel caso raro di un errore di arrotondamento, si ripiega su a * b.
+    """
+    cifre_a = np.frombuffer(a.to_bytes((a.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+    cifre_b = np.frombuffer(b.to_bytes((b.bit_length() + 7) // 8, "little"), dtype=np.uint8)
+    n = cifre_a.size + cifre_b.size - 1
+    punti = 1 << (n - 1).bit_length()
+    convoluzione = np.fft.irfft(np.fft.rfft(cifre_a, punti) * np.fft.rfft(cifre_b, punti), punti)[:n]
+    coefficienti = np.rint(convoluzione).astype(np.uint64)
+    del convoluzione
+    # Ogni coefficiente occupa più byte: si ricompongono i byte di pari peso e si sommano le parti spostate
+    risultato = 0
+    for j in range((int(coefficienti.max()).bit_length() + 7) // 8):
+        parte = ((coefficienti >> np.uint64(8 * j)) & np.uint64(0xFF)).astype(np.uint8)
+        risultato += int.from_bytes(parte.tobytes(), "little") << (8 * j)
+    if risultato % MODULO_CONTROLLO != (a % MODULO_CONTROLLO) * (b % MODULO_CONTROLLO) % MODULO_CONTROLLO:
+        return a * b
+    return risultato
+
+
+def moltiplica(a, b):
+    """
+    Prodotto esatto di due interi, con la FFT quando sono entrambi abbastanza grandi;
+    gli altri valori (es. float) vengono moltiplicati con *.
+    """
+    if type(a) is not int or type(b) is not int or min(a.bit_length(), b.bit_length()) < SOGLIA_FFT:
+        return a * b
+    segno = -1 if (a < 0) != (b < 0) else 1
+    a, b = abs(a), abs(b)
+    if a.bit_length() < b.bit_length():
+        a, b = b, a
+    if (a.bit_length() + b.bit_length()) // 8 > MAX_PUNTI_FFT:
+        # a * b = (alto * 2^k + basso) * b, con due FFT più piccole
+        k = a.bit_length() // 2
+        alto, basso = a >> k, a & ((1 << k) - 1)
+        return segno * ((moltiplica(alto, b) << k) + moltiplica(basso, b))
+    return segno * _moltiplica_fft(a, b)
+
+
+def prodotto_albero(fattori) -> int:
+    """Prodotto con un albero bilanciato: a ogni livello si moltiplicano i fattori a coppie."""
+    fattori = list(fattori)
+    if not fattori:
+        return 1
+    while len(fattori) > 1:
+        coppie = [moltiplica(a, b) for a, b in zip(fattori[0::2], fattori[1::2])]
+        if len(fattori) % 2:
+            coppie.append(fattori[-1])
+        fattori = coppie
+    return fattori[0]
+
+
+def somma_esatta(valori: np.ndarray) -> int:
+    """Somma di un array int64 come intero Python, senza overflow."""
+    if valori.size == 0:
+        return 0
+    limite = max(int(valori.max()), -int(valori.min()))
+    if limite * valori.size <= INT64_MAX:
+        return int(valori.sum())
+    # Si sommano separatamente i 32 bit bassi e quelli alti: nessuna delle due somme può traboccare
+    basso = valori & 0xFFFFFFFF
+    alto = valori >> 32
+    return (int(alto.sum()) << 32) + int(basso.sum())
+
+
+def prodotto_vettoriale(valori: np.ndarray) -> int:
+    """Prodotto di un array int64: le coppie vengono moltiplicate in NumPy finché non rischiano l'overflow."""
+    while valori.size > 1 and max(int(valori.max()), -int(valori.min())) <= LIMITE_COPPIE:
+        if valori.size % 2:
+            valori = np.append(valori, 1)
+        valori = valori[0::2] * valori[1::2]
+    return prodotto_albero(valori.tolist())
+
+
+def leggi_blocchi(file, dimensione: int = DIMENSIONE_BLOCCO):
+    """
+    Legge un file di testo a blocchi, tagliando solo tra un numero e l'altro.
+    I numeri possono essere separati da virgole, punti e virgola o spazi e a capo.
+    Yields:
+        str: Un blocco di numeri separati da spazi
+    """
+    resto = ""
+    while True:
+        testo = file.read(dimensione)
+        if not testo:
+            break
+        testo = resto + testo.translate(SEPARATORI)
+        taglio = max(testo.rfind(" "), testo.rfind("\n"), testo.rfind("\t"), testo.rfind("\r"))
+        if taglio < 0:
+            resto = testo
+            continue
+        yield testo[:taglio]
+        resto = testo[taglio:]
+    if resto.strip():
+        yield resto
+
+
+def analizza_blocco(testo: str):
+    """
+    Converte un blocco di testo in numeri.
+    Returns:
+        np.ndarray | list: Un array int64, oppure una lista di interi Python se un numero non sta in int64
+    """
+    # Al primo valore non valido NumPy si ferma e lo segnala solo con un DeprecationWarning
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            valori = np.fromstring(testo, dtype=np.int64, sep=" ")
+        except (DeprecationWarning, ValueError) as e:
+            raise ValueError("Il testo contiene valori che non sono numeri interi") from e
+    # I numeri fuori da int64 vengono saturati agli estremi: si ricontrolla con gli interi Python
+    if valori.size and (valori.max() == INT64_MAX or valori.min() == INT64_MIN):
+        return [int(t) for t in testo.split()]
+    return valori
+
+
+def aggrega_blocco(valori) -> tuple:
+    """
+    Returns:
+        tuple: (quanti numeri, somma dei pari, prodotto dei dispari, quanti dispari) di un blocco di numeri o di testo
+    """
+    if isinstance(valori, str):
+        valori = analizza_blocco(valori)
+    if isinstance(valori, np.ndarray):
+        pari = (valori & 1) == 0
+        dispari = valori[~pari]
+        return int(valori.size), somma_esatta(valori[pari]), prodotto_vettoriale(dispari), int(dispari.size)
+    dispari = [n for n in valori if n % 2 != 0]
+    # Con valori non interi l'ordine delle moltiplicazioni cambia l'arrotondamento: si resta da sinistra a destra
+    prodotto = prodotto_albero(dispari) if all(type(n) is int for n in dispari) else math.prod(dispari)
+    return len(valori), sum(n for n in valori if n % 2 == 0), prodotto, len(dispari)
+
+
+class AggregatorePariDispari:
+    """
+    Accumula somma dei pari e prodotto dei dispari un blocco alla volta.
+
+    I prodotti dei blocchi vengono combinati come in un contatore binario: due prodotti
+    dello stesso livello (cioè di quanti blocchi) diventano uno del livello successivo,
+    così si moltiplicano sempre numeri di dimensioni simili senza tenere in memoria
+    il prodotto di ogni blocco.
+    """
+
+    def __init__(self):
+        self.somma_pari = 0
+        self.quanti_dispari = 0
+        self.quanti_numeri = 0
+        # Coppie (livello, prodotto) con livelli decrescenti
+        self._prodotti = []
+
+    def aggiungi(self, valori):
+        """Aggiunge un blocco di numeri (array NumPy, lista di interi o testo)."""
+        self.unisci(*aggrega_blocco(valori))
+
+    def unisci(self, quanti: int, somma: int, prodotto: int, dispari: int):
+        """Aggiunge il risultato di aggrega_blocco calcolato altrove (es. in un altro processo)."""
+        self.quanti_numeri += quanti
+        self.somma_pari += somma
+        self.quanti_dispari += dispari
+        if not dispari:
+            return
+        livello = 0
+        while self._prodotti and self._prodotti[-1][0] == livello:
+            _, precedente = self._prodotti.pop()
+            prodotto = moltiplica(prodotto, precedente)
+            livello += 1
+        self._prodotti.append((livello, prodotto))
+
+    @property
+    def prodotto_dispari(self) -> int:
+        """Il prodotto dei dispari, 0 se non ce ne sono (come somma_pari_prodotto_dispari)."""
+        if not self.quanti_dispari:
+            return 0
+        # Dal più piccolo al più grande, per restare bilanciati
+        prodotto = 1
+        for _, parziale in reversed(self._prodotti):
+            prodotto = moltiplica(prodotto, parziale)
+        self._prodotti = [(len(self._prodotti), prodotto)]
+        return prodotto
+
+    def risultato(self) -> tuple:
+        return self.somma_pari, self.prodotto_dispari
+
+
+def aggrega_file(file, dimensione_blocco: int = DIMENSIONE_BLOCCO, processi: int = 0, max_in_attesa: int = None, aggregatore: AggregatorePariDispari = None) -> AggregatorePariDispari:
+    """
+    Aggrega i numeri di un file di testo letto a blocchi, in un nuovo aggregatore
+    o in quello indicato (es. per sommare più file).
+
+    Con processi > 0 i blocchi vengono convertiti e aggregati da un pool di processi
+    e il processo principale combina soltanto i risultati; al più max_in_attesa blocchi
+    sono in lavorazione, così la memoria non cresce con la dimensione dell'input.
+    """
+    aggregatore = aggregatore or AggregatorePariDispari()
+    if not processi:
+        for blocco in leggi_blocchi(file, dimensione_blocco):
+            aggregatore.aggiungi(blocco)
+        return aggregatore
+
+    max_in_attesa = max_in_attesa or 2 * processi
+    with ProcessPoolExecutor(max_workers=processi, mp_context=get_context("spawn")) as pool:
+        in_attesa = deque()
+        for blocco in leggi_blocchi(file, dimensione_blocco):
+            in_attesa.append(pool.submit(aggrega_blocco, blocco))
+            if len(in_attesa) >= max_in_attesa:
+                aggregatore.unisci(*in_attesa.popleft().result())
+        while in_attesa:
+            aggregatore.unisci(*in_attesa.popleft().result())
+    return aggregatore
+
+
+def formatta_intero(n: int, max_cifre: int = 4000) -> str:
+    """
+    Il numero per intero se ha al più max_cifre cifre, altrimenti solo una stima per eccesso
+    delle cifre: convertire in stringa un intero enorme richiede tempo quadratico.
+    """
+    cifre = int(abs(n).bit_length() * 0.30102999566398120) + 1
+    if cifre <= max_cifre:
+        return str(n)
+    return f"un numero {'negativo ' if n < 0 else ''}di circa {cifre} cifre"
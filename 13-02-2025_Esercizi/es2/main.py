@@ -1,15 +1,36 @@
+import argparse
+import sys
+
 import operazioni
+from aggregatore import DIMENSIONE_BLOCCO, AggregatorePariDispari, aggrega_file, formatta_intero
 
 
 def main():
-    numeri = list(
-        map(int, input("Inserisci numeri separati da una virgola: ").split(","))
-    )
-    somma_pari, prodotto_dispari = operazioni.somma_pari_prodotto_dispari(*numeri)
+    parser = argparse.ArgumentParser(description="Somma dei numeri pari e prodotto dei numeri dispari")
+    parser.add_argument("file", nargs="*", help="File con i numeri separati da virgole, spazi o a capo ('-' per stdin); senza file i numeri vengono chiesti")
+    parser.add_argument("--processi", type=int, default=0, help="Processi che elaborano i blocchi dei file (0 = nessun pool)")
+    parser.add_argument("--blocco", type=int, default=DIMENSIONE_BLOCCO, help="Caratteri letti alla volta da un file")
+    args = parser.parse_args()
+
+    if args.file:
+        aggregatore = AggregatorePariDispari()
+        for percorso in args.file:
+            if percorso == "-":
+                aggrega_file(sys.stdin, args.blocco, args.processi, aggregatore=aggregatore)
+                continue
+            with open(percorso, encoding="utf-8") as f:
+                aggrega_file(f, args.blocco, args.processi, aggregatore=aggregatore)
+        print(f"Numeri letti: {aggregatore.quanti_numeri}")
+        somma_pari, prodotto_dispari = aggregatore.risultato()
+    else:
+        numeri = list(
+            map(int, input("Inserisci numeri separati da una virgola: ").split(","))
+        )
+        somma_pari, prodotto_dispari = operazioni.somma_pari_prodotto_dispari(*numeri)
 
     print(f"Somma dei numeri pari: {somma_pari}")
     print(
-        f"Prodotto dei numeri dispari: {prodotto_dispari}"
+        f"Prodotto dei numeri dispari: {formatta_intero(prodotto_dispari)}"
         if (prodotto_dispari != 0)
         else "Non ci sono numeri dispari da moltiplicare"
     )
@@ -1,14 +1,12 @@
-def somma_pari_prodotto_dispari(*numeri):
-    somma_pari = sum(n for n in numeri if n % 2 == 0)
-    prodotto_dispari = 1
-    almeno_un_dispari = False
+import numpy as np
 
-    for n in numeri:
-        if n % 2 != 0:
-            prodotto_dispari *= n
-            almeno_un_dispari = True
+from aggregatore import AggregatorePariDispari
 
-    if not almeno_un_dispari:
-        prodotto_dispari = 0
 
-    return somma_pari, prodotto_dispari
+def somma_pari_prodotto_dispari(*numeri):
+    # Gli interi che stanno in int64 vengono elaborati con NumPy, gli altri valori
+    # (float, interi enormi) restano oggetti Python; il risultato è lo stesso
+    valori = np.array(numeri)
+    aggregatore = AggregatorePariDispari()
+    aggregatore.aggiungi(valori if valori.dtype == np.int64 else list(numeri))
+    return aggregatore.risultato()
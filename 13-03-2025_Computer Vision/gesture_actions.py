@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class GestureRule:
+    """
+    Come un gesto viene tradotto in un'azione.
+    Args:
+        action: Funzione eseguita dal thread del worker quando il gesto scatta
+        description (str): Messaggio stampato quando il gesto scatta
+        min_score (float): Confidenza minima del riconoscitore perché un frame conti
+        hold_frames (int): Frame consecutivi sopra la soglia prima che il gesto scatti
+        repeat_interval (float): Secondi tra due ripetizioni finché il gesto resta attivo, None per scattare una volta sola
+        cooldown (float): Secondi minimi tra due attivazioni distinte
+        coalesce (bool): Se True un'esecuzione ancora in attesa viene sostituita dalla successiva;
+            solo per azioni idempotenti (es. spostamenti assoluti), non per quelle relative come pyautogui.move
+    """
+
+    def __init__(self, action=None, description: str = None, min_score: float = 0.6, hold_frames: int = 3, repeat_interval: float = None, cooldown: float = 0.0, coalesce: bool = False):
+        self.action = action
+        self.description = description
+        self.min_score = min_score
+        self.hold_frames = hold_frames
+        self.repeat_interval = repeat_interval
+        self.cooldown = cooldown
+        self.coalesce = coalesce
+
+
+class ActionWorker:
+    """
+    Esegue le chiamate di input al sistema operativo su un thread dedicato, così non
+    bloccano mai cattura e inferenza. I lavori con la stessa chiave ancora in attesa si
+    sostituiscono a vicenda: ad esempio viene applicata solo l'ultima posizione del puntatore.
+    Il lavoro sostituito passa in fondo alla coda, dopo quelli inviati nel frattempo.
+    """
+
+    def __init__(self):
+        self._jobs = OrderedDict()
+        self._counter = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.coalesced = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, key=None, **kwargs):
+        with self._cond:
+            if key is None:
+                self._counter += 1
+                key = ("job", self._counter)
+            elif key in self._jobs:
+                self.coalesced += 1
+                self._jobs.move_to_end(key)
+            self._jobs[key] = (fn, args, kwargs)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._jobs or self._closed)
+                if not self._jobs:
+                    return
+                _, (fn, args, kwargs) = self._jobs.popitem(last=False)
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                print(f"Azione non riuscita: {e}")
+
+    def close(self, wait: bool = True):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            self._thread.join()
+
+
+class ActionEngine:
+    """
+    Trasforma i gesti riconosciuti frame per frame in azioni filtrate e a frequenza limitata.
+
+    Un gesto diventa attivo dopo hold_frames frame consecutivi sopra la soglia e viene
+    rilasciato dopo release_frames frame senza di esso (isteresi). Scatta una volta
+    all'attivazione e, se la regola ha un repeat_interval, di nuovo con quella cadenza
+    finché resta attivo.
+    """
+
+    def __init__(self, rules: dict, release_frames: int = 2, worker: ActionWorker = None, latency=None):
+        """
+        Args:
+            rules (dict): Nome del gesto -> GestureRule
+            release_frames (int): Frame senza il gesto attivo prima che venga rilasciato
+            worker (ActionWorker): Worker che esegue le azioni, uno nuovo di default
+            latency: LatencyHistogram opzionale con i tempi dalla cattura all'azione
+        """
+        self.rules = rules
+        self.latency = latency
+        self.release_frames = release_frames
+        self.worker = worker or ActionWorker()
+
+        self.active = None
+        self._candidate = None
+        self._candidate_frames = 0
+        self._missing_frames = 0
+        self._last_fired = {}
+        self._last_activation = {}
+        self._mouse_is_down = False
+
+    def update(self, gesture: str, score: float = 1.0, captured_at: float = None, **context):
+        """
+        Riceve il gesto riconosciuto nel frame corrente (None se non c'è una mano).
+        captured_at è l'istante di cattura del frame (perf_counter), usato per
+        l'istogramma delle latenze; gli altri argomenti vengono passati all'azione della regola.
+        Returns:
+            str: Il gesto scattato in questo frame, oppure None
+        """
+        now = time.monotonic()
+        rule = self.rules.get(gesture)
+        confident = rule is not None and score >= rule.min_score
+
+        if confident and gesture == self.active:
+            self._missing_frames = 0
+            if rule.repeat_interval is not None and now - self._last_fired.get(gesture, 0) >= rule.repeat_interval:
+                return self._fire(gesture, rule, now, captured_at, context)
+            return None
+
+        # Isteresi: il gesto attivo sopravvive ad alcuni frame in cui manca
+        if self.active is not None:
+            self._missing_frames += 1
+            if self._missing_frames >= self.release_frames:
+                self.active = None
+
+        if not confident:
+            self._candidate = None
+            self._candidate_frames = 0
+            return None
+
+        if gesture == self._candidate:
+            self._candidate_frames += 1
+        else:
+            self._candidate = gesture
+            self._candidate_frames = 1
+
+        if self._candidate_frames < rule.hold_frames:
+            return None
+        if now - self._last_activation.get(gesture, -rule.cooldown - 1) < rule.cooldown:
+            return None
+
+        self.active = gesture
+        self._missing_frames = 0
+        self._candidate = None
+        self._candidate_frames = 0
+        self._last_activation[gesture] = now
+        return self._fire(gesture, rule, now, captured_at, context)
+
+    def _fire(self, gesture: str, rule: GestureRule, now: float, captured_at: float, context: dict) -> str:
+        self._last_fired[gesture] = now
+        if rule.description:
+            print(rule.description)
+        if rule.action is not None:
+            key = ("gesture", gesture) if rule.coalesce else None
+            self.submit(rule.action, key=key, captured_at=captured_at, **context)
+        return gesture
+
+    def _timed(self, fn, captured_at: float):
+        def run(*args, **kwargs):
+            fn(*args, **kwargs)
+            self.latency.record(time.perf_counter() - captured_at)
+        return run
+
+    def submit(self, fn, *args, key=None, captured_at: float = None, **kwargs):
+        """Esegue un'azione qualsiasi sul thread del worker (stessa chiave = sostituita)."""
+        if self.latency is not None and captured_at is not None:
+            fn = self._timed(fn, captured_at)
+        self.worker.submit(fn, *args, key=key, **kwargs)
+
+    def mouse_down(self, fn, captured_at: float = None):
+        """Accoda la pressione del pulsante solo se non è già premuto, dopo le azioni già in coda."""
+        if not self._mouse_is_down:
+            self._mouse_is_down = True
+            self.submit(fn, captured_at=captured_at)
+
+    def mouse_up(self, fn, captured_at: float = None):
+        """Accoda il rilascio del pulsante solo se è premuto, dopo le azioni già in coda."""
+        if self._mouse_is_down:
+            self._mouse_is_down = False
+            self.submit(fn, captured_at=captured_at)
+
+    @property
+    def mouse_is_down(self) -> bool:
+        return self._mouse_is_down
+
+    def close(self, wait: bool = True):
+        self.worker.close(wait)
@@ -1,80 +1,103 @@
 import cv2
-import math
-import mediapipe as mp
 import pyautogui
 from datetime import datetime as dt
+import argparse
+import os
+import sys
+import time
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.adaptive_scheduler import AdaptiveScheduler
+from common.metrics import LatencyHistogram
+from common.vision_runtime import DELEGATES, VisionRuntime
+from gesture_actions import ActionEngine, GestureRule
+from gesture_stream import MODEL_PATH, GestureStream
 
-def resize(image):
-    DESIRED_HEIGHT = 480
-    DESIRED_WIDTH = 480
-    h, w = image.shape[:2]
-    if h < w:
-        img = cv2.resize(image, (DESIRED_WIDTH, math.floor(h / (w / DESIRED_WIDTH))))
-    else:
-        img = cv2.resize(image, (math.floor(w / (h / DESIRED_HEIGHT)), DESIRED_HEIGHT))
-    # cv2.imshow("frame", img)
-    return img
-
-
-BaseOptions = mp.tasks.BaseOptions
-GestureRecognizer = mp.tasks.vision.GestureRecognizer
-GestureRecognizerOptions = mp.tasks.vision.GestureRecognizerOptions
-VisionRunningMode = mp.tasks.vision.RunningMode
-
-base_options = BaseOptions(
-    model_asset_path="./gesture_recognizer.task", delegate=BaseOptions.Delegate.CPU
-)
-options = GestureRecognizerOptions(
-    base_options=base_options, running_mode=VisionRunningMode.VIDEO, num_hands=1
-)
-recognizer = GestureRecognizer.create_from_options(options)
-cap = cv2.VideoCapture(0)
-timestamp = 0
-
-while True:
-    ret, frame = cap.read()
-    # frame = resize(frame)
-    # Flip the image horizontally for a selfie-view display.
-    cv2.imshow("Frame", cv2.flip(frame, 1))
-
-    # cv2.imshow("frame", frame)
-    if cv2.waitKey(1) & 0xFF == ord("q"):
-        break
-
-    image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
-
-    timestamp += 33
-    recognition_result = recognizer.recognize_for_video(image, timestamp)
-
-    if recognition_result.gestures:
-        segno = recognition_result.gestures[0][0]
-        mano = recognition_result.handedness[0][0]
-
-        print(f"{dt.now()}: {segno.category_name}: {round(segno.score * 100, 2)} - {mano.display_name}: {round(mano.score * 100, 2)}")
-
-        if segno.category_name == "Thumb_Up":
-            print("Moving cursor up")
-            pyautogui.move(0, -5)
-        elif segno.category_name == "Thumb_Down":
-            print("Moving cursor down")
-            pyautogui.move(0, 5)
-        elif segno.category_name == "Victory":
-            print("Moving cursor left")
-            pyautogui.move(-5, 0)
-        elif segno.category_name == "Open_Palm":
-            print("Moving cursor right")
-            pyautogui.move(5, 0)
-        elif segno.category_name == "Closed_Fist":
-            print("Double clicking on the current cursor position")
-            pyautogui.doubleClick(interval=0.25)
-            # pyautogui.click(interval=0.25)
-            # pyautogui.hotkey('command', 'o')
-
-        # multi_hand_landmarks = recognition_result.hand_landmarks[0]
-        # print(multi_hand_landmarks)
-        # print(recognition_result)
-
-recognizer.close()
-cap.release()
-cv2.destroyAllWindows()
+
+# Gesture -> action table. Moves repeat while the gesture is held,
+# the double click fires once per activation.
+CURSOR_RULES = {
+    "Thumb_Up": GestureRule(lambda: pyautogui.move(0, -5), "Moving cursor up", repeat_interval=1 / 30),
+    "Thumb_Down": GestureRule(lambda: pyautogui.move(0, 5), "Moving cursor down", repeat_interval=1 / 30),
+    "Victory": GestureRule(lambda: pyautogui.move(-5, 0), "Moving cursor left", repeat_interval=1 / 30),
+    "Open_Palm": GestureRule(lambda: pyautogui.move(5, 0), "Moving cursor right", repeat_interval=1 / 30),
+    "Closed_Fist": GestureRule(
+        lambda: pyautogui.doubleClick(interval=0.25),
+        "Double clicking on the current cursor position",
+        hold_frames=5,
+        cooldown=1.0,
+    ),
+    # pyautogui.click(interval=0.25)
+    # pyautogui.hotkey('command', 'o')
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Control the mouse cursor with hand gestures")
+    parser.add_argument("--live-stream", action="store_true", help="Run the recognizer in async LIVE_STREAM mode")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--adaptive", action="store_true", help="Adapt inference resolution and frame stride to a latency budget")
+    parser.add_argument("--target-ms", type=float, default=33.0, help="Inference latency budget used with --adaptive")
+    parser.add_argument("--delegate", choices=sorted(DELEGATES), default="cpu", help="Inference delegate")
+    parser.add_argument("--threads", type=int, default=None, help="Threads used by OpenCV")
+    args = parser.parse_args()
+
+    with VisionRuntime(delegate=args.delegate, num_threads=args.threads) as runtime:
+        stream = GestureStream(
+            args.model,
+            live_stream=args.live_stream,
+            num_hands=1,
+            scheduler=AdaptiveScheduler(args.target_ms) if args.adaptive else None,
+            runtime=runtime,
+        )
+        cap = runtime.capture(0)
+        # Latency from frame capture to the cursor action
+        action_latency = LatencyHistogram()
+        engine = ActionEngine(CURSOR_RULES, latency=action_latency)
+        last_log = time.perf_counter()
+
+        while True:
+            ret, frame = cap.read()
+            captured_at = time.perf_counter()
+            if not ret:
+                break
+            # Flip the image horizontally for a selfie-view display.
+            cv2.imshow("Frame", cv2.flip(frame, 1))
+
+            # cv2.imshow("frame", frame)
+            if cv2.waitKey(1) & 0xFF == ord("q"):
+                break
+
+            stream.submit(frame, captured_at)
+            item = stream.poll()
+            if item is None:
+                continue
+            recognition_result, captured_at = item
+
+            if recognition_result.gestures:
+                segno = recognition_result.gestures[0][0]
+                mano = recognition_result.handedness[0][0]
+
+                print(f"{dt.now()}: {segno.category_name}: {round(segno.score * 100, 2)} - {mano.display_name}: {round(mano.score * 100, 2)}")
+
+                engine.update(segno.category_name, segno.score, captured_at=captured_at)
+
+                # multi_hand_landmarks = recognition_result.hand_landmarks[0]
+                # print(multi_hand_landmarks)
+                # print(recognition_result)
+            else:
+                engine.update(None)
+
+            if time.perf_counter() - last_log >= 5:
+                last_log = time.perf_counter()
+                print(f"Gesture-to-action latency: {action_latency} (skipped frames: {stream.skipped})")
+
+        engine.close()
+        stream.close()
+        cv2.destroyAllWindows()
+    print(f"Gesture-to-action latency: {action_latency} (skipped frames: {stream.skipped})")
+    print(f"Model load and cold start: {runtime.timings()}")
+
+
+if __name__ == "__main__":
+    main()
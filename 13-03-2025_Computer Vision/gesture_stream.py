@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+import time
+
+import mediapipe as mp
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.adaptive_scheduler import AdaptiveScheduler
+from common.pipeline import LatestQueue
+from common.vision_runtime import VisionRunningMode, VisionRuntime
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gesture_recognizer.task")
+
+
+class GestureStream:
+    """
+    Riconoscimento dei gesti in modalità VIDEO (bloccante) o LIVE_STREAM (asincrona).
+
+    In LIVE_STREAM i frame vengono inviati con recognize_async e i risultati arrivano
+    a una callback, che li passa al ciclo principale tramite una LatestQueue.
+    Mentre un'inferenza è ancora in corso i nuovi frame vengono saltati invece di
+    accodarli, così la latenza non si accumula quando il modello resta indietro.
+
+    Con un AdaptiveScheduler i frame vengono rimpiccioliti o saltati in base al tempo
+    di inferenza misurato; i landmark sono normalizzati, quindi i risultati non vanno
+    riscalati.
+
+    Il recognizer viene da un VisionRuntime (uno privato di default) e viene caricato
+    solo quando arriva il primo frame.
+    """
+
+    def __init__(self, model_path: str = MODEL_PATH, live_stream: bool = False, num_hands: int = 1, max_in_flight: int = 1, stale_after: float = 1.0, scheduler: AdaptiveScheduler = None, runtime: VisionRuntime = None):
+        self.live_stream = live_stream
+        self.scheduler = scheduler
+        self.max_in_flight = max_in_flight
+        # Le richieste senza risposta da più di stale_after secondi non bloccano più i nuovi frame
+        self.stale_after = stale_after
+        self.results = LatestQueue()
+        self.submitted = 0
+        self.skipped = 0
+
+        self._start = time.monotonic()
+        self._last_timestamp = -1
+        self._pending = {}
+        self._lock = threading.Lock()
+
+        self._own_runtime = runtime is None
+        self.runtime = runtime or VisionRuntime()
+        if live_stream:
+            self.recognizer = self.runtime.task(
+                "gesture_recognizer",
+                model_path,
+                running_mode=VisionRunningMode.LIVE_STREAM,
+                num_hands=num_hands,
+                result_callback=self._on_result,
+            )
+        else:
+            self.recognizer = self.runtime.task(
+                "gesture_recognizer", model_path, running_mode=VisionRunningMode.VIDEO, num_hands=num_hands
+            )
+
+    def _next_timestamp(self) -> int:
+        # Timestamp reale del frame, strettamente crescente come richiede MediaPipe
+        timestamp = max(int((time.monotonic() - self._start) * 1000), self._last_timestamp + 1)
+        self._last_timestamp = timestamp
+        return timestamp
+
+    def submit(self, frame, captured_at: float) -> bool:
+        """
+        Invia un frame al recognizer.
+        Returns:
+            bool: False se il frame è stato saltato, perché un'inferenza è ancora in
+            corso o lo scheduler ha scelto di riusare l'ultimo risultato
+        """
+        with self._lock:
+            stale = [ts for ts, (t, _) in self._pending.items() if captured_at - t > self.stale_after]
+            for ts in stale:
+                del self._pending[ts]
+            if self.live_stream and len(self._pending) >= self.max_in_flight:
+                self.skipped += 1
+                return False
+        scale = self.scheduler.plan(frame) if self.scheduler is not None else 1.0
+        if scale is None:
+            return False
+        with self._lock:
+            timestamp = self._next_timestamp()
+            self._pending[timestamp] = (captured_at, time.perf_counter())
+        self.submitted += 1
+
+        image = mp.Image(image_format=mp.ImageFormat.SRGB, data=AdaptiveScheduler.resize(frame, scale))
+        if self.live_stream:
+            self.recognizer.recognize_async(image, timestamp)
+        else:
+            self._on_result(self.recognizer.recognize_for_video(image, timestamp), image, timestamp)
+        return True
+
+    def _on_result(self, result, output_image, timestamp_ms: int):
+        self.recognizer.mark_result()
+        with self._lock:
+            captured_at, submitted_at = self._pending.pop(timestamp_ms, (None, None))
+        if self.scheduler is not None and submitted_at is not None:
+            self.scheduler.observe(time.perf_counter() - submitted_at)
+        self.results.put((result, captured_at))
+
+    def poll(self):
+        """L'ultimo risultato non ancora letto come (risultato, istante di cattura), oppure None."""
+        return self.results.get(timeout=0)
+
+    def close(self):
+        """Restituisce il recognizer al runtime, che lo chiude alla propria chiusura, e chiude il runtime se è privato."""
+        self.recognizer.close()
+        self.results.close()
+        if self._own_runtime:
+            self.runtime.close()
@@ -1,141 +1,189 @@
 import cv2
-import math
-import mediapipe as mp
 import pyautogui
 from datetime import datetime as dt
+import argparse
+from functools import partial
+import os
+import sys
 import time
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.adaptive_scheduler import AdaptiveScheduler
+from common.metrics import LatencyHistogram
+from common.vision_runtime import DELEGATES, VisionRuntime
+from gesture_actions import ActionEngine, GestureRule
+from gesture_stream import MODEL_PATH, GestureStream
+from pointer_tracker import PointerTracker
+
 # Disable pyautogui fail-safe
 pyautogui.FAILSAFE = False
 
-def resize(image):
-    DESIRED_HEIGHT = 480
-    DESIRED_WIDTH = 480
-    h, w = image.shape[:2]
-    if h < w:
-        img = cv2.resize(image, (DESIRED_WIDTH, math.floor(h / (w / DESIRED_WIDTH))))
-    else:
-        img = cv2.resize(image, (math.floor(w / (h / DESIRED_HEIGHT)), DESIRED_HEIGHT))
-    return img
-
-def press_mouse_down():
-    x, y = pyautogui.position()
+def start_stroke(tracker, x, y, t):
+    # Runs as one job on the action worker: the pointer reaches the start point before
+    # the button goes down, and the tracker only moves it once the button is down
+    pyautogui.moveTo(x, y)
     pyautogui.mouseDown(x=x, y=y)
+    tracker.begin(x, y, t)
 
-def release_mouse():
+def end_stroke(tracker):
+    # Queued after start_stroke, so the tracker stops before the button is released
+    tracker.end()
     pyautogui.mouseUp()
 
-# Initialize MediaPipe
-BaseOptions = mp.tasks.BaseOptions
-GestureRecognizer = mp.tasks.vision.GestureRecognizer
-GestureRecognizerOptions = mp.tasks.vision.GestureRecognizerOptions
-VisionRunningMode = mp.tasks.vision.RunningMode
-
-base_options = BaseOptions(
-    model_asset_path="./gesture_recognizer.task", delegate=BaseOptions.Delegate.CPU
-)
-options = GestureRecognizerOptions(
-    base_options=base_options, running_mode=VisionRunningMode.VIDEO, num_hands=1
-)
-recognizer = GestureRecognizer.create_from_options(options)
-
-cap = cv2.VideoCapture(0)
-ret, frame = cap.read()
-cv2.imshow("Gesture Controller", cv2.flip(frame, 1))
-cv2.waitKey(1)
-
-try:
-    pyautogui.hotkey('command', 'space')
-    time.sleep(0.5)
-    pyautogui.write('arc')
-    time.sleep(0.5)
-    pyautogui.press('enter')
-    time.sleep(2)
-    pyautogui.hotkey('fn', 'control', 'f')
-    time.sleep(0.5)
-except Exception as e:
-    print(f"Error opening Arc: {e}")
-
-try:
-    # pyautogui.hotkey('alt', 'tab')
-    time.sleep(0.5)
-except Exception as e:
-    print(f"Error focusing camera window: {e}")
-
-screen_width, screen_height = pyautogui.size()
-
-is_drawing = False
-previous_x, previous_y = 0, 0
-draw_counter = 0
-
-timestamp = 0
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        print("Failed to capture image")
-        break
-
-    frame = cv2.flip(frame, 1)
-    image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
-
-    timestamp += 33
-    recognition_result = recognizer.recognize_for_video(image, timestamp)
-    h, w = frame.shape[:2]
-
-    if is_drawing:
-        cv2.circle(frame, (30, 30), 15, (0, 255, 0), -1)
-    else:
-        cv2.circle(frame, (30, 30), 15, (0, 0, 255), -1)
-
-    if recognition_result.gestures and recognition_result.hand_landmarks:
-        gesture = recognition_result.gestures[0][0]
-        hand = recognition_result.handedness[0][0]
-        landmarks = recognition_result.hand_landmarks[0]
-
-        index_finger_tip = landmarks[8]
-        x_pos = int(index_finger_tip.x * w)
-        y_pos = int(index_finger_tip.y * h)
-
-        screen_x = int(index_finger_tip.x * screen_width)
-        screen_y = int(index_finger_tip.y * screen_height)
-
-        cv2.circle(frame, (x_pos, y_pos), 10, (255, 0, 0), -1)
-
-        print(f"{dt.now()}: {gesture.category_name}: {round(gesture.score * 100, 2)} - {hand.display_name}: {round(hand.score * 100, 2)}")
-
-        if gesture.category_name == "Pointing_Up" and not is_drawing:
-            is_drawing = True
-            pyautogui.moveTo(screen_x, screen_y)
-            press_mouse_down()
-            previous_x, previous_y = screen_x, screen_y
-
-        elif gesture.category_name == "Closed_Fist" and is_drawing:
-            is_drawing = False
-            release_mouse()
-
-        elif gesture.category_name == "ILoveYou":
-            print("ILoveYou gesture detected - Exiting program")
+def move_pointer(x, y):
+    # No pyautogui pause: the tracker drives the pointer at its own fixed rate
+    pyautogui.moveTo(x, y, _pause=False)
+
+def open_arc():
+    try:
+        pyautogui.hotkey('command', 'space')
+        time.sleep(0.5)
+        pyautogui.write('arc')
+        time.sleep(0.5)
+        pyautogui.press('enter')
+        time.sleep(2)
+        pyautogui.hotkey('fn', 'control', 'f')
+        time.sleep(0.5)
+    except Exception as e:
+        print(f"Error opening Arc: {e}")
+
+    try:
+        # pyautogui.hotkey('alt', 'tab')
+        time.sleep(0.5)
+    except Exception as e:
+        print(f"Error focusing camera window: {e}")
+
+
+# Drawing gestures: state changes are debounced, the actions themselves
+# (mouse down/up) go through the engine, pointer moves through the tracker
+PAINT_RULES = {
+    "Pointing_Up": GestureRule(min_score=0.5, hold_frames=2),
+    "Closed_Fist": GestureRule(min_score=0.5, hold_frames=2),
+    "ILoveYou": GestureRule(min_score=0.6, hold_frames=5),
+}
+
+
+def log_latency(action_latency, stream):
+    print(f"Gesture-to-action latency: {action_latency} (skipped frames: {stream.skipped})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paint with hand gestures")
+    parser.add_argument("--live-stream", action="store_true", help="Run the recognizer in async LIVE_STREAM mode")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--adaptive", action="store_true", help="Adapt inference resolution and frame stride to a latency budget")
+    parser.add_argument("--target-ms", type=float, default=33.0, help="Inference latency budget used with --adaptive")
+    parser.add_argument("--delegate", choices=sorted(DELEGATES), default="cpu", help="Inference delegate")
+    parser.add_argument("--threads", type=int, default=None, help="Threads used by OpenCV")
+    parser.add_argument("--pointer-hz", type=float, default=120.0, help="Pointer updates per second while drawing")
+    args = parser.parse_args()
+
+    with VisionRuntime(delegate=args.delegate, num_threads=args.threads) as runtime:
+        # Initialize MediaPipe
+        stream = GestureStream(
+            args.model,
+            live_stream=args.live_stream,
+            num_hands=1,
+            scheduler=AdaptiveScheduler(args.target_ms) if args.adaptive else None,
+            runtime=runtime,
+        )
+
+        cap = runtime.capture(0)
+        ret, frame = cap.read()
+        cv2.imshow("Gesture Controller", cv2.flip(frame, 1))
+        cv2.waitKey(1)
+
+        open_arc()
+
+        screen_width, screen_height = pyautogui.size()
+
+        is_drawing = False
+        draw_counter = 0
+
+        # Filters the fingertip and moves the pointer between inference results
+        tracker = PointerTracker(move_pointer, rate_hz=args.pointer_hz)
+        tracker.start()
+
+        # Latency from frame capture to the mouse action
+        action_latency = LatencyHistogram()
+        engine = ActionEngine(PAINT_RULES, latency=action_latency)
+        last_log = time.perf_counter()
+
+        while True:
+            ret, frame = cap.read()
+            captured_at = time.perf_counter()
+            if not ret:
+                print("Failed to capture image")
+                break
+
+            frame = cv2.flip(frame, 1)
+            stream.submit(frame, captured_at)
+            h, w = frame.shape[:2]
+
             if is_drawing:
-                release_mouse()
-            break
+                cv2.circle(frame, (30, 30), 15, (0, 255, 0), -1)
+            else:
+                cv2.circle(frame, (30, 30), 15, (0, 0, 255), -1)
+
+            item = stream.poll()
+            recognition_result, result_captured_at = item if item is not None else (None, None)
+
+            if recognition_result is not None and recognition_result.gestures and recognition_result.hand_landmarks:
+                gesture = recognition_result.gestures[0][0]
+                hand = recognition_result.handedness[0][0]
+                landmarks = recognition_result.hand_landmarks[0]
+
+                index_finger_tip = landmarks[8]
+                x_pos = int(index_finger_tip.x * w)
+                y_pos = int(index_finger_tip.y * h)
+
+                screen_x = int(index_finger_tip.x * screen_width)
+                screen_y = int(index_finger_tip.y * screen_height)
+
+                cv2.circle(frame, (x_pos, y_pos), 10, (255, 0, 0), -1)
+
+                print(f"{dt.now()}: {gesture.category_name}: {round(gesture.score * 100, 2)} - {hand.display_name}: {round(hand.score * 100, 2)}")
+
+                fired = engine.update(gesture.category_name, gesture.score, captured_at=result_captured_at)
+
+                if fired == "Pointing_Up" and not is_drawing:
+                    is_drawing = True
+                    engine.mouse_down(partial(start_stroke, tracker, screen_x, screen_y, result_captured_at), captured_at=result_captured_at)
+
+                elif fired == "Closed_Fist" and is_drawing:
+                    is_drawing = False
+                    engine.mouse_up(partial(end_stroke, tracker))
+
+                elif fired == "ILoveYou":
+                    print("ILoveYou gesture detected - Exiting program")
+                    engine.mouse_up(partial(end_stroke, tracker))
+                    break
+
+                if is_drawing:
+                    # The tracker thread moves the pointer once the stroke has started, the button stays down
+                    tracker.update(screen_x, screen_y, result_captured_at)
+                    draw_counter += 1
+            elif recognition_result is not None:
+                engine.update(None)
 
-        if is_drawing:
-            smooth_x = (screen_x + previous_x) // 2
-            smooth_y = (screen_y + previous_y) // 2
+            cv2.imshow("Gesture Controller", frame)
 
-            pyautogui.moveTo(smooth_x, smooth_y)
-            press_mouse_down()
+            if time.perf_counter() - last_log >= 5:
+                last_log = time.perf_counter()
+                log_latency(action_latency, stream)
 
-            draw_counter += 1
-            previous_x, previous_y = smooth_x, smooth_y
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                engine.mouse_up(partial(end_stroke, tracker))
+                break
 
-    cv2.imshow("Gesture Controller", frame)
+        tracker.stop()
+        # Waits for the pending actions (e.g. the final mouse up)
+        engine.close()
+        stream.close()
+        cv2.destroyAllWindows()
+    log_latency(action_latency, stream)
+    print(f"Model load and cold start: {runtime.timings()}")
 
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        if is_drawing:
-            release_mouse()
-        break
 
-recognizer.close()
-cap.release()
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import math
+import threading
+import time
+
+
+class OneEuroFilter:
+    """
+    Filtro One Euro (Casiez et al., 2012): un passa-basso adattivo la cui frequenza di
+    taglio cresce con la velocità, così i movimenti lenti vengono smussati e quelli
+    veloci restano poco in ritardo. Tiene anche la derivata filtrata, usata qui come velocità.
+    """
+
+    def __init__(self, min_cutoff: float = 1.0, beta: float = 0.01, d_cutoff: float = 1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.value = None
+        self.velocity = 0.0
+        self._t = None
+
+    @staticmethod
+    def _alpha(cutoff: float, dt: float) -> float:
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def reset(self, value: float = None, t: float = None):
+        self.value = value
+        self.velocity = 0.0
+        self._t = t
+
+    def __call__(self, value: float, t: float) -> float:
+        if self.value is None or self._t is None or t <= self._t:
+            self.value = value
+            self._t = t
+            return value
+        dt = t - self._t
+        self._t = t
+        raw_velocity = (value - self.value) / dt
+        a_d = self._alpha(self.d_cutoff, dt)
+        self.velocity += a_d * (raw_velocity - self.velocity)
+        cutoff = self.min_cutoff + self.beta * abs(self.velocity)
+        self.value += self._alpha(cutoff, dt) * (value - self.value)
+        return self.value
+
+
+class PointerTracker:
+    """
+    Smussa la posizione della punta del dito e muove il puntatore a frequenza fissa.
+
+    Ogni risultato dell'inferenza passa per un filtro One Euro per asse (update()).
+    Un thread dedicato sposta poi il puntatore rate_hz volte al secondo sulla posizione
+    filtrata, estrapolata a velocità costante: i tratti restano fitti e compensano il
+    ritardo dell'inferenza anche quando i risultati arrivano lentamente.
+    """
+
+    def __init__(self, move_fn, rate_hz: float = 120.0, min_cutoff: float = 1.0, beta: float = 0.01, max_prediction: float = 0.1):
+        """
+        Args:
+            move_fn: Funzione (x, y) che sposta il puntatore, chiamata dal thread del tracker
+            rate_hz (float): Spostamenti del puntatore al secondo
+            min_cutoff (float): Frequenza di taglio minima del One Euro (Hz), più bassa = più stabile da fermo
+            beta (float): Coefficiente di velocità del One Euro, più alto = meno ritardo nei movimenti veloci
+            max_prediction (float): Secondi massimi di estrapolazione oltre l'ultimo risultato
+        """
+        self.move_fn = move_fn
+        self.interval = 1.0 / rate_hz
+        self.max_prediction = max_prediction
+        self._filters = (OneEuroFilter(min_cutoff, beta), OneEuroFilter(min_cutoff, beta))
+        self._state = None
+        self._tracking = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.emitted = 0
+
+    def update(self, x: float, y: float, t: float = None):
+        """Riceve una nuova posizione misurata; t è il suo istante di cattura (perf_counter)."""
+        t = time.perf_counter() if t is None else t
+        fx, fy = self._filters
+        sx, sy = fx(x, t), fy(y, t)
+        with self._lock:
+            self._state = (sx, sy, fx.velocity, fy.velocity, t)
+
+    def predict(self, now: float = None):
+        """La posizione (x, y) estrapolata all'istante now, oppure None prima del primo update."""
+        with self._lock:
+            state = self._state
+        if state is None:
+            return None
+        x, y, vx, vy, t = state
+        now = time.perf_counter() if now is None else now
+        ahead = min(max(now - t, 0.0), self.max_prediction)
+        return x + vx * ahead, y + vy * ahead
+
+    def begin(self, x: float, y: float, t: float = None):
+        """Inizia a muovere il puntatore a partire dalla posizione indicata."""
+        t = time.perf_counter() if t is None else t
+        for f, value in zip(self._filters, (x, y)):
+            f.reset(value, t)
+        with self._lock:
+            self._state = (x, y, 0.0, 0.0, t)
+            self._tracking = True
+
+    def end(self):
+        """Smette di muovere il puntatore (es. alla fine del tratto)."""
+        with self._lock:
+            self._tracking = False
+            self._state = None
+
+    def _run(self):
+        last = None
+        next_tick = time.perf_counter()
+        while not self._stop.is_set():
+            with self._lock:
+                tracking = self._tracking
+            position = self.predict() if tracking else None
+            if position is not None:
+                target = (int(round(position[0])), int(round(position[1])))
+                if target != last:
+                    self.move_fn(*target)
+                    self.emitted += 1
+                    last = target
+            else:
+                last = None
+            next_tick += self.interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,281 @@
+"""
+Riconoscimento dei visi in batch su video e cartelle di immagini archiviati.
+
+I file vengono divisi in blocchi (intervalli di frame per i video, gruppi di file
+per le cartelle) ed elaborati da un pool di processi. Ogni blocco di un video ha un
+FaceDetector in modalità VIDEO tutto suo, così il tracciamento non passa da un video
+all'altro; le immagini usano un detector in modalità IMAGE per processo. Ogni blocco
+produce un file .npz a colonne con una riga per volto: frame, bbox (x, y, larghezza,
+altezza), score e keypoints normalizzati. Un blocco che fallisce compare nel manifest
+con il suo errore, senza fermare gli altri.
+
+Esempio:
+    python batch_detection.py video1.mp4 cartella_foto/ --out rilevamenti --workers 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.vision_runtime import DELEGATES, VisionRuntime
+
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".webm"}
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp"}
+
+# Stato di ogni processo del pool: il detector per le immagini, creato alla prima necessità
+_worker = {}
+
+
+def _init_worker(model_path: str, delegate: str):
+    # Un thread OpenCV per processo: il parallelismo arriva dal pool
+    _worker["runtime"] = VisionRuntime(delegate=delegate, num_threads=1)
+    _worker["model_path"] = model_path
+    _worker["image_detector"] = None
+
+
+def _create_detector(mode):
+    from face_recognition import create_detector
+
+    return create_detector(_worker["runtime"], _worker["model_path"], running_mode=mode)
+
+
+def _seek(path: str, start: int):
+    """
+    Apre il video posizionato sul frame start. CAP_PROP_POS_FRAMES salta al keyframe
+    più vicino con alcuni codec: se la posizione letta non coincide si riparte
+    dall'inizio e si scartano i frame uno a uno.
+    Returns:
+        tuple: (cv2.VideoCapture, True se la posizione è stata raggiunta leggendo in sequenza)
+    """
+    cap = cv2.VideoCapture(path)
+    if start == 0:
+        return cap, False
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == start:
+        return cap, False
+    cap.release()
+    cap = cv2.VideoCapture(path)
+    for _ in range(start):
+        if not cap.grab():
+            break
+    return cap, True
+
+
+class DetectionColumns:
+    """Accumula i rilevamenti di un blocco in colonne pronte per np.savez."""
+
+    def __init__(self):
+        self.frames = []
+        self.bboxes = []
+        self.scores = []
+        self.keypoints = []
+        self.processed = []
+
+    def add(self, frame_index: int, detection_result):
+        self.processed.append(frame_index)
+        for detection in detection_result.detections:
+            box = detection.bounding_box
+            self.frames.append(frame_index)
+            self.bboxes.append((box.origin_x, box.origin_y, box.width, box.height))
+            self.scores.append(detection.categories[0].score)
+            self.keypoints.append([(k.x, k.y) for k in detection.keypoints])
+
+    def save(self, path: str, source: str, start: int, end: int):
+        n_keypoints = max((len(k) for k in self.keypoints), default=0)
+        keypoints = np.full((len(self.keypoints), n_keypoints, 2), np.nan, dtype=np.float32)
+        for row, points in enumerate(self.keypoints):
+            if points:
+                keypoints[row, : len(points)] = points
+        np.savez_compressed(
+            path,
+            source=np.array(source),
+            range=np.array([start, end], dtype=np.int64),
+            processed=np.asarray(self.processed, dtype=np.int32),
+            frame=np.asarray(self.frames, dtype=np.int32),
+            bbox=np.asarray(self.bboxes, dtype=np.int32).reshape(-1, 4),
+            score=np.asarray(self.scores, dtype=np.float32),
+            keypoints=keypoints,
+        )
+
+
+def _process_video_shard(path: str, start: int, end: int, out_path: str, annotate: bool) -> dict:
+    from face_recognition import VisionRunningMode, visualize
+
+    detector = _create_detector(VisionRunningMode.VIDEO)
+    cap, sequential = _seek(path, start)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    step_ms = max(1, int(1000 / fps))
+    columns = DetectionColumns()
+    writer = None
+    frame_index = start
+    try:
+        while frame_index < end:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
+            detection_result = detector.detect_for_video(image, (frame_index - start) * step_ms)
+            columns.add(frame_index, detection_result)
+            if annotate:
+                if writer is None:
+                    h, w = frame.shape[:2]
+                    writer = cv2.VideoWriter(out_path[:-4] + ".mp4", cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+                writer.write(visualize(frame, detection_result, out=frame))
+            frame_index += 1
+    finally:
+        cap.release()
+        detector.close()
+        if writer is not None:
+            writer.release()
+    columns.save(out_path, path, start, frame_index)
+    return {"source": path, "start": start, "end": frame_index, "frames": len(columns.processed),
+            "detections": len(columns.frames), "output": out_path, "sequential_seek": sequential}
+
+
+def _process_image_shard(files: list, root: str, start: int, out_path: str, annotate_dir: str, annotate: bool) -> dict:
+    from face_recognition import VisionRunningMode, visualize
+
+    if _worker["image_detector"] is None:
+        _worker["image_detector"] = _create_detector(VisionRunningMode.IMAGE)
+    detector = _worker["image_detector"]
+    columns = DetectionColumns()
+    errors = []
+    for offset, file_path in enumerate(files):
+        try:
+            frame = cv2.imread(file_path)
+            if frame is None:
+                raise ValueError("immagine non leggibile")
+            image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
+            detection_result = detector.detect(image)
+            columns.add(start + offset, detection_result)
+            if annotate:
+                # Stesso percorso relativo della cartella di partenza: nessun nome in comune tra cartelle
+                annotated_path = os.path.join(annotate_dir, os.path.relpath(file_path, root))
+                os.makedirs(os.path.dirname(annotated_path), exist_ok=True)
+                cv2.imwrite(annotated_path, visualize(frame, detection_result, out=frame))
+        except Exception as e:
+            errors.append({"file": file_path, "error": f"{type(e).__name__}: {e}"})
+    columns.save(out_path, root, start, start + len(files))
+    return {"source": root, "start": start, "end": start + len(files), "frames": len(columns.processed),
+            "detections": len(columns.frames), "output": out_path, "files": files, "errors": errors}
+
+
+def plan_shards(inputs: list, out_dir: str, shard_frames: int, shard_images: int) -> list:
+    """
+    Divide gli input in blocchi indipendenti.
+    Returns:
+        list: Tuple (funzione, argomenti, riepilogo usato se il blocco fallisce)
+    """
+    shards = []
+    stems = set()
+
+    def unique_stem(stem: str) -> str:
+        # Due input con lo stesso nome (es. foto/ in cartelle diverse) non si sovrascrivono
+        name, n = stem, 1
+        while name in stems:
+            n += 1
+            name = f"{stem}_{n}"
+        stems.add(name)
+        return name
+
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            files = sorted(
+                os.path.join(input_path, name)
+                for name in os.listdir(input_path)
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+            )
+            stem = unique_stem(os.path.basename(os.path.normpath(input_path)))
+            annotate_dir = os.path.join(out_dir, f"{stem}_annotate")
+            for start in range(0, len(files), shard_images):
+                out_path = os.path.join(out_dir, f"{stem}_{start:08d}.npz")
+                chunk = files[start:start + shard_images]
+                summary = {"source": input_path, "start": start, "end": start + len(chunk), "output": out_path, "files": chunk}
+                shards.append((_process_image_shard, (chunk, input_path, start, out_path, annotate_dir), summary))
+        elif os.path.splitext(input_path)[1].lower() in VIDEO_EXTENSIONS:
+            cap = cv2.VideoCapture(input_path)
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.release()
+            stem = unique_stem(os.path.splitext(os.path.basename(input_path))[0])
+            # Se il numero di frame non è noto il video diventa un unico blocco
+            ranges = [(start, start + shard_frames) for start in range(0, total, shard_frames)] if total > 0 else [(0, sys.maxsize)]
+            for start, end in ranges:
+                out_path = os.path.join(out_dir, f"{stem}_{start:08d}.npz")
+                summary = {"source": input_path, "start": start, "end": end, "output": out_path}
+                shards.append((_process_video_shard, (input_path, start, end, out_path), summary))
+        else:
+            print(f"Ignorato (formato non supportato): {input_path}")
+    return shards
+
+
+def detect_batch(inputs: list, out_dir: str, workers: int = None, shard_frames: int = 500,
+                 shard_images: int = 200, annotate: bool = False, model_path: str = None,
+                 delegate: str = "cpu") -> list:
+    """
+    Elabora video e cartelle di immagini con un pool di processi.
+    Returns:
+        list: Un riepilogo per ogni blocco, nell'ordine degli input; quelli falliti hanno la chiave "error"
+    """
+    from face_recognition import MODEL_PATH
+
+    os.makedirs(out_dir, exist_ok=True)
+    shards = plan_shards(inputs, out_dir, shard_frames, shard_images)
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        mp_context=get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(model_path or MODEL_PATH, delegate),
+    ) as pool:
+        futures = [pool.submit(func, *args, annotate) for func, args, _ in shards]
+        for future, (_, _, summary) in zip(futures, shards):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {**summary, "frames": 0, "detections": 0, "error": f"{type(e).__name__}: {e}"}
+                print(f"{result['output']}: non riuscito ({result['error']})")
+            else:
+                print(f"{result['output']}: {result['frames']} frame, {result['detections']} visi")
+                for error in result.get("errors", []):
+                    print(f"  {error['file']}: {error['error']}")
+            results.append(result)
+
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(results, f, indent=2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Riconoscimento dei visi in batch su video e cartelle di immagini")
+    parser.add_argument("inputs", nargs="+", help="File video o cartelle di immagini")
+    parser.add_argument("--out", default="rilevamenti", help="Cartella dei file .npz prodotti")
+    parser.add_argument("--workers", type=int, default=None, help="Processi nel pool (default: numero di core)")
+    parser.add_argument("--shard-frames", type=int, default=500, help="Frame per blocco nei video")
+    parser.add_argument("--shard-images", type=int, default=200, help="Immagini per blocco nelle cartelle")
+    parser.add_argument("--annotate", action="store_true", help="Salva anche i frame annotati")
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--delegate", choices=sorted(DELEGATES), default="cpu", help="Delegate dell'inferenza")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = detect_batch(args.inputs, args.out, args.workers, args.shard_frames, args.shard_images,
+                           args.annotate, args.model, args.delegate)
+    elapsed = time.perf_counter() - start
+    frames = sum(r["frames"] for r in results)
+    print(f"\n{frames} frame in {elapsed:.1f}s ({frames / elapsed:.1f} frame/s)")
+    failed = sum("error" in r for r in results) + sum(len(r.get("errors", [])) for r in results)
+    if failed:
+        print(f"{failed} errori, dettagli in {os.path.join(args.out, 'manifest.json')}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
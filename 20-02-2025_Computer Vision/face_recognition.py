@@ -1,9 +1,21 @@
-from typing import Union, Tuple
+from typing import Tuple
 import cv2
 import mediapipe as mp
 import numpy as np
-import math
 import datetime
+import argparse
+import dataclasses
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.adaptive_scheduler import AdaptiveScheduler
+from common.metrics import RateCounter
+from common.pipeline import LatestQueue, StageStats
+from common.vision_runtime import DELEGATES, VisionRunningMode, VisionRuntime
 
 
 MARGIN = 10  # pixels
@@ -13,39 +25,67 @@ FONT_THICKNESS = 1
 TEXT_COLOR = (255, 0, 0)  # red
 
 
-def _normalized_to_pixel_coordinates(
-    normalized_x: float, normalized_y: float, image_width: int, image_height: int
-) -> Union[None, Tuple[int, int]]:
-    """Converts normalized value pair to pixel coordinates."""
+KEYPOINT_COLOR = (0, 255, 0)  # green
+KEYPOINT_RADIUS = 3  # pixels
+
+
+def _disk_offsets(radius: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the (dy, dx) offsets of all pixels inside a disk of the given radius."""
+    dy, dx = np.mgrid[-radius : radius + 1, -radius : radius + 1]
+    inside = dx * dx + dy * dy <= radius * radius
+    return dy[inside], dx[inside]
+
+
+_KEYPOINT_DY, _KEYPOINT_DX = _disk_offsets(KEYPOINT_RADIUS)
+
+
+def keypoints_to_pixels(detections, image_width: int, image_height: int) -> np.ndarray:
+    """Converts the normalized keypoints of all detections to pixel coordinates at once.
+    Keypoints outside [0, 1] (with a small tolerance) are discarded.
+    Returns:
+      An (N, 2) int32 array of (x, y) pixel coordinates.
+    """
+    coords = np.fromiter(
+        (value for detection in detections for keypoint in detection.keypoints for value in (keypoint.x, keypoint.y)),
+        dtype=np.float64,
+    ).reshape(-1, 2)
+    valid = np.all((coords >= -1e-9) & (coords <= 1 + 1e-9), axis=1)
+    coords = coords[valid]
+    size = np.array([image_width, image_height])
+    return np.minimum(np.floor(coords * size), size - 1).astype(np.int32)
 
-    # Checks if the float value is between 0 and 1.
-    def is_valid_normalized_value(value: float) -> bool:
-        return (value > 0 or math.isclose(0, value)) and (
-            value < 1 or math.isclose(1, value)
-        )
 
-    if not (
-        is_valid_normalized_value(normalized_x)
-        and is_valid_normalized_value(normalized_y)
-    ):
-        return None
-    x_px = min(math.floor(normalized_x * image_width), image_width - 1)
-    y_px = min(math.floor(normalized_y * image_height), image_height - 1)
-    return x_px, y_px
+def draw_keypoints(image: np.ndarray, pixels: np.ndarray, color=KEYPOINT_COLOR) -> None:
+    """Draws a filled disk on every keypoint with a single fancy-indexing assignment."""
+    if len(pixels) == 0:
+        return
+    height, width = image.shape[:2]
+    ys = np.clip(pixels[:, 1, None] + _KEYPOINT_DY, 0, height - 1)
+    xs = np.clip(pixels[:, 0, None] + _KEYPOINT_DX, 0, width - 1)
+    image[ys, xs] = color
 
 
-def visualize(image, detection_result) -> np.ndarray:
+def visualize(image, detection_result, out: np.ndarray = None, draw_labels: bool = True) -> np.ndarray:
     """Draws bounding boxes and keypoints on the input image and return it.
     Args:
       image: The input RGB image.
       detection_result: The list of all "Detection" entities to be visualize.
+      out: Where to draw. None draws on a copy of image; passing image itself
+        draws in place; any other array of the same shape is reused as buffer.
+      draw_labels: Whether to draw the category name and score of each detection.
     Returns:
       Image with bounding boxes.
     """
-    annotated_image = image.copy()
-    height, width, _ = image.shape
+    if out is None:
+        annotated_image = image.copy()
+    else:
+        annotated_image = out
+        if out is not image:
+            np.copyto(out, image)
+    height, width = image.shape[:2]
+    detections = detection_result.detections
 
-    for detection in detection_result.detections:
+    for detection in detections:
         # Draw bounding_box
         bounding_box = detection.bounding_box
         start_point = bounding_box.origin_x, bounding_box.origin_y
@@ -55,20 +95,13 @@ def visualize(image, detection_result) -> np.ndarray:
         )
         cv2.rectangle(annotated_image, start_point, end_point, TEXT_COLOR, 3)
 
-        # Draw keypoints
-        for keypoint in detection.keypoints:
-            keypoint_px = _normalized_to_pixel_coordinates(
-                keypoint.x, keypoint.y, width, height
-            )
-            color, thickness, radius = (0, 255, 0), 2, 2
-            cv2.circle(annotated_image, keypoint_px, thickness, color, radius)
+        if not draw_labels:
+            continue
 
         # Draw label and score
         category = detection.categories[0]
-        category_name = category.category_name
-        category_name = "" if category_name is None else category_name
-        probability = round(category.score, 2)
-        result_text = category_name + " (" + str(probability) + ")"
+        category_name = category.category_name or ""
+        result_text = f"{category_name} ({round(category.score, 2)})"
         text_location = (
             MARGIN + bounding_box.origin_x,
             MARGIN + ROW_SIZE + bounding_box.origin_y,
@@ -83,52 +116,232 @@ def visualize(image, detection_result) -> np.ndarray:
             FONT_THICKNESS,
         )
 
+    # Draw keypoints of all detections together
+    draw_keypoints(annotated_image, keypoints_to_pixels(detections, width, height))
+
     return annotated_image
 
 
-# Abbreviazioni dei nomi delle classi
-BaseOptions = mp.tasks.BaseOptions
-FaceDetector = mp.tasks.vision.FaceDetector
-FaceDetectorOptions = mp.tasks.vision.FaceDetectorOptions
-VisionRunningMode = mp.tasks.vision.RunningMode
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "blaze_face_short_range.tflite")
+
+
+def create_detector(runtime: VisionRuntime, model_path: str = MODEL_PATH, running_mode=VisionRunningMode.VIDEO):
+    """Restituisce un FaceDetector (di default in modalità VIDEO), caricato al primo utilizzo."""
+    return runtime.task("face_detector", model_path, running_mode=running_mode)
+
+
+def scale_detections(detection_result, factor: float):
+    """Riporta le bounding box calcolate su un frame ridimensionato alle coordinate del frame originale."""
+    detections = []
+    for detection in detection_result.detections:
+        box = detection.bounding_box
+        scaled_box = dataclasses.replace(
+            box,
+            origin_x=round(box.origin_x * factor),
+            origin_y=round(box.origin_y * factor),
+            width=round(box.width * factor),
+            height=round(box.height * factor),
+        )
+        # I keypoints sono normalizzati e non cambiano con la risoluzione
+        detections.append(dataclasses.replace(detection, bounding_box=scaled_box))
+    return dataclasses.replace(detection_result, detections=detections)
+
+
+class FacePipeline:
+    """
+    Pipeline a tre stadi collegati da code "vince il frame più recente":
+    acquisizione (thread), riconoscimento (thread) e visualizzazione (thread principale,
+    perché cv2.imshow deve girare lì). Se uno stadio è lento i frame vecchi vengono
+    scartati invece di accumularsi.
+    """
+
+    def __init__(self, cap, detector, headless: bool = False, is_file: bool = False, paced: bool = True, scheduler: AdaptiveScheduler = None):
+        self.cap = cap
+        self.detector = detector
+        # Con uno scheduler la risoluzione e i frame analizzati si adattano al tempo di inferenza
+        self.scheduler = scheduler
+        self.headless = headless
+        self.is_file = is_file
+        # Con un file, "paced" legge i frame alla loro velocità reale, come farebbe una webcam
+        self.paced = paced and is_file
+        self.frames = LatestQueue()
+        self.results = LatestQueue()
+        self.stats = StageStats(["capture", "inference", "render"])
+        self.fps = RateCounter()
+        self.stop_event = threading.Event()
+        # Primo errore di uno stadio in background, rilanciato da run()
+        self.error = None
+
+    def capture_loop(self):
+        try:
+            self._capture()
+        except Exception as e:
+            self._fail(e)
+        finally:
+            # Anche dopo un errore lo stadio successivo deve sapere che non arriveranno altri frame
+            self.frames.close()
+
+    def _capture(self):
+        start = time.monotonic()
+        source_fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_interval = 1.0 / source_fps
+        next_frame_at = time.perf_counter()
+        last_timestamp = -1
+
+        while not self.stop_event.is_set():
+            read_start = time.perf_counter()
+            ret, frame = self.cap.read()
+            captured_at = time.perf_counter()
+            if not ret:
+                break
+            self.stats.stages["capture"].record(captured_at - read_start)
+
+            # Timestamp reale del frame: posizione nel file oppure tempo trascorso dall'avvio
+            if self.is_file:
+                timestamp = int(self.cap.get(cv2.CAP_PROP_POS_MSEC))
+            else:
+                timestamp = int((time.monotonic() - start) * 1000)
+            # detect_for_video richiede timestamp strettamente crescenti
+            timestamp = max(timestamp, last_timestamp + 1)
+            last_timestamp = timestamp
+            self.frames.put((frame, timestamp, captured_at))
+
+            if self.paced:
+                next_frame_at += frame_interval
+                delay = next_frame_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
 
-# Crea un oggetto FaceDetector
-base_options = BaseOptions(
-    model_asset_path="blaze_face_short_range.tflite", delegate=BaseOptions.Delegate.CPU
-)
+    def inference_loop(self):
+        try:
+            self._inference()
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self.results.close()
 
-options = FaceDetectorOptions(
-    base_options=base_options, running_mode=VisionRunningMode.VIDEO
-)
+    def _inference(self):
+        last_result = None
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            frame, timestamp, captured_at = item
 
-detector = FaceDetector.create_from_options(options)
-cap = cv2.VideoCapture(0)
-timestamp = 0
+            scale = self.scheduler.plan(frame) if self.scheduler is not None else 1.0
+            if scale is None:
+                # Frame saltato (passo o scena ferma): si riusa l'ultimo risultato
+                self.results.put((frame, last_result, captured_at))
+                continue
 
-while True:
-    ret, frame = cap.read()
+            inference_start = time.perf_counter()
+            with self.stats.time("inference"):
+                image = mp.Image(image_format=mp.ImageFormat.SRGB, data=AdaptiveScheduler.resize(frame, scale))
+                detection_result = self.detector.detect_for_video(image, timestamp)
+                if scale < 1.0:
+                    detection_result = scale_detections(detection_result, 1 / scale)
+            if self.scheduler is not None:
+                self.scheduler.observe(time.perf_counter() - inference_start)
+            last_result = detection_result
+            self.results.put((frame, detection_result, captured_at))
 
-    if cv2.waitKey(1) & 0xFF == ord("q"):
-        break
+    def _fail(self, error: Exception):
+        if self.error is None:
+            self.error = error
+        self.stop_event.set()
 
-    # Carica il frame
-    image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
+    def run(self, log_interval: float = 1.0) -> dict:
+        """
+        Esegue la pipeline fino alla fine del video o alla pressione di 'q'; restituisce le statistiche.
+        Se l'acquisizione o il riconoscimento falliscono, la pipeline si ferma e l'errore viene rilanciato qui.
+        """
+        threads = [
+            threading.Thread(target=self.capture_loop, daemon=True),
+            threading.Thread(target=self.inference_loop, daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
 
-    # Analizza il frame per riconoscere un viso(dopo aver aggiornato il timestamp)
-    timestamp += 33
-    detection_result = detector.detect_for_video(image, timestamp)
+        last_log = time.perf_counter()
+        while True:
+            item = self.results.get(timeout=None if self.headless else 0.01)
+            if item is None:
+                if self.results.closed:
+                    break
+                if cv2.waitKey(1) & 0xFF == ord("q"):
+                    break
+                continue
+
+            frame, detection_result, captured_at = item
+            with self.stats.time("render"):
+                # Il frame appartiene solo a questa pipeline: si disegna direttamente su di esso
+                annotated_image = visualize(frame, detection_result, out=frame)
+                if not self.headless:
+                    cv2.imshow("frame", annotated_image)
+            self.stats.end_to_end.record(time.perf_counter() - captured_at)
+            self.fps.tick()
+
+            # Un log al secondo invece di una print per frame
+            now = time.perf_counter()
+            if now - last_log >= log_interval:
+                last_log = now
+                print(
+                    f"{datetime.datetime.now()}: Rilevati {len(detection_result.detections)} visi - {self.fps.rate:.1f} FPS"
+                )
+
+            if not self.headless and cv2.waitKey(1) & 0xFF == ord("q"):
+                break
+
+        self.stop_event.set()
+        for thread in threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.summary()
+
+    def summary(self) -> dict:
+        summary = self.stats.summary()
+        summary["fps"] = self.fps.rate
+        summary["frames_rendered"] = self.fps.count
+        summary["dropped"] = {"inference": self.frames.dropped, "render": self.results.dropped}
+        if self.scheduler is not None:
+            summary["scheduler"] = self.scheduler.stats()
+        return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Riconoscimento dei visi da webcam o da file video")
+    parser.add_argument("--video", help="File video da analizzare al posto della webcam")
+    parser.add_argument("--headless", action="store_true", help="Non mostra la finestra (per i benchmark)")
+    parser.add_argument("--unpaced", action="store_true", help="Legge il file video il più velocemente possibile")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--stats-json", help="File dove salvare le statistiche finali")
+    parser.add_argument("--adaptive", action="store_true", help="Adatta risoluzione e frame analizzati al budget di latenza")
+    parser.add_argument("--target-ms", type=float, default=33.0, help="Budget di latenza dell'inferenza con --adaptive")
+    parser.add_argument("--delegate", choices=sorted(DELEGATES), default="cpu", help="Delegate dell'inferenza")
+    parser.add_argument("--threads", type=int, default=None, help="Thread usati da OpenCV")
+    args = parser.parse_args()
+
+    with VisionRuntime(delegate=args.delegate, num_threads=args.threads) as runtime:
+        try:
+            pipeline = FacePipeline(
+                runtime.capture(args.video if args.video else 0),
+                create_detector(runtime, args.model),
+                headless=args.headless,
+                is_file=bool(args.video),
+                paced=not args.unpaced,
+                scheduler=AdaptiveScheduler(args.target_ms) if args.adaptive else None,
+            )
+            summary = pipeline.run()
+        finally:
+            cv2.destroyAllWindows()
+        summary["runtime"] = runtime.timings()
 
-    # Crea una copia del frame e visualizzalo annotato con i bounding boxes
-    image_copy = np.copy(image.numpy_view())
-    annotated_image = visualize(image_copy, detection_result)
-    rgb_annotated_image = cv2.cvtColor(annotated_image, cv2.COLOR_BGR2RGB)
-    cv2.imshow("frame", annotated_image)
+    print(json.dumps(summary, indent=2))
+    if args.stats_json:
+        with open(args.stats_json, "w") as f:
+            json.dump(summary, f, indent=2)
 
-    # Se riconoscimento andato a buon fine
-    print(
-        f"{datetime.datetime.now()}: Rilevati {len(detection_result.detections)} visi"
-    )
 
-detector.close()
-cap.release()
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    main()
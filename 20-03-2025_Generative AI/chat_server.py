@@ -0,0 +1,133 @@
+"""
+Server multi-sessione per lo StatefulChatbot.
+
+Protocollo a righe JSON su TCP: il client invia
+    {"session": "abc", "message": "Ciao!"}
+e riceve i token man mano che arrivano
+    {"token": "Ci"} {"token": "ao"} ...
+seguiti da
+    {"done": true, "ttft": 0.41, "total": 2.3}
+Il messaggio "/clear" cancella la cronologia della sessione.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.ollama_client import PooledOllama, RetryPolicy, get_client
+from session_store import SessionStore
+from stateful_chatbot import StatefulChatbot
+
+
+class ChatServer:
+    def __init__(self, store: SessionStore, sweep_interval: float = 30.0):
+        self.store = store
+        self.sweep_interval = sweep_interval
+
+    async def send(self, writer, payload: dict):
+        writer.write((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+        await writer.drain()
+
+    async def handle_message(self, writer, request):
+        if not isinstance(request, dict):
+            await self.send(writer, {"error": "la richiesta deve essere un oggetto JSON"})
+            return
+        session_id = request.get("session")
+        message = request.get("message", "")
+        if not isinstance(session_id, str) or not isinstance(message, str) or not session_id or not message:
+            await self.send(writer, {"error": "servono i campi 'session' e 'message', di tipo stringa"})
+            return
+
+        session = await self.store.get(session_id)
+        # I messaggi della stessa sessione vengono elaborati uno alla volta
+        async with session.lock:
+            chatbot = session.chatbot
+            if message.lower() == "/clear":
+                await self.send(writer, {"token": chatbot.clear_history()})
+                await self.send(writer, {"done": True})
+                return
+            async for token in chatbot.achat_stream(message):
+                await self.send(writer, {"token": token})
+            metrics = chatbot.last_metrics
+            await self.send(writer, {"done": True, "ttft": metrics.time_to_first_token, "total": metrics.total})
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Riga oltre il limite dello StreamReader: viene scartata
+                    await self.send(writer, {"error": "richiesta troppo lunga"})
+                    continue
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    await self.send(writer, {"error": "richiesta JSON non valida"})
+                    continue
+                try:
+                    await self.handle_message(writer, request)
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    # Un errore del messaggio (es. del modello) non chiude la connessione
+                    await self.send(writer, {"error": f"{type(e).__name__}: {e}"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def sweep_forever(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            await self.store.sweep()
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        sweeper = asyncio.create_task(self.sweep_forever())
+        print(f"Server in ascolto su {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            sweeper.cancel()
+            await self.store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server multi-sessione per il chatbot con memoria")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--base-url", default="huge-ape-apparent.ngrok-free.app")
+    parser.add_argument("--model", default="gemma3:4b")
+    parser.add_argument("--max-sessions", type=int, default=1000)
+    parser.add_argument("--idle-timeout", type=float, default=900.0)
+    parser.add_argument("--spill", default=None, help="File SQLite per salvare le sessioni inattive")
+    parser.add_argument("--pool-size", type=int, default=32, help="Connessioni HTTP condivise verso Ollama")
+    parser.add_argument("--reuse-context", action="store_true", help="Invia solo il nuovo messaggio insieme al contesto di Ollama")
+    parser.add_argument("--keep-alive", default="30m", help="Tempo per cui Ollama tiene il modello in memoria")
+    parser.add_argument("--deadline", type=float, default=None, help="Secondi massimi di una risposta, tentativi compresi")
+    parser.add_argument("--attempts", type=int, default=3, help="Tentativi per richiesta in caso di errori di rete o del server")
+    args = parser.parse_args()
+
+    # Un solo client (e quindi un solo pool di connessioni e un solo circuito) per tutte le sessioni
+    client = get_client(args.base_url, pool_size=args.pool_size, deadline=args.deadline, retry=RetryPolicy(attempts=args.attempts))
+    llm = PooledOllama(client=client, model=args.model)
+    store = SessionStore(
+        lambda: StatefulChatbot(llm=llm, reuse_context=args.reuse_context, keep_alive=args.keep_alive),
+        max_sessions=args.max_sessions,
+        idle_timeout=args.idle_timeout,
+        spill_path=args.spill,
+    )
+    try:
+        asyncio.run(ChatServer(store).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nArrivederci!")
+
+
+if __name__ == "__main__":
+    main()
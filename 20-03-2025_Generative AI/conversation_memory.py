@@ -0,0 +1,164 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima approssimativa dei token (circa 4 caratteri per token), sufficiente per il budget."""
+    return len(text) // 4 + 1
+
+
+class ConversationMemory:
+    """
+    Memoria della conversazione con un budget di token.
+    La cronologia formattata viene aggiornata a ogni messaggio invece di essere
+    ricostruita da capo; quando il budget viene superato i turni più vecchi
+    vengono rimossi e, se è presente un summarizer, riassunti in background.
+    Il riassunto conta nel budget: quando cresce, al messaggio successivo si
+    rimuovono più turni.
+    """
+
+    def __init__(self, token_budget: int = 1500, token_counter=estimate_tokens, summarizer=None, eviction_target: float = 1.0):
+        """
+        Args:
+            token_budget (int): Numero massimo di token della cronologia
+            token_counter: Funzione che conta i token di un testo
+            summarizer: Funzione (riassunto_precedente, testo_rimosso) -> nuovo riassunto
+            eviction_target (float): Frazione del budget a cui si scende quando viene superato;
+                sotto 1.0 si rimuovono più turni insieme e la cronologia cambia più di rado
+        """
+        self.token_budget = token_budget
+        self.eviction_target = eviction_target
+        self.token_counter = token_counter
+        self.summarizer = summarizer
+        self.summary = ""
+        self._summary_tokens = 0
+
+        # Ogni turno è una tupla (mittente, messaggio, riga formattata, token)
+        self._turns = deque()
+        self._rendered = ""
+        self._tokens = 0
+        # Incrementata quando la cronologia cambia in modo diverso da un'aggiunta in coda
+        # (turni rimossi, nuovo riassunto, cancellazione): chi ne conserva una copia la rifà
+        self.revision = 0
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._summarizing = False
+        # Incrementata da clear(): i riassunti avviati prima vengono scartati
+        self._generation = 0
+        self._executor = ThreadPoolExecutor(max_workers=1) if summarizer else None
+
+    @property
+    def tokens(self) -> int:
+        """Token della cronologia, riassunto compreso."""
+        return self._tokens + self._summary_tokens
+
+    def messages(self) -> list:
+        """Restituisce i turni ancora in memoria come lista di tuple (mittente, messaggio)."""
+        return [(sender, message) for sender, message, _, _ in self._turns]
+
+    def add(self, sender: str, message: str):
+        """Aggiunge un messaggio e rimuove i turni più vecchi se il budget è superato."""
+        line = f"{sender}: {message}\n"
+        tokens = self.token_counter(line)
+        self._turns.append((sender, message, line, tokens))
+        self._rendered += line
+        self._tokens += tokens
+        self._evict()
+
+    def pop(self):
+        """Rimuove l'ultimo messaggio aggiunto (es. uno stream interrotto), senza cambiare la revisione."""
+        if not self._turns:
+            return
+        _, _, line, tokens = self._turns.pop()
+        self._rendered = self._rendered[: len(self._rendered) - len(line)]
+        self._tokens -= tokens
+
+    def _evict(self):
+        if self.tokens <= self.token_budget:
+            return
+        evicted = []
+        # L'ultimo messaggio resta sempre, anche se da solo supera il budget
+        while self.tokens > self.token_budget * self.eviction_target and len(self._turns) > 1:
+            _, _, line, tokens = self._turns.popleft()
+            self._tokens -= tokens
+            evicted.append(line)
+        if not evicted:
+            return
+        self.revision += 1
+        self._rendered = self._rendered[sum(len(line) for line in evicted):]
+        if self.summarizer is not None:
+            with self._lock:
+                if self._executor is None:
+                    # Memoria già chiusa con close()
+                    return
+                self._pending.extend(evicted)
+                if not self._summarizing:
+                    self._summarizing = True
+                    self._executor.submit(self._summarize_pending)
+
+    def _summarize_pending(self):
+        # Gira nel thread di background: la risposta all'utente non aspetta il riassunto
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._summarizing = False
+                    return
+                text = "".join(self._pending)
+                self._pending = []
+                previous = self.summary
+                generation = self._generation
+            try:
+                summary = self.summarizer(previous, text)
+            except Exception:
+                # Se il riassunto fallisce i turni rimossi vanno persi, come senza summarizer
+                continue
+            with self._lock:
+                if generation != self._generation:
+                    # La memoria è stata cancellata mentre il riassunto era in corso
+                    continue
+                self._set_summary(summary.strip())
+                self.revision += 1
+
+    def _set_summary(self, summary: str):
+        self.summary = summary
+        self._summary_tokens = self.token_counter(summary) if summary else 0
+
+    def render(self) -> str:
+        """Restituisce la cronologia formattata, preceduta dal riassunto se presente."""
+        if not self._turns and not self.summary:
+            return "Nessuna conversazione precedente."
+        if self.summary:
+            return f"Riassunto della conversazione precedente: {self.summary}\n\n{self._rendered}"
+        return self._rendered
+
+    def clear(self):
+        with self._lock:
+            self._pending = []
+            self._set_summary("")
+            self._generation += 1
+            self.revision += 1
+        self._turns.clear()
+        self._rendered = ""
+        self._tokens = 0
+
+    def to_dict(self) -> dict:
+        """Stato serializzabile della memoria (riassunto e turni)."""
+        return {"summary": self.summary, "turns": self.messages()}
+
+    def load_dict(self, data: dict):
+        """Ripristina lo stato salvato con to_dict."""
+        self.clear()
+        self._set_summary(data.get("summary", ""))
+        for sender, message in data.get("turns", []):
+            self.add(sender, message)
+
+    def close(self):
+        """Ferma il thread dei riassunti; i turni rimossi da qui in poi vengono scartati."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._pending = []
+            self._generation += 1
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
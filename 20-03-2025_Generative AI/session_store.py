@@ -0,0 +1,176 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class Session:
+    """Una conversazione attiva: il chatbot, l'ultimo utilizzo e un lock per serializzare i messaggi."""
+
+    def __init__(self, session_id: str, chatbot):
+        self.session_id = session_id
+        self.chatbot = chatbot
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked()
+
+
+class SessionStore:
+    """
+    Archivio delle sessioni, indicizzate per ID.
+    Le sessioni inattive da più di idle_timeout secondi e quelle oltre max_sessions
+    (le meno usate di recente) vengono rimosse dalla memoria; se spill_path è
+    impostato vengono salvate su SQLite e ripristinate alla richiesta successiva.
+
+    Le letture e le scritture su SQLite girano in un thread (asyncio.to_thread) per non
+    bloccare il ciclo degli eventi: le sessioni rimosse aspettano in una coda e vengono
+    salvate tutte insieme da flush() (chiamata da sweep e close), in una sola transazione.
+    Finché non sono salvate, una nuova richiesta le riprende dalla coda.
+    """
+
+    def __init__(self, chatbot_factory, max_sessions: int = 1000, idle_timeout: float = 900.0, spill_path: str = None):
+        """
+        Args:
+            chatbot_factory: Funzione senza argomenti che crea un nuovo chatbot
+            max_sessions (int): Numero massimo di sessioni tenute in memoria
+            idle_timeout (float): Secondi di inattività dopo cui una sessione viene rimossa
+            spill_path (str): File SQLite dove salvare le sessioni rimosse, o None per scartarle
+        """
+        self.chatbot_factory = chatbot_factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions = OrderedDict()
+        # Sessioni rimosse dalla memoria in attesa di essere salvate
+        self._spill_queue = OrderedDict()
+        # Sessioni che si stanno leggendo da SQLite: le altre richieste per lo stesso ID aspettano
+        self._loading = {}
+        self._flush_lock = asyncio.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        if spill_path is not None:
+            self._db = sqlite3.connect(spill_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.commit()
+        self.restored = 0
+        self.spilled = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    async def get(self, session_id: str) -> Session:
+        """Restituisce la sessione, ripristinandola da disco o creandone una nuova se necessario."""
+        while session_id in self._loading:
+            await self._loading[session_id]
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._spill_queue.pop(session_id, None)
+            if session is None:
+                session = await self._restore(session_id)
+            self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        session.last_used = time.monotonic()
+        self._evict_overflow(keep=session_id)
+        return session
+
+    async def _restore(self, session_id: str) -> Session:
+        loaded = asyncio.get_running_loop().create_future()
+        self._loading[session_id] = loaded
+        try:
+            state = await asyncio.to_thread(self._load, session_id) if self._db is not None else None
+            chatbot = self.chatbot_factory()
+            if state is not None:
+                chatbot.memory.load_dict(state)
+                self.restored += 1
+            return Session(session_id, chatbot)
+        finally:
+            del self._loading[session_id]
+            loaded.set_result(None)
+
+    def _load(self, session_id: str):
+        with self._db_lock:
+            row = self._db.execute("SELECT state FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write(self, rows: list):
+        with self._db_lock:
+            self._db.executemany("INSERT OR REPLACE INTO sessions (id, state, updated_at) VALUES (?, ?, ?)", rows)
+            self._db.commit()
+
+    def _delete(self, session_ids: list):
+        with self._db_lock:
+            self._db.executemany("DELETE FROM sessions WHERE id = ?", [(session_id,) for session_id in session_ids])
+            self._db.commit()
+
+    def _remove(self, session_id: str):
+        session = self._sessions.pop(session_id)
+        if self._db is not None:
+            self._spill_queue[session_id] = session
+        else:
+            session.chatbot.memory.close()
+
+    def _evict_overflow(self, keep: str = None):
+        # Si parte dalla sessione usata meno di recente, saltando quelle che stanno rispondendo
+        # e quella appena richiesta
+        for session_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if session_id != keep and not self._sessions[session_id].busy:
+                self._remove(session_id)
+
+    async def flush(self):
+        """Salva su SQLite, in una sola transazione, le sessioni rimosse dalla memoria."""
+        async with self._flush_lock:
+            if not self._spill_queue:
+                return
+            now = time.time()
+            batch = [(session_id, session, session.last_used) for session_id, session in self._spill_queue.items()]
+            rows = [(session_id, json.dumps(session.chatbot.memory.to_dict()), now) for session_id, session, _ in batch]
+            await asyncio.to_thread(self._write, rows)
+            dropped = []
+            for session_id, session, last_used in batch:
+                if self._spill_queue.get(session_id) is session and session.last_used == last_used:
+                    del self._spill_queue[session_id]
+                    session.chatbot.memory.close()
+                elif session_id not in self._sessions and session_id not in self._spill_queue:
+                    # Eliminata con drop() mentre veniva salvata
+                    dropped.append(session_id)
+            if dropped:
+                await asyncio.to_thread(self._delete, dropped)
+            self.spilled += len(batch) - len(dropped)
+
+    async def sweep(self) -> int:
+        """Rimuove le sessioni inattive, salva quelle in coda e restituisce quante ne sono state rimosse."""
+        now = time.monotonic()
+        expired = [
+            session_id
+            for session_id, session in self._sessions.items()
+            if now - session.last_used > self.idle_timeout and not session.busy
+        ]
+        for session_id in expired:
+            self._remove(session_id)
+        await self.flush()
+        return len(expired)
+
+    async def drop(self, session_id: str):
+        """Elimina definitivamente una sessione, anche dal file SQLite."""
+        for sessions in (self._sessions, self._spill_queue):
+            session = sessions.pop(session_id, None)
+            if session is not None:
+                session.chatbot.memory.close()
+        if self._db is not None:
+            await asyncio.to_thread(self._delete, [session_id])
+
+    async def close(self):
+        """Salva tutte le sessioni ancora in memoria e chiude il database."""
+        for session_id in list(self._sessions):
+            self._remove(session_id)
+        await self.flush()
+        if self._db is not None:
+            self._db.close()
@@ -1,5 +1,11 @@
-from langchain_community.llms import Ollama
 from langchain.prompts import PromptTemplate
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.metrics import StreamMetrics, atimed_stream, timed_stream
+from common.ollama_client import PooledOllama, get_client
+from conversation_memory import ConversationMemory
 
 
 class StatefulChatbot:
@@ -7,14 +13,47 @@ class StatefulChatbot:
         self,
         base_url="huge-ape-apparent.ngrok-free.app",
         model="gemma3:4b",
+        token_budget=1500,
+        summarize=False,
+        llm=None,
+        reuse_context=False,
+        keep_alive="30m",
     ):
+        # Con reuse_context=True a ogni turno si invia solo il nuovo messaggio insieme al
+        # "context" restituito da Ollama con la risposta precedente: la conversazione resta
+        # un prefisso che il server non deve rielaborare. Serve l'API di Ollama, quindi un PooledOllama
+        if reuse_context and llm is not None and not isinstance(llm, PooledOllama):
+            raise ValueError("reuse_context richiede un PooledOllama")
+
         # Inizializziamo il modello LLM usando Ollama
         # Questo sarà il nostro "cervello" del chatbot
-        self.llm = Ollama(model=model, base_url=base_url)
+        # Il client condiviso per base_url gestisce connessioni, tentativi e scadenze
+        # Un llm già creato può essere condiviso tra più chatbot (es. nel server multi-sessione)
+        self.llm = llm if llm is not None else PooledOllama(client=get_client(base_url), model=model)
+        self.reuse_context = reuse_context
+        # Per quanto tempo Ollama tiene il modello (e la sua cache) in memoria dopo una risposta
+        self.keep_alive = keep_alive
+
+        # Creiamo la memoria della conversazione, limitata a token_budget token
+        # Con summarize=True i turni più vecchi vengono riassunti invece di essere scartati
+        # Riusando il contesto la memoria scende a metà budget quando lo supera: ogni rimozione
+        # obbliga a reinviare la conversazione intera, così succede una volta ogni diversi turni
+        self.memory = ConversationMemory(
+            token_budget=token_budget,
+            summarizer=self.summarize if summarize else None,
+            eviction_target=0.5 if reuse_context else 1.0,
+        )
 
-        # Creiamo una lista vuota per memorizzare la cronologia delle conversazioni
-        # Ogni elemento sarà una tupla (mittente, messaggio)
-        self.conversation_history = []
+        # Contesto di Ollama dopo l'ultima risposta e revisione della memoria a cui corrisponde
+        self._context = None
+        self._context_revision = None
+        self._pending_context = None
+        self.context_stats = {"reused": 0, "full": 0, "fallbacks": 0}
+        # Token del prompt elaborati dal server nell'ultimo turno (solo con reuse_context)
+        self.last_prompt_tokens = None
+
+        # Metriche dell'ultima risposta in streaming (tempo al primo token e totale)
+        self.last_metrics = None
 
         # Definiamo il template per il prompt che include la cronologia delle conversazioni
         template = """Sei un assistente AI amichevole e disponibile.
@@ -36,22 +75,36 @@ class StatefulChatbot:
             input_variables=["conversation_history", "input"], template=template
         )
 
+        # Prompt dei turni successivi quando la conversazione è già nel contesto del server
+        self.turn_prompt = PromptTemplate(input_variables=["input"], template="Domanda: {input}\n\nRisposta:")
+
+    @property
+    def conversation_history(self):
+        """
+        La cronologia ancora in memoria, come lista di tuple (mittente, messaggio).
+        """
+        return self.memory.messages()
+
     def format_conversation_history(self):
         """
         Formatta la cronologia della conversazione in modo leggibile per il modello.
+        La memoria mantiene già il testo formattato, quindi non viene ricostruito a ogni turno.
         Returns:
             str: La cronologia formattata
         """
-        # Se non c'è cronologia, restituiamo una stringa vuota
-        if not self.conversation_history:
-            return "Nessuna conversazione precedente."
-
-        # Altrimenti, formattiamo ogni scambio
-        formatted_history = ""
-        for sender, message in self.conversation_history:
-            formatted_history += f"{sender}: {message}\n"
+        return self.memory.render()
 
-        return formatted_history
+    def summarize(self, previous_summary: str, evicted_text: str) -> str:
+        """
+        Riassume i turni usciti dal budget insieme al riassunto precedente.
+        Viene chiamata dalla memoria in un thread separato.
+        """
+        prompt = (
+            "Riassumi in poche frasi la seguente conversazione, mantenendo i fatti importanti.\n\n"
+            f"Riassunto precedente: {previous_summary or 'nessuno'}\n\n"
+            f"Nuovi messaggi:\n{evicted_text}\n\nRiassunto:"
+        )
+        return self.llm.invoke(prompt)
 
     def chat(self, user_input: str) -> str:
         """
@@ -62,38 +115,189 @@ class StatefulChatbot:
             str: La risposta del chatbot
         """
         try:
-            # Aggiungiamo il messaggio dell'utente alla cronologia
-            self.conversation_history.append(("Utente", user_input))
+            if self.reuse_context:
+                self.memory.add("Utente", user_input)
+                response = "".join(self._context_tokens(user_input))
+            else:
+                # Aggiungiamo il messaggio dell'utente alla cronologia e formattiamo il prompt
+                formatted_prompt = self._begin_turn(user_input)
 
-            # Formattiamo la cronologia della conversazione
-            formatted_history = self.format_conversation_history()
-
-            # Formattiamo il prompt con l'input dell'utente e la cronologia
-            formatted_prompt = self.prompt.format(
-                input=user_input, conversation_history=formatted_history
-            )
-
-            # Generiamo la risposta usando l'LLM
-            response = self.llm.invoke(formatted_prompt)
+                # Generiamo la risposta usando l'LLM
+                response = self.llm.invoke(formatted_prompt)
             response = response.strip()
 
             # Aggiungiamo la risposta del chatbot alla cronologia
-            self.conversation_history.append(("Chatbot", response))
+            self.memory.add("Chatbot", response)
+            self._commit_context()
             return response
         except Exception as e:
+            self._context = None
             error_message = f"Mi dispiace, si è verificato un errore: {str(e)}"
 
             # Aggiungiamo anche il messaggio di errore alla cronologia
-            self.conversation_history.append(("Chatbot", error_message))
+            self.memory.add("Chatbot", error_message)
 
             return error_message
 
+    def _begin_turn(self, user_input: str) -> str:
+        """Aggiunge il messaggio dell'utente alla cronologia e restituisce il prompt da inviare."""
+        self.memory.add("Utente", user_input)
+        return self._render_prompt(user_input)
+
+    def _render_prompt(self, user_input: str) -> str:
+        return self.prompt.format(
+            input=user_input, conversation_history=self.format_conversation_history()
+        )
+
+    def _context_request(self, user_input: str):
+        """
+        Prompt e parametri del turno: solo la nuova domanda se il contesto del server
+        corrisponde ancora alla memoria, altrimenti l'intera conversazione.
+        """
+        if self._context is not None and self._context_revision == self.memory.revision:
+            return self.turn_prompt.format(input=user_input), {"context": self._context}
+        return self._render_prompt(user_input), {}
+
+    def _full_request(self, user_input: str):
+        # Contesto rifiutato (es. server riavviato con un altro modello): si ricomincia da capo
+        self.context_stats["fallbacks"] += 1
+        self._context = None
+        return self._render_prompt(user_input), {}
+
+    def _count_request(self, params: dict):
+        """Conta la richiesta che ha risposto, con o senza il contesto del server."""
+        self.context_stats["reused" if "context" in params else "full"] += 1
+
+    def _handle_part(self, part: dict) -> str:
+        if part.get("done"):
+            self._pending_context = part.get("context")
+            self.last_prompt_tokens = part.get("prompt_eval_count")
+        return part.get("response", "")
+
+    def _context_tokens(self, user_input: str):
+        """
+        Token della risposta generata a partire dal contesto del server. Se la richiesta
+        con il contesto fallisce prima di produrre token viene ripetuta con la conversazione completa.
+        """
+        self._pending_context = None
+        prompt, params = self._context_request(user_input)
+        stream = self.llm.client.stream_generate(self.llm.model, prompt, options=self.llm.options, keep_alive=self.keep_alive, deadline=self.llm.deadline, **params)
+        try:
+            first = next(stream, None)
+        except Exception:
+            if "context" not in params:
+                raise
+            prompt, params = self._full_request(user_input)
+            stream = self.llm.client.stream_generate(self.llm.model, prompt, options=self.llm.options, keep_alive=self.keep_alive, deadline=self.llm.deadline)
+            first = next(stream, None)
+        self._count_request(params)
+        if first is None:
+            return
+        yield self._handle_part(first)
+        for part in stream:
+            yield self._handle_part(part)
+
+    async def _acontext_tokens(self, user_input: str):
+        """Versione asincrona di _context_tokens."""
+        self._pending_context = None
+        prompt, params = self._context_request(user_input)
+        stream = self.llm.client.astream_generate(self.llm.model, prompt, options=self.llm.options, keep_alive=self.keep_alive, deadline=self.llm.deadline, **params)
+        try:
+            first = await anext(stream, None)
+        except Exception:
+            if "context" not in params:
+                raise
+            prompt, params = self._full_request(user_input)
+            stream = self.llm.client.astream_generate(self.llm.model, prompt, options=self.llm.options, keep_alive=self.keep_alive, deadline=self.llm.deadline)
+            first = await anext(stream, None)
+        self._count_request(params)
+        if first is None:
+            return
+        yield self._handle_part(first)
+        async for part in stream:
+            yield self._handle_part(part)
+
+    def _commit_context(self):
+        """Dopo una risposta completa: il contesto ricevuto vale finché la memoria cresce solo in coda."""
+        if self.reuse_context:
+            self._context, self._pending_context = self._pending_context, None
+            self._context_revision = self.memory.revision
+
+    def chat_stream(self, user_input: str):
+        """
+        Come chat, ma restituisce i token della risposta man mano che arrivano.
+        La risposta entra nella cronologia solo quando lo stream è completo;
+        se lo stream viene interrotto, il turno viene annullato.
+        Args:
+            user_input (str): Il messaggio dell'utente
+        Yields:
+            str: I token della risposta
+        """
+        self.last_metrics = StreamMetrics()
+        if self.reuse_context:
+            self.memory.add("Utente", user_input)
+            stream = self._context_tokens(user_input)
+        else:
+            stream = self.llm.stream(self._begin_turn(user_input))
+        completed = False
+        try:
+            parts = []
+            for token in timed_stream(stream, self.last_metrics):
+                parts.append(token)
+                yield token
+            self.memory.add("Chatbot", "".join(parts).strip())
+            self._commit_context()
+            completed = True
+        except Exception as e:
+            self._context = None
+            error_message = f"Mi dispiace, si è verificato un errore: {str(e)}"
+            self.memory.add("Chatbot", error_message)
+            completed = True
+            yield error_message
+        finally:
+            if not completed:
+                self.memory.pop()
+
+    async def achat_stream(self, user_input: str):
+        """
+        Versione asincrona di chat_stream.
+        Args:
+            user_input (str): Il messaggio dell'utente
+        Yields:
+            str: I token della risposta
+        """
+        self.last_metrics = StreamMetrics()
+        if self.reuse_context:
+            self.memory.add("Utente", user_input)
+            stream = self._acontext_tokens(user_input)
+        else:
+            stream = self.llm.astream(self._begin_turn(user_input))
+        completed = False
+        try:
+            parts = []
+            async for token in atimed_stream(stream, self.last_metrics):
+                parts.append(token)
+                yield token
+            self.memory.add("Chatbot", "".join(parts).strip())
+            self._commit_context()
+            completed = True
+        except Exception as e:
+            self._context = None
+            error_message = f"Mi dispiace, si è verificato un errore: {str(e)}"
+            self.memory.add("Chatbot", error_message)
+            completed = True
+            yield error_message
+        finally:
+            if not completed:
+                self.memory.pop()
+
     def clear_history(self):
         """
         Cancella la cronologia della conversazione.
         Utile per iniziare una nuova conversazione.
         """
-        self.conversation_history = []
+        self.memory.clear()
+        self._context = None
         return "Cronologia della conversazione cancellata."
 
 
@@ -116,8 +320,10 @@ def main():
             message = chatbot.clear_history()
             print(f"\nChatbot: {message}")
         else:
-            response = chatbot.chat(user_input)
-            print(f"\nChatbot: {response}")
+            print("\nChatbot: ", end="", flush=True)
+            for token in chatbot.chat_stream(user_input):
+                print(token, end="", flush=True)
+            print(f"\n({chatbot.last_metrics})")
 
 
 if __name__ == "__main__":
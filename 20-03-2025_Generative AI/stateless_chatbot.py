@@ -1,11 +1,17 @@
-from langchain_community.llms import Ollama
 from langchain.prompts import PromptTemplate
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.metrics import StreamMetrics, atimed_stream, timed_stream
+from common.ollama_client import PooledOllama, get_client
 
 class StatelessChatbot:
-    def __init__(self, base_url="https://huge-ape-apparent.ngrok-free.app", model="gemma3:4b"):
+    def __init__(self, base_url="https://huge-ape-apparent.ngrok-free.app", model="gemma3:4b", llm=None):
         # Inizializziamo il modello LLM usando Ollama
         # Questo sarà il "cervello" del chatbot
-        self.llm = Ollama(model=model, base_url=base_url)
+        # Il client condiviso per base_url gestisce connessioni, tentativi e scadenze
+        self.llm = llm if llm is not None else PooledOllama(client=get_client(base_url), model=model)
         # Definiamo il template per il prompt
         template = """Sei un assistente AI amichevole e disponibile.
         Rispondi alle domande con fare amichevole e stralunato.
@@ -14,7 +20,9 @@ class StatelessChatbot:
 
         Risposta:"""
         # Creiamo il prompt template che verrà usato per ogni interazione
-        self.prompt = PromptTemplate(input_variables=["input", "contesto"], template=template)
+        self.prompt = PromptTemplate(input_variables=["input"], template=template)
+        # Metriche dell'ultima risposta in streaming (tempo al primo token e totale)
+        self.last_metrics = None
 
     def chat(self, user_input: str) -> str:
         """
@@ -27,13 +35,44 @@ class StatelessChatbot:
         """
         try:
             # Formattiamo il prompt con l'input dell'utente
-            formatted_prompt = self.prompt.format(input=user_input, contesto=self.contesto)
+            formatted_prompt = self.prompt.format(input=user_input)
             # Generiamo la risposta usando l'LLM
             response = self.llm.invoke(formatted_prompt)
             return response.strip()
         except Exception as e:
             return f"Mi dispiace, si è verificato un errore: {str(e)}"
 
+    def chat_stream(self, user_input: str):
+        """
+        Come chat, ma restituisce i token della risposta man mano che arrivano.
+        Args:
+        user_input (str): Il messaggio dell'utente
+        Yields:
+        str: I token della risposta
+        """
+        self.last_metrics = StreamMetrics()
+        try:
+            formatted_prompt = self.prompt.format(input=user_input)
+            yield from timed_stream(self.llm.stream(formatted_prompt), self.last_metrics)
+        except Exception as e:
+            yield f"Mi dispiace, si è verificato un errore: {str(e)}"
+
+    async def achat_stream(self, user_input: str):
+        """
+        Versione asincrona di chat_stream.
+        Args:
+        user_input (str): Il messaggio dell'utente
+        Yields:
+        str: I token della risposta
+        """
+        self.last_metrics = StreamMetrics()
+        try:
+            formatted_prompt = self.prompt.format(input=user_input)
+            async for token in atimed_stream(self.llm.astream(formatted_prompt), self.last_metrics):
+                yield token
+        except Exception as e:
+            yield f"Mi dispiace, si è verificato un errore: {str(e)}"
+
 def main():
     # Creiamo un'istanza del chatbot
     print("Inizializzazione del chatbot stateless...")
@@ -45,8 +84,10 @@ def main():
         if user_input.lower() == "exit":
             print("\nArrivederci!")
             break
-        response = chatbot.chat(user_input)
-        print(f"\nChatbot: {response}")
+        print("\nChatbot: ", end="", flush=True)
+        for token in chatbot.chat_stream(user_input):
+            print(token, end="", flush=True)
+        print(f"\n({chatbot.last_metrics})")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
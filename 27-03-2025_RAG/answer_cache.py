@@ -0,0 +1,219 @@
+import heapq
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+
+class AnswerCache:
+    """Cache delle risposte per domande identiche o quasi identiche.
+
+    Una risposta viene riutilizzata solo se i chunk recuperati per la nuova domanda
+    coincidono con quelli usati per generarla.
+
+    Le risposte scadute vengono eliminate in ordine di creazione da un heap, senza
+    scorrere tutta la cache. I vettori delle domande stanno in una matrice a cui le
+    nuove righe vengono aggiunte in coda; le righe eliminate vengono solo marcate e
+    la matrice viene ricompattata quando sono più di quelle valide.
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, ttl: float = 3600.0, max_entries: int = 1000, neighbours: int = 5):
+        """
+        Args:
+            neighbours (int): Domande simili controllate per ogni ricerca: la più simile
+                può essere stata generata con chunk diversi da quelli appena recuperati
+        """
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.neighbours = neighbours
+        self._entries = OrderedDict()
+        self._by_chunk = {}
+        # Coppie (istante di creazione, chiave); quelle di risposte sostituite vengono saltate
+        self._expiry = []
+        self._reset_matrix()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        return normalize_text(question).lower().rstrip("?!. ")
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, entry: dict) -> bool:
+        return self.ttl is not None and time.monotonic() - entry["created"] > self.ttl
+
+    def _reset_matrix(self):
+        self._matrix = None
+        self._created = np.empty(0)
+        self._live = np.empty(0, dtype=bool)
+        self._row_keys = []
+        self._row_of = {}
+
+    def _add_row(self, key: str, vector: np.ndarray, created: float):
+        rows = len(self._row_keys)
+        if self._matrix is None or len(vector) != self._matrix.shape[1]:
+            self._reset_matrix()
+            rows = 0
+            self._matrix = np.empty((16, len(vector)), dtype=np.float32)
+        elif rows == len(self._matrix):
+            if rows - len(self._row_of) > len(self._row_of):
+                self._compact_rows()
+                rows = len(self._row_keys)
+            if rows == len(self._matrix):
+                self._matrix = np.concatenate([self._matrix, np.empty_like(self._matrix)])
+        if len(self._created) < len(self._matrix):
+            self._created = np.resize(self._created, len(self._matrix))
+            self._live = np.resize(self._live, len(self._matrix))
+        self._matrix[rows] = vector
+        self._created[rows] = created
+        self._live[rows] = True
+        self._row_keys.append(key)
+        self._row_of[key] = rows
+
+    def _compact_rows(self):
+        """Riscrive la matrice con le sole righe valide."""
+        rows = np.flatnonzero(self._live[:len(self._row_keys)])
+        count = len(rows)
+        self._matrix[:count] = self._matrix[rows]
+        self._created[:count] = self._created[rows]
+        self._live[:count] = True
+        self._live[count:] = False
+        self._row_keys = [self._row_keys[row] for row in rows]
+        self._row_of = {key: row for row, key in enumerate(self._row_keys)}
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for cid in entry["chunk_ids"]:
+            keys = self._by_chunk.get(cid)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_chunk[cid]
+        row = self._row_of.pop(key, None)
+        if row is not None:
+            self._live[row] = False
+
+    def _evict_expired(self):
+        """Elimina le risposte scadute, che altrimenti resterebbero in memoria fino a max_entries."""
+        if self.ttl is None:
+            return
+        limit = time.monotonic() - self.ttl
+        while self._expiry and self._expiry[0][0] < limit:
+            created, key = heapq.heappop(self._expiry)
+            entry = self._entries.get(key)
+            if entry is not None and entry["created"] == created:
+                self._remove(key)
+
+    def _nearest(self, vector: np.ndarray, chunk_ids: tuple):
+        """La chiave della domanda più simile sopra la soglia generata con gli stessi chunk, oppure None."""
+        if not self._row_of or len(vector) != self._matrix.shape[1]:
+            return None
+        rows = len(self._row_keys)
+        scores = self._matrix[:rows] @ vector
+        scores[~self._live[:rows]] = -np.inf
+        # Una risposta scaduta non deve nascondere una valida appena meno simile
+        if self.ttl is not None:
+            scores[time.monotonic() - self._created[:rows] > self.ttl] = -np.inf
+        top = np.flatnonzero(scores >= self.similarity_threshold)
+        if len(top) > self.neighbours:
+            top = top[np.argpartition(-scores[top], self.neighbours - 1)[: self.neighbours]]
+        for row in top[np.argsort(-scores[top])]:
+            key = self._row_keys[row]
+            if self._entries[key]["chunk_ids"] == chunk_ids:
+                return key
+        return None
+
+    def lookup(self, question: str, chunk_ids: list, embed_query=None):
+        """Cerca una risposta valida per la domanda.
+
+        Args:
+            question (str): La domanda dell'utente
+            chunk_ids (list): Gli ID dei chunk appena recuperati per la domanda
+            embed_query: Funzione che calcola l'embedding della domanda, usata solo se non c'è una corrispondenza esatta
+        Returns:
+            str | None: La risposta in cache, oppure None
+        """
+        key = self.normalize_question(question)
+        with self._lock:
+            self._evict_expired()
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry) and entry["chunk_ids"] == tuple(chunk_ids):
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry["answer"]
+
+        if embed_query is not None:
+            vector = self._unit(embed_query(question))
+            with self._lock:
+                match = self._nearest(vector, tuple(chunk_ids))
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.semantic_hits += 1
+                    return self._entries[match]["answer"]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, question: str, chunk_ids: list, answer: str, vector=None):
+        """Salva la risposta insieme agli ID dei chunk usati come contesto."""
+        key = self.normalize_question(question)
+        with self._lock:
+            self._evict_expired()
+            self._remove(key)
+            created = time.monotonic()
+            self._entries[key] = {
+                "answer": answer,
+                "chunk_ids": tuple(chunk_ids),
+                "created": created,
+            }
+            for cid in chunk_ids:
+                self._by_chunk.setdefault(cid, set()).add(key)
+            if vector is not None:
+                self._add_row(key, self._unit(vector), created)
+            if self.ttl is not None:
+                heapq.heappush(self._expiry, (created, key))
+                # Le coppie di risposte già rimosse (sostituite o oltre max_entries) restano fino alla scadenza
+                if len(self._expiry) > 2 * len(self._entries) + 16:
+                    self._expiry = [(entry["created"], k) for k, entry in self._entries.items()]
+                    heapq.heapify(self._expiry)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_chunks(self, chunk_ids: list) -> int:
+        """Elimina le risposte costruite sui chunk indicati e restituisce quante sono state rimosse."""
+        with self._lock:
+            keys = set()
+            for cid in chunk_ids:
+                keys.update(self._by_chunk.get(cid, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_chunk.clear()
+            self._expiry.clear()
+            self._reset_matrix()
+
+    def stats(self) -> dict:
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+        }
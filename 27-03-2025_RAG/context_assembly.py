@@ -0,0 +1,168 @@
+import math
+from collections import Counter
+
+from embedding_cache import normalize_text
+from ingestion import doc_chunk_id
+from lexical_index import tokenize
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima approssimativa dei token (circa 4 caratteri per token), sufficiente per il budget."""
+    return len(text) // 4 + 1
+
+
+def overlap_length(left: str, right: str, min_overlap: int = 20) -> int:
+    """Lunghezza del più lungo suffisso di left che è anche un prefisso di right, 0 se più corto di min_overlap."""
+    if len(left) < min_overlap or len(right) < min_overlap:
+        return 0
+    probe = right[:min_overlap]
+    # La prima occorrenza utile è la sovrapposizione più lunga
+    start = left.find(probe, max(0, len(left) - len(right)))
+    while start >= 0:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(probe, start + 1)
+    return 0
+
+
+def truncate_text(text: str, max_tokens: int, token_counter=estimate_tokens) -> str:
+    """Accorcia il testo a circa max_tokens token, tagliando a fine frase o almeno tra due parole."""
+    if token_counter(text) <= max_tokens:
+        return text
+    limit = int(len(text) * max_tokens / token_counter(text))
+    head = text[:limit]
+    cut = max(head.rfind(". "), head.rfind("\n"))
+    if cut < limit // 2:
+        cut = head.rfind(" ")
+    return head[: cut + 1].rstrip() if cut > 0 else head
+
+
+class ContextAssembler:
+    """
+    Prepara il contesto del prompt a partire dai chunk recuperati, entro un budget di token:
+    1. scarta i chunk ripetuti o contenuti per intero in un altro;
+    2. ne sceglie fino a max_chunks con la maximal marginal relevance: la rilevanza viene
+       dalla posizione nel risultato del retriever (1 / (1 + posizione)), la ridondanza dalla similarità del coseno tra le parole
+       dei chunk già scelti, senza calcolare embedding;
+    3. unisce i chunk consecutivi dello stesso file togliendo la parte ripetuta per via
+       del chunk_overlap del text splitter;
+    4. inserisce i passaggi nel budget, accorciando a fine frase quello che non ci sta.
+    """
+
+    def __init__(self, token_budget: int = 1500, max_chunks: int = 4, lambda_mult: float = 0.7, min_overlap: int = 20, min_passage_tokens: int = 32, token_counter=estimate_tokens, separator: str = "\n\n"):
+        """
+        Args:
+            token_budget (int): Token massimi del contesto
+            max_chunks (int): Chunk scelti tra quelli recuperati
+            lambda_mult (float): Peso della rilevanza rispetto alla diversità (1.0 = solo rilevanza)
+            min_overlap (int): Caratteri in comune perché due chunk vengano uniti
+            min_passage_tokens (int): Spazio minimo rimasto nel budget per inserire un passaggio accorciato
+        """
+        self.token_budget = token_budget
+        self.max_chunks = max_chunks
+        self.lambda_mult = lambda_mult
+        self.min_overlap = min_overlap
+        self.min_passage_tokens = min_passage_tokens
+        self.token_counter = token_counter
+        self.separator = separator
+
+    def _unique(self, docs: list) -> list:
+        texts = [normalize_text(doc.page_content) for doc in docs]
+        unique = []
+        for i, text in enumerate(texts):
+            if not text or text in texts[:i]:
+                continue
+            if any(len(other) > len(text) and text in other for other in texts):
+                continue
+            unique.append(docs[i])
+        return unique
+
+    def _select(self, docs: list) -> list:
+        """Maximal marginal relevance sui vettori delle frequenze delle parole."""
+        vectors = [Counter(tokenize(doc.page_content)) for doc in docs]
+        norms = [math.sqrt(sum(tf * tf for tf in vector.values())) or 1.0 for vector in vectors]
+
+        def similarity(i, j):
+            small, large = sorted((vectors[i], vectors[j]), key=len)
+            return sum(tf * large[term] for term, tf in small.items()) / (norms[i] * norms[j])
+
+        selected = []
+        remaining = list(range(len(docs)))
+        while remaining and len(selected) < self.max_chunks:
+            def score(i):
+                relevance = 1 / (1 + i)
+                redundancy = max((similarity(i, j) for j in selected), default=0.0)
+                return self.lambda_mult * relevance - (1 - self.lambda_mult) * redundancy
+
+            best = max(remaining, key=score)
+            selected.append(best)
+            remaining.remove(best)
+        return [docs[i] for i in selected]
+
+    def _merge(self, docs: list):
+        """
+        Returns:
+            tuple: I passaggi (dizionari con testo, sorgente e ID dei chunk) e i caratteri ripetuti rimossi
+        """
+        passages = []
+        removed = 0
+        for doc in docs:
+            text = doc.page_content
+            source = doc.metadata.get("source")
+            for passage in passages:
+                if passage["source"] != source:
+                    continue
+                after = overlap_length(passage["text"], text, self.min_overlap)
+                before = 0 if after else overlap_length(text, passage["text"], self.min_overlap)
+                if after or before:
+                    passage["text"] = passage["text"] + text[after:] if after else text + passage["text"][before:]
+                    passage["chunk_ids"].append(doc_chunk_id(doc))
+                    removed += after or before
+                    break
+            else:
+                passages.append({"text": text, "source": source, "chunk_ids": [doc_chunk_id(doc)]})
+        return passages, removed
+
+    def assemble(self, docs: list):
+        """
+        Returns:
+            tuple: Il testo del contesto e le statistiche, tra cui i token risparmiati rispetto
+            ai primi max_chunks chunk uniti così come sono e gli ID dei chunk finiti nel contesto
+        """
+        baseline = self.separator.join(doc.page_content for doc in docs[: self.max_chunks])
+        selected = self._select(self._unique(docs))
+        passages, overlap_chars = self._merge(selected)
+
+        separator_tokens = self.token_counter(self.separator)
+        parts = []
+        chunk_ids = []
+        used = 0
+        truncated = 0
+        for passage in passages:
+            cost = self.token_counter(passage["text"]) + (separator_tokens if parts else 0)
+            if used + cost <= self.token_budget:
+                parts.append(passage["text"])
+                chunk_ids.extend(passage["chunk_ids"])
+                used += cost
+                continue
+            available = self.token_budget - used - (separator_tokens if parts else 0)
+            if available >= self.min_passage_tokens:
+                parts.append(truncate_text(passage["text"], available, self.token_counter))
+                chunk_ids.extend(passage["chunk_ids"])
+                used += self.token_counter(parts[-1]) + (separator_tokens if len(parts) > 1 else 0)
+                truncated += 1
+
+        context = self.separator.join(parts)
+        baseline_tokens = self.token_counter(baseline) if baseline else 0
+        context_tokens = self.token_counter(context) if context else 0
+        return context, {
+            "candidates": len(docs),
+            "selected": len(selected),
+            "passages": len(parts),
+            "truncated": truncated,
+            "overlap_chars": overlap_chars,
+            "baseline_tokens": baseline_tokens,
+            "context_tokens": context_tokens,
+            "tokens_saved": baseline_tokens - context_tokens,
+            "chunk_ids": chunk_ids,
+        }
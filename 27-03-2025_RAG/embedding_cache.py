@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    """Normalizza unicode e spazi, così testi equivalenti condividono la stessa chiave."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class OllamaBatchEmbeddings(Embeddings):
+    """Embeddings Ollama che invia più testi per richiesta tramite l'endpoint /api/embed."""
+
+    def __init__(self, client, model: str, embed_instruction: str = "passage: ", query_instruction: str = "query: "):
+        self.client = client
+        self.model = model
+        # Stessi prefissi di OllamaEmbeddings, per restare coerenti con gli indici già creati
+        self.embed_instruction = embed_instruction
+        self.query_instruction = query_instruction
+
+    def _embed(self, inputs: list) -> list:
+        return self.client.embed(self.model, inputs)
+
+    def embed_documents(self, texts: list) -> list:
+        return self._embed([f"{self.embed_instruction}{text}" for text in texts])
+
+    def embed_query(self, text: str) -> list:
+        return self._embed([f"{self.query_instruction}{text}"])[0]
+
+
+class EmbeddingCache:
+    """Cache degli embedding su disco con un livello LRU in memoria.
+
+    I vettori sono righe float32 di un unico file accessibile tramite memory map,
+    l'indice (chiave -> riga) è un file di testo append-only.
+    """
+
+    def __init__(self, cache_dir: str, memory_items: int = 10000):
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.vectors_path = os.path.join(cache_dir, "vectors.f32")
+        self.index_path = os.path.join(cache_dir, "index.tsv")
+        self.meta_path = os.path.join(cache_dir, "meta.json")
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.dim = None
+        self.index = {}
+        self.rows = 0
+        self._memory = OrderedDict()
+        self._mmap = None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, encoding="utf-8") as f:
+            self.dim = json.load(f)["dim"]
+        # Una riga scritta a metà (es. processo interrotto) viene tolta, così le prossime
+        # aggiunte ripartono dall'inizio di una riga
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        self.rows = size // (4 * self.dim)
+        if self.rows * 4 * self.dim < size:
+            os.truncate(self.vectors_path, self.rows * 4 * self.dim)
+        if os.path.exists(self.index_path):
+            complete = 0
+            with open(self.index_path, "rb") as f:
+                for raw in f:
+                    # Anche l'ultima riga dell'indice può essere incompleta (es. "chiave\t1" invece di "chiave\t12")
+                    if not raw.endswith(b"\n"):
+                        break
+                    complete += len(raw)
+                    key, _, row = raw.decode("utf-8").rstrip("\n").partition("\t")
+                    if row.isdigit() and int(row) < self.rows:
+                        self.index[key] = int(row)
+            if complete < os.path.getsize(self.index_path):
+                os.truncate(self.index_path, complete)
+
+    @staticmethod
+    def make_key(model: str, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{kind}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        """Restituisce il vettore associato alla chiave, oppure None."""
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+            row = self.index.get(key)
+            if row is None:
+                self.misses += 1
+                return None
+            if self._mmap is None or self._mmap.shape[0] <= row:
+                self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+            vector = np.array(self._mmap[row])
+            self._remember(key, vector)
+            self.disk_hits += 1
+            return vector
+
+    def put_many(self, items: list):
+        """Salva su disco una lista di coppie (chiave, vettore)."""
+        if not items:
+            return
+        with self._lock:
+            items = [(key, vector) for key, vector in items if key not in self.index]
+            if not items:
+                return
+            matrix = np.asarray([vector for _, vector in items], dtype=np.float32)
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim}, f)
+            elif matrix.ndim != 2 or matrix.shape[1] != self.dim:
+                # Righe di un'altra dimensione sposterebbero tutte quelle successive nel file
+                raise ValueError(f"Vettori di dimensione {matrix.shape[-1]}, la cache in {self.cache_dir} usa {self.dim}: serve un'altra cartella per questo modello")
+            # Prima i vettori, poi l'indice: un'interruzione lascia al più righe orfane
+            with open(self.vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                for offset, (key, _) in enumerate(items):
+                    f.write(f"{key}\t{self.rows + offset}\n")
+            for offset, (key, _) in enumerate(items):
+                self.index[key] = self.rows + offset
+                self._remember(key, matrix[offset])
+            self.rows += len(items)
+
+    def stats(self) -> dict:
+        """Contatori di hit/miss, utili per dimensionare la cache."""
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "memory_items": len(self._memory),
+            "disk_items": len(self.index),
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings che consultano la cache e inviano al backend solo i testi mancanti, a lotti."""
+
+    def __init__(self, backend: Embeddings, model_name: str, cache: EmbeddingCache, batch_size: int = 32):
+        self.backend = backend
+        self.model_name = model_name
+        self.cache = cache
+        self.batch_size = batch_size
+
+    def _embed(self, texts: list, kind: str, compute) -> list:
+        keys = [self.cache.make_key(self.model_name, kind, text) for text in texts]
+        vectors = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in vectors or key in missing:
+                continue
+            vector = self.cache.get(key)
+            if vector is None:
+                missing[key] = text
+            else:
+                vectors[key] = vector
+
+        pending = list(missing.items())
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            computed = compute([text for _, text in batch])
+            items = [(key, np.asarray(vector, dtype=np.float32)) for (key, _), vector in zip(batch, computed)]
+            self.cache.put_many(items)
+            vectors.update(items)
+
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_documents(self, texts: list) -> list:
+        return self._embed(texts, "document", self.backend.embed_documents)
+
+    def embed_query(self, text: str) -> list:
+        return self._embed([text], "query", lambda batch: [self.backend.embed_query(t) for t in batch])[0]
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+
+class TracedEmbeddings(Embeddings):
+    """Embeddings che registrano uno span "embed" per ogni chiamata (vedi common/tracing.py)."""
+
+    def __init__(self, embeddings: Embeddings, tracer):
+        self.embeddings = embeddings
+        self.tracer = tracer
+
+    def embed_documents(self, texts: list) -> list:
+        with self.tracer.span("embed", kind="document", texts=len(texts)):
+            return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list:
+        with self.tracer.span("embed", kind="query", texts=1):
+            return self.embeddings.embed_query(text)
+
+    def __getattr__(self, name):
+        # stats() della cache e gli altri metodi dell'oggetto avvolto
+        return getattr(self.embeddings, name)
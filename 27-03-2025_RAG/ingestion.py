@@ -0,0 +1,370 @@
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from langchain_core.documents import Document
+
+
+MANIFEST_NAME = "manifest.json"
+
+# I file vengono letti e suddivisi a segmenti di questa dimensione, tagliati tra due paragrafi
+SEGMENT_BYTES = 4 * 1024 * 1024
+# Byte letti dopo la fine nominale di un segmento per cercare dove tagliarlo
+_BOUNDARY_WINDOW = 64 * 1024
+
+
+def chunk_id(source: str, content: str, occurrence: int = 0) -> str:
+    """Calcola l'ID stabile di un chunk a partire dalla sorgente e dal contenuto."""
+    digest = hashlib.sha256(f"{source}\0{content}".encode("utf-8")).hexdigest()[:32]
+    return f"{digest}-{occurrence}"
+
+
+def assign_chunk_ids(chunks: list, seen: dict = None) -> list:
+    """Assegna a ogni chunk un ID basato sull'hash del contenuto e lo salva nei metadati.
+
+    Chunk identici nello stesso file ricevono un contatore di occorrenza diverso,
+    così gli ID restano univoci ma stabili tra un'ingestione e l'altra.
+    Per un file elaborato a segmenti si passa lo stesso dizionario seen a ogni chiamata.
+    """
+    seen = {} if seen is None else seen
+    ids = []
+    for chunk in chunks:
+        source = chunk.metadata.get("source", "")
+        key = (source, chunk.page_content)
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        cid = chunk_id(source, chunk.page_content, occurrence)
+        chunk.metadata["chunk_id"] = cid
+        ids.append(cid)
+    return ids
+
+
+class IngestionManifest:
+    """Registro persistente dei file indicizzati: mtime, dimensione e ID dei chunk di ogni sorgente."""
+
+    def __init__(self, persist_dir: str, settings: dict):
+        self.path = os.path.join(persist_dir, MANIFEST_NAME)
+        self.settings = settings
+        self.sources = {}
+        self.exists = os.path.exists(self.path)
+        if self.exists:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            # Se cambiano i parametri di suddivisione o il modello di embedding tutti i chunk vanno rifatti
+            if data.get("settings") == settings:
+                self.sources = data.get("sources", {})
+
+    @staticmethod
+    def file_signature(path: str) -> dict:
+        stat = os.stat(path)
+        return {"mtime": stat.st_mtime_ns, "size": stat.st_size}
+
+    def is_unchanged(self, path: str) -> bool:
+        entry = self.sources.get(path)
+        return entry is not None and entry["signature"] == self.file_signature(path)
+
+    def chunk_ids(self, path: str) -> list:
+        entry = self.sources.get(path)
+        return entry["chunks"] if entry else []
+
+    def update(self, path: str, ids: list):
+        self.sources[path] = {"signature": self.file_signature(path), "chunks": ids}
+
+    def remove(self, path: str):
+        self.sources.pop(path, None)
+
+    def all_chunk_ids(self) -> set:
+        return {cid for entry in self.sources.values() for cid in entry["chunks"]}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"settings": self.settings, "sources": self.sources}, f)
+        os.replace(tmp_path, self.path)
+
+
+def iter_segments(path: str, segment_bytes: int = SEGMENT_BYTES):
+    """
+    Divide un file in intervalli di byte di circa segment_bytes, tagliati dopo una
+    riga vuota (o almeno dopo un a capo) per non spezzare i paragrafi.
+    Legge solo piccole finestre attorno ai tagli, non il file intero.
+    Yields:
+        tuple: (inizio, fine, ultimo segmento del file)
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        yield 0, 0, True
+        return
+    start = 0
+    with open(path, "rb") as f:
+        while start < size:
+            nominal_end = start + segment_bytes
+            if nominal_end >= size:
+                yield start, size, True
+                return
+            f.seek(nominal_end)
+            window = f.read(_BOUNDARY_WINDOW)
+            cut = window.find(b"\n\n")
+            line_cut = window.find(b"\n")
+            if cut >= 0:
+                end = nominal_end + cut + 2
+            elif line_cut >= 0:
+                end = nominal_end + line_cut + 1
+            else:
+                # Nessun a capo: si taglia all'inizio di un carattere UTF-8
+                offset = 0
+                while offset < len(window) and window[offset] & 0xC0 == 0x80:
+                    offset += 1
+                end = nominal_end + offset
+            yield start, end, end >= size
+            start = end
+
+
+# Splitter dei processi del pool, ricevuto una volta sola all'avvio
+_worker_splitter = None
+
+
+def _init_worker(text_splitter):
+    global _worker_splitter
+    _worker_splitter = text_splitter
+
+
+def _split_segment(path: str, start: int, end: int, text_splitter=None) -> list:
+    with open(path, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8")
+    splitter = text_splitter or _worker_splitter
+    return splitter.split_documents([Document(page_content=text, metadata={"source": path})])
+
+
+class ChunkStream:
+    """
+    Legge e suddivide i documenti in modo pigro, un segmento alla volta.
+
+    Con workers > 0 i segmenti vengono suddivisi da un pool di processi; al più
+    max_pending segmenti sono in lavorazione o in attesa di essere consumati,
+    così la memoria non cresce con la dimensione del corpus. I segmenti escono
+    nell'ordine dei file.
+    """
+
+    def __init__(self, text_splitter, workers: int = 0, segment_bytes: int = SEGMENT_BYTES, max_pending: int = None):
+        self.text_splitter = text_splitter
+        self.workers = workers
+        self.segment_bytes = segment_bytes
+        self.max_pending = max_pending or 2 * max(workers, 1)
+
+    def _tasks(self, paths: list):
+        for path in paths:
+            for start, end, last in iter_segments(path, self.segment_bytes):
+                yield path, start, end, last
+
+    def __call__(self, paths: list):
+        """
+        Yields:
+            tuple: (percorso, chunk del segmento, ultimo segmento del file)
+        """
+        if not self.workers:
+            for path, start, end, last in self._tasks(paths):
+                yield path, _split_segment(path, start, end, self.text_splitter), last
+            return
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.text_splitter,),
+        ) as pool:
+            pending = deque()
+            for path, start, end, last in self._tasks(paths):
+                pending.append((path, last, pool.submit(_split_segment, path, start, end)))
+                if len(pending) >= self.max_pending:
+                    path, last, future = pending.popleft()
+                    yield path, future.result(), last
+            while pending:
+                path, last, future = pending.popleft()
+                yield path, future.result(), last
+
+
+class BatchWriter:
+    """
+    Scrive nel database vettoriale da un thread dedicato, a lotti di batch_size chunk.
+
+    La coda tra chi produce i chunk e il thread di scrittura contiene al più
+    max_batches lotti: se embedding e inserimento sono più lenti della suddivisione
+    il produttore si ferma (backpressure), altrimenti le due fasi si sovrappongono.
+    Un errore nel thread di scrittura viene rilanciato alla prima operazione successiva.
+    """
+
+    def __init__(self, vectorstore, batch_size: int = 64, max_batches: int = 4):
+        self.vectorstore = vectorstore
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=max_batches)
+        self._documents = []
+        self._ids = []
+        self._error = None
+        self.written = 0
+        # Secondi passati dentro il database (embedding compresi), sul thread di scrittura
+        self.write_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue
+            operation, documents, ids = item
+            start = time.perf_counter()
+            try:
+                if operation == "add":
+                    self.vectorstore.add_documents(documents=documents, ids=ids)
+                    self.written += len(documents)
+                else:
+                    self.vectorstore.delete(ids=ids)
+            except Exception as e:
+                self._error = e
+            self.write_seconds += time.perf_counter() - start
+
+    def _put(self, item):
+        if self._error is not None:
+            raise self._error
+        self._queue.put(item)
+
+    def add(self, documents: list, ids: list):
+        self._documents.extend(documents)
+        self._ids.extend(ids)
+        while len(self._documents) >= self.batch_size:
+            self._put(("add", self._documents[: self.batch_size], self._ids[: self.batch_size]))
+            del self._documents[: self.batch_size]
+            del self._ids[: self.batch_size]
+
+    def delete(self, ids: list):
+        if ids:
+            self._put(("delete", None, list(ids)))
+
+    def close(self):
+        """Scrive l'ultimo lotto e attende il thread di scrittura."""
+        if self._documents:
+            self._put(("add", self._documents, self._ids))
+            self._documents, self._ids = [], []
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # Si esce senza scrivere il resto: l'errore originale ha la precedenza
+            self._documents, self._ids = [], []
+            self._error = self._error or exc
+            self._queue.put(None)
+            self._thread.join()
+
+
+class IncrementalIngestor:
+    """Sincronizza il database vettoriale con i documenti, indicizzando solo ciò che è cambiato."""
+
+    def __init__(self, vectorstore, text_splitter, manifest: IngestionManifest, workers: int = 0, batch_size: int = 64, max_batches: int = 4, lexical_index=None):
+        """
+        Args:
+            workers (int): Processi che suddividono i file, 0 per farlo nel processo corrente
+            batch_size (int): Chunk per lotto di embedding e inserimento
+            max_batches (int): Lotti in coda verso il database prima di fermare la lettura
+            lexical_index (BM25Index): Indice lessicale da aggiornare insieme al database
+        """
+        self.vectorstore = vectorstore
+        self.text_splitter = text_splitter
+        self.manifest = manifest
+        self.chunks = ChunkStream(text_splitter, workers=workers)
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.lexical_index = lexical_index
+        self.stats = {}
+
+    def sync(self, doc_paths: list) -> dict:
+        """Aggiunge i chunk nuovi o modificati e rimuove quelli spariti.
+
+        Senza un manifest valido il database viene svuotato e reindicizzato: lo segnala un
+        messaggio e stats["cleared"], e gli ID svuotati sono tra i rimossi.
+        Returns:
+            dict: ID dei chunk aggiunti e rimossi durante la sincronizzazione
+        """
+        added, removed = [], []
+        if not self.manifest.exists or not self.manifest.sources:
+            # Database creato prima del manifest (o con altri parametri): gli ID non sono noti, si riparte da zero
+            removed = self._clear_store()
+            if removed:
+                reason = "manifest assente" if not self.manifest.exists else "manifest vuoto o con altri parametri"
+                print(f"{self.manifest.path}: {reason}, rimossi i {len(removed)} chunk del database per reindicizzare tutto")
+        cleared = len(removed)
+        changed = [path for path in doc_paths if not self.manifest.is_unchanged(path)]
+        with BatchWriter(self.vectorstore, self.batch_size, self.max_batches) as writer:
+            # I segmenti arrivano nell'ordine dei file: basta lo stato del file corrente
+            current = None
+            for path, chunks, last in self.chunks(changed):
+                if current is None or current["path"] != path:
+                    current = {"path": path, "seen": {}, "ids": [], "old": set(self.manifest.chunk_ids(path))}
+                ids = assign_chunk_ids(chunks, current["seen"])
+                current["ids"].extend(ids)
+                new_chunks = [(cid, chunk) for cid, chunk in zip(ids, chunks) if cid not in current["old"]]
+                if new_chunks:
+                    writer.add([chunk for _, chunk in new_chunks], [cid for cid, _ in new_chunks])
+                    self._index_add(new_chunks)
+                    added.extend(cid for cid, _ in new_chunks)
+                if last:
+                    stale_ids = sorted(current["old"] - set(current["ids"]))
+                    self._delete(writer, stale_ids)
+                    removed.extend(stale_ids)
+                    self.manifest.update(path, current["ids"])
+
+            for path in set(self.manifest.sources) - set(doc_paths):
+                stale_ids = self.manifest.chunk_ids(path)
+                self._delete(writer, stale_ids)
+                removed.extend(stale_ids)
+                self.manifest.remove(path)
+        self.stats = {"files": len(changed), "written": writer.written, "write_seconds": writer.write_seconds, "cleared": cleared}
+
+        self.manifest.save()
+        if self.lexical_index is not None:
+            self.lexical_index.save()
+        return {"added": added, "removed": removed}
+
+    def _index_add(self, chunks: list):
+        if self.lexical_index is not None:
+            self.lexical_index.add([cid for cid, _ in chunks], [chunk.page_content for _, chunk in chunks])
+
+    def _delete(self, writer: BatchWriter, ids: list):
+        writer.delete(ids)
+        if self.lexical_index is not None:
+            self.lexical_index.remove(ids)
+
+    def _clear_store(self) -> list:
+        """Svuota database e indice lessicale e restituisce gli ID rimossi."""
+        existing = self.vectorstore.get(include=[])["ids"]
+        if existing:
+            self.vectorstore.delete(ids=existing)
+        if self.lexical_index is not None:
+            self.lexical_index.clear()
+        return list(existing)
+
+
+def doc_chunk_id(doc) -> str:
+    """Restituisce l'ID del chunk di un documento recuperato dal database vettoriale."""
+    cid = doc.metadata.get("chunk_id") or getattr(doc, "id", None)
+    if cid:
+        return cid
+    return chunk_id(doc.metadata.get("source", ""), doc.page_content)
@@ -0,0 +1,203 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from embedding_cache import normalize_text
+from ingestion import doc_chunk_id
+
+
+INDEX_NAME = "lexical_index.json"
+
+# Parole troppo frequenti per distinguere un chunk dall'altro
+STOPWORDS = frozenset(
+    "il lo la i gli le un uno una di a da in con su per tra fra e ed o che chi cui non si "
+    "del dello della dei degli delle al allo alla ai agli alle dal dalla dai nel nella nei "
+    "sul sulla sui è era fu come qual quale quali cosa chiama".split()
+)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list:
+    """Parole in minuscolo, senza articoli e preposizioni; anni e nomi restano token interi."""
+    return [t for t in TOKEN_PATTERN.findall(normalize_text(text).lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Indice invertito con punteggio BM25, salvato in un file JSON accanto al database vettoriale.
+
+    Per ogni chunk si conservano solo lunghezza e frequenze dei termini: il testo resta nel
+    database vettoriale. Le liste dei chunk per termine vengono ricostruite al caricamento.
+    """
+
+    def __init__(self, persist_dir: str, k1: float = 1.5, b: float = 0.75):
+        """k1 e b valgono per un indice nuovo: un indice salvato mantiene quelli con cui è stato creato."""
+        self.path = os.path.join(persist_dir, INDEX_NAME)
+        self.k1 = k1
+        self.b = b
+        self._docs = {}
+        self._postings = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+        self.exists = os.path.exists(self.path)
+        if self.exists:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.k1 = data.get("k1", k1)
+            self.b = data.get("b", b)
+            for cid, (length, frequencies) in data["docs"].items():
+                self._insert(cid, length, frequencies)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @property
+    def ids(self) -> set:
+        return set(self._docs)
+
+    def _insert(self, cid: str, length: int, frequencies: dict):
+        self._docs[cid] = (length, frequencies)
+        self._total_length += length
+        for term, tf in frequencies.items():
+            self._postings.setdefault(term, {})[cid] = tf
+
+    def add(self, ids: list, texts: list):
+        with self._lock:
+            for cid, text in zip(ids, texts):
+                if cid in self._docs:
+                    continue
+                tokens = tokenize(text)
+                self._insert(cid, len(tokens), dict(Counter(tokens)))
+
+    def remove(self, ids: list):
+        with self._lock:
+            for cid in ids:
+                entry = self._docs.pop(cid, None)
+                if entry is None:
+                    continue
+                length, frequencies = entry
+                self._total_length -= length
+                for term in frequencies:
+                    postings = self._postings[term]
+                    del postings[cid]
+                    if not postings:
+                        del self._postings[term]
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+            self._total_length = 0
+
+    def search(self, query: str, k: int = 10) -> list:
+        """
+        Returns:
+            list: Le coppie (ID del chunk, punteggio) dei k chunk migliori, in ordine decrescente
+        """
+        with self._lock:
+            n = len(self._docs)
+            if n == 0:
+                return []
+            average_length = self._total_length / n
+            scores = Counter()
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for cid, tf in postings.items():
+                    length = self._docs[cid][0]
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[cid] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores.most_common(k)
+
+    def sync_from(self, vectorstore, expected_ids: set = None, page_size: int = 1000):
+        """Allinea l'indice ai chunk del database vettoriale, leggendo solo i testi mancanti.
+
+        Serve per i database creati prima dell'indice; non calcola embedding.
+        """
+        if expected_ids is None:
+            expected_ids = set(vectorstore.get(include=[])["ids"])
+        self.remove(list(self.ids - expected_ids))
+        missing = sorted(expected_ids - self.ids)
+        for start in range(0, len(missing), page_size):
+            page = vectorstore.get(ids=missing[start:start + page_size], include=["documents"])
+            self.add(page["ids"], page["documents"])
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            data = {"k1": self.k1, "b": self.b, "docs": self._docs}
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        self.exists = True
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever che fonde BM25 e similarità vettoriale con la reciprocal rank fusion.
+
+    Se il primo risultato lessicale ha almeno min_lexical_score e stacca il secondo di
+    almeno lexical_margin volte (es. un nome o un anno presenti in un solo chunk) la
+    domanda viene risolta solo con l'indice, senza calcolarne l'embedding.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: object
+    index: BM25Index
+    k: int = 2
+    fetch_k: int = 20
+    rrf_k: int = 60
+    lexical_margin: float = 2.0
+    min_lexical_score: float = 0.5
+    lexical_only: int = 0
+    fused: int = 0
+
+    def _is_confident(self, lexical: list) -> bool:
+        if not lexical or lexical[0][1] < self.min_lexical_score:
+            return False
+        return len(lexical) == 1 or lexical[0][1] >= self.lexical_margin * lexical[1][1]
+
+    def _load(self, ids: list) -> list:
+        if not ids:
+            return []
+        page = self.vectorstore.get(ids=ids, include=["documents", "metadatas"])
+        by_id = {
+            cid: Document(id=cid, page_content=text, metadata=metadata or {})
+            for cid, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+        }
+        return [by_id[cid] for cid in ids if cid in by_id]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list:
+        lexical = self.index.search(query, self.fetch_k)
+        if self._is_confident(lexical):
+            self.lexical_only += 1
+            return self._load([cid for cid, _ in lexical[: self.k]])
+
+        self.fused += 1
+        vector_docs = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        scores = Counter()
+        documents = {}
+        for rank, doc in enumerate(vector_docs):
+            cid = doc_chunk_id(doc)
+            documents.setdefault(cid, doc)
+            scores[cid] += 1 / (self.rrf_k + rank + 1)
+        for rank, (cid, _) in enumerate(lexical):
+            scores[cid] += 1 / (self.rrf_k + rank + 1)
+
+        best = [cid for cid, _ in scores.most_common(self.k)]
+        loaded = {doc.id: doc for doc in self._load([cid for cid in best if cid not in documents])}
+        return [documents.get(cid) or loaded[cid] for cid in best if cid in documents or cid in loaded]
+
+    def stats(self) -> dict:
+        return {"lexical_only": self.lexical_only, "fused": self.fused, "indexed_chunks": len(self.index)}
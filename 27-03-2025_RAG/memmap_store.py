@@ -0,0 +1,578 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import uuid
+from array import array
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from ingestion import MANIFEST_NAME
+from lexical_index import INDEX_NAME
+
+
+STORE_NAME = "memmap_store.json"
+DTYPES = {"float32": np.float32, "int8": np.int8}
+INDEX_MODES = ("auto", "exact", "ivf")
+
+# Righe lette dalla memory map per ogni prodotto matrice-vettore della ricerca esatta
+_BLOCK_ROWS = 65536
+# Righe eliminate oltre le quali (e oltre le righe valide) i file vengono riscritti
+_COMPACT_MIN_ROWS = 1024
+
+
+class MemmapVectorStore(VectorStore):
+    """Database vettoriale nel processo: una matrice su file letta tramite memory map.
+
+    I vettori sono normalizzati e salvati come righe float32, oppure int8 con una scala
+    per riga (un quarto dello spazio, a scapito di una piccola perdita di precisione).
+    Testi e metadati stanno in un file JSONL a parte, letto solo per le righe restituite:
+    all'avvio si caricano in memoria gli ID, non i vettori né i testi.
+
+    Il registro degli ID (righe "+id" e "-id") è l'ultimo file scritto a ogni operazione:
+    righe di vettori o testi non registrate, es. dopo un'interruzione, vengono ignorate.
+    Le righe eliminate restano nei file finché compact() non li riscrive in una nuova
+    generazione, che diventa valida solo quando memmap_store.json la indica.
+
+    Con index="exact" ogni ricerca confronta la domanda con tutte le righe, con "ivf" solo
+    con quelle delle nprobe partizioni più vicine (k-means sferico sui vettori), con "auto"
+    si usa l'IVF da ivf_threshold righe in su. Le partizioni vengono calcolate in un thread
+    in background dopo un'aggiunta (o una ricerca) che ne ha bisogno e ricalcolate quando
+    le righe quadruplicano; finché non ci sono, la ricerca resta esatta.
+    """
+
+    def __init__(self, persist_directory: str, embedding_function=None, dtype: str = "float32", index: str = "auto", ivf_threshold: int = 50_000, nprobe: int = 8):
+        """
+        Args:
+            dtype (str): "float32" o "int8"; per un database esistente vale quello con cui è stato creato
+            index (str): "auto", "exact" o "ivf"
+            nprobe (int): Partizioni confrontate in modalità IVF
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Tipo dei vettori non valido: {dtype}")
+        if index not in INDEX_MODES:
+            raise ValueError(f"Modalità di ricerca non valida: {index}")
+        self.persist_directory = persist_directory
+        self.embedding_function = embedding_function
+        self.index = index
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.path = os.path.join(persist_directory, STORE_NAME)
+        self.dtype = dtype
+        self.dim = None
+        self.generation = 0
+        self.ivf_rows = 0
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+            self.dtype = state["dtype"]
+            self.dim = state["dim"]
+            self.generation = state["generation"]
+            self.ivf_rows = state.get("ivf_rows", 0)
+        self._lock = threading.RLock()
+        self._trainer = None
+        self._open()
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _file(self, name: str, generation: int = None) -> str:
+        generation = self.generation if generation is None else generation
+        return os.path.join(self.persist_directory, f"{name}-{generation}")
+
+    def _open(self):
+        """Carica il registro degli ID e scarta le righe non registrate in coda ai file."""
+        self._ids = []
+        self._rows = {}
+        self._live = np.zeros(1024, dtype=bool)
+        self._vectors = None
+        self._scales = None
+        self._offsets = None
+        self._centroids = None
+        self._lists = None
+        self._assign = None
+        log_path = self._file("ids.log")
+        if os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.endswith("\n"):
+                        break
+                    if line[0] == "+":
+                        self._append_row(line[1:-1])
+                    else:
+                        self._drop(line[1:-1])
+        rows = len(self._ids)
+        if self.dim is not None:
+            self._truncate(self._file("vectors.bin"), rows * self.dim * np.dtype(DTYPES[self.dtype]).itemsize)
+            self._truncate(self._file("scales.f32"), rows * 4)
+            self._truncate(self._file("offsets.u64"), rows * 8)
+        # Partizioni non allineate alle righe: verranno ricalcolate alla prima ricerca IVF
+        if self.ivf_rows and os.path.exists(self._file("ivf_centroids.f32")) and self._truncate(self._file("ivf_lists.i32"), rows * 4) == rows * 4:
+            self._load_ivf(rows)
+
+    @staticmethod
+    def _truncate(path: str, size: int) -> int:
+        if not os.path.exists(path):
+            return 0
+        if os.path.getsize(path) > size:
+            os.truncate(path, size)
+        return os.path.getsize(path)
+
+    def _append_row(self, cid: str):
+        row = len(self._ids)
+        if row == len(self._live):
+            self._live = np.concatenate([self._live, np.zeros(row, dtype=bool)])
+        previous = self._rows.get(cid)
+        if previous is not None:
+            self._live[previous] = False
+        self._rows[cid] = row
+        self._ids.append(cid)
+        self._live[row] = True
+
+    def _drop(self, cid: str):
+        row = self._rows.pop(cid, None)
+        if row is not None:
+            self._live[row] = False
+
+    def _save_state(self):
+        os.makedirs(self.persist_directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype, "generation": self.generation, "ivf_rows": self.ivf_rows}, f)
+        os.replace(tmp_path, self.path)
+
+    def _snapshot(self):
+        """Memory map di vettori, scale e offset, riaperte se nel frattempo sono state aggiunte righe."""
+        with self._lock:
+            rows = len(self._ids)
+            if rows and (self._vectors is None or self._vectors.shape[0] != rows):
+                self._vectors = np.memmap(self._file("vectors.bin"), dtype=DTYPES[self.dtype], mode="r", shape=(rows, self.dim))
+                self._offsets = np.memmap(self._file("offsets.u64"), dtype=np.uint64, mode="r", shape=(rows,))
+                if self.dtype == "int8":
+                    self._scales = np.memmap(self._file("scales.f32"), dtype=np.float32, mode="r", shape=(rows,))
+            return rows, self._vectors, self._scales, self._offsets
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.where(norms > 0, norms, 1)
+
+    def _encode(self, matrix: np.ndarray):
+        if self.dtype == "float32":
+            return matrix, None
+        scales = np.abs(matrix).max(axis=1) / 127
+        quantized = np.round(matrix / np.where(scales > 0, scales, 1)[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+
+    @staticmethod
+    def _decode(block: np.ndarray, scales) -> np.ndarray:
+        block = np.asarray(block, dtype=np.float32)
+        return block if scales is None else block * np.asarray(scales)[:, None]
+
+    def add_vectors(self, ids: list, vectors: list, texts: list, metadatas: list = None) -> list:
+        """Aggiunge righe con embedding già calcolati; un ID già presente viene sostituito."""
+        if not ids:
+            return []
+        metadatas = metadatas or [None] * len(ids)
+        matrix = self._normalize(np.asarray(vectors, dtype=np.float32))
+        lines = [
+            (json.dumps({"text": text, "metadata": metadata or {}}, ensure_ascii=False) + "\n").encode("utf-8")
+            for text, metadata in zip(texts, metadatas)
+        ]
+        with self._lock:
+            if self.dim is None:
+                self.dim = matrix.shape[1]
+                self._save_state()
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Vettori di dimensione {matrix.shape[1]}, il database usa {self.dim}")
+            data, scales = self._encode(matrix)
+            documents_path = self._file("documents.jsonl")
+            start = os.path.getsize(documents_path) if os.path.exists(documents_path) else 0
+            offsets = start + np.cumsum([0] + [len(line) for line in lines[:-1]], dtype=np.uint64)
+
+            # Prima i dati, poi il registro: un'interruzione lascia al più righe non registrate
+            with open(self._file("vectors.bin"), "ab") as f:
+                f.write(data.tobytes())
+            if scales is not None:
+                with open(self._file("scales.f32"), "ab") as f:
+                    f.write(scales.tobytes())
+            with open(documents_path, "ab") as f:
+                f.writelines(lines)
+            with open(self._file("offsets.u64"), "ab") as f:
+                f.write(offsets.tobytes())
+            if self._centroids is not None:
+                assign = np.argmax(matrix @ self._centroids.T, axis=1).astype(np.int32)
+                with open(self._file("ivf_lists.i32"), "ab") as f:
+                    f.write(assign.tobytes())
+                # compact() copia le partizioni delle righe valide da _assign
+                self._assign = np.concatenate([self._assign, assign])
+                for offset, partition in enumerate(assign):
+                    self._lists[partition].append(len(self._ids) + offset)
+            with open(self._file("ids.log"), "a", encoding="utf-8") as f:
+                f.writelines(f"+{cid}\n" for cid in ids)
+            for cid in ids:
+                self._append_row(cid)
+        self._schedule_training()
+        return list(ids)
+
+    def add_texts(self, texts, metadatas: list = None, ids: list = None, **kwargs) -> list:
+        texts = list(texts)
+        ids = [cid or str(uuid.uuid4()) for cid in ids] if ids else [str(uuid.uuid4()) for _ in texts]
+        return self.add_vectors(ids, self.embedding_function.embed_documents(texts), texts, metadatas)
+
+    def delete(self, ids: list = None, **kwargs):
+        if not ids:
+            return None
+        with self._lock:
+            ids = [cid for cid in dict.fromkeys(ids) if cid in self._rows]
+            if ids:
+                with open(self._file("ids.log"), "a", encoding="utf-8") as f:
+                    f.writelines(f"-{cid}\n" for cid in ids)
+                for cid in ids:
+                    self._drop(cid)
+            dead = len(self._ids) - len(self._rows)
+            if dead > max(_COMPACT_MIN_ROWS, len(self._rows)):
+                self.compact()
+        return True
+
+    def _read_documents(self, rows: list, offsets: np.ndarray) -> list:
+        if not rows:
+            return []
+        entries = []
+        with open(self._file("documents.jsonl"), "rb") as f:
+            for row in rows:
+                f.seek(int(offsets[row]))
+                entries.append(json.loads(f.readline()))
+        return entries
+
+    def get(self, ids: list = None, limit: int = None, offset: int = None, include: list = None, **kwargs) -> dict:
+        """Legge le righe indicate, o tutte, con la stessa forma del risultato di Chroma.get."""
+        include = ["documents", "metadatas"] if include is None else include
+        rows, vectors, scales, offsets = self._snapshot()
+        with self._lock:
+            if ids is None:
+                selected = np.flatnonzero(self._live[:rows]).tolist()[offset or 0:]
+            else:
+                selected = [self._rows[cid] for cid in ids if cid in self._rows]
+            if limit is not None:
+                selected = selected[:limit]
+            result = {"ids": [self._ids[row] for row in selected], "include": include}
+        if "documents" in include or "metadatas" in include:
+            entries = self._read_documents(selected, offsets)
+            if "documents" in include:
+                result["documents"] = [entry["text"] for entry in entries]
+            if "metadatas" in include:
+                result["metadatas"] = [entry["metadata"] or None for entry in entries]
+        if "embeddings" in include:
+            index = np.asarray(selected, dtype=np.int64)
+            result["embeddings"] = self._decode(vectors[index], None if scales is None else scales[index]) if selected else np.zeros((0, self.dim or 0), dtype=np.float32)
+        return result
+
+    def get_by_ids(self, ids) -> list:
+        page = self.get(ids=list(ids))
+        return [
+            Document(id=cid, page_content=text, metadata=metadata or {})
+            for cid, text, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+        ]
+
+    def _use_ivf(self) -> bool:
+        return self.index == "ivf" or (self.index == "auto" and len(self._rows) >= self.ivf_threshold)
+
+    def _needs_training(self) -> bool:
+        return self._use_ivf() and (self._centroids is None or len(self._rows) > 4 * self.ivf_rows)
+
+    def _schedule_training(self):
+        """Avvia train_ivf in un thread se le partizioni mancano o sono vecchie e non è già in corso."""
+        with self._lock:
+            if not self._needs_training() or (self._trainer is not None and self._trainer.is_alive()):
+                return
+            self._trainer = threading.Thread(target=self.train_ivf, daemon=True)
+            self._trainer.start()
+
+    def wait_for_training(self):
+        """Aspetta la fine dell'addestramento in background, se ce n'è uno."""
+        trainer = self._trainer
+        if trainer is not None:
+            trainer.join()
+
+    def _load_ivf(self, rows: int):
+        centroids = np.fromfile(self._file("ivf_centroids.f32"), dtype=np.float32)
+        self._centroids = centroids.reshape(-1, self.dim)
+        self._assign = np.fromfile(self._file("ivf_lists.i32"), dtype=np.int32, count=rows)
+        self._lists = [array("q") for _ in range(len(self._centroids))]
+        for row, partition in enumerate(self._assign.tolist()):
+            self._lists[partition].append(row)
+
+    def train_ivf(self, nlist: int = None, iterations: int = 10, sample_size: int = None, seed: int = 0):
+        """
+        Divide i vettori in nlist partizioni (di default la radice delle righe valide) con un
+        k-means sferico su un campione, poi assegna ogni riga al centroide più vicino.
+        Il k-means gira senza il lock: ricerche e aggiunte continuano con le partizioni precedenti.
+        """
+        with self._lock:
+            rows, vectors, scales, _ = self._snapshot()
+            live_rows = np.flatnonzero(self._live[:rows])
+            generation = self.generation
+        if len(live_rows) == 0:
+            return
+        nlist = min(nlist or max(1, int(np.sqrt(len(live_rows)))), len(live_rows))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(live_rows, size=min(len(live_rows), sample_size or 64 * nlist), replace=False))
+        data = self._decode(vectors[sample], None if scales is None else scales[sample])
+        centroids = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, data)
+            # Una partizione rimasta vuota mantiene il centroide precedente
+            filled = np.bincount(assign, minlength=nlist) > 0
+            centroids[filled] = self._normalize(sums[filled])
+        assign = self._assign_rows(vectors, scales, centroids, 0, rows)
+
+        with self._lock:
+            if self.generation != generation:
+                # compact() ha rinumerato le righe nel frattempo
+                return
+            # Le righe aggiunte durante il k-means
+            total, vectors, scales, _ = self._snapshot()
+            assign = np.concatenate([assign, self._assign_rows(vectors, scales, centroids, rows, total)])
+            for name, values in (("ivf_centroids.f32", centroids.astype(np.float32)), ("ivf_lists.i32", assign)):
+                tmp_path = self._file(name) + ".tmp"
+                values.tofile(tmp_path)
+                os.replace(tmp_path, self._file(name))
+            self.ivf_rows = int(self._live[:total].sum())
+            self._save_state()
+            self._load_ivf(total)
+
+    def _assign_rows(self, vectors, scales, centroids: np.ndarray, start: int, end: int) -> np.ndarray:
+        assign = np.empty(end - start, dtype=np.int32)
+        for block_start in range(start, end, _BLOCK_ROWS):
+            block_end = min(block_start + _BLOCK_ROWS, end)
+            block = self._decode(vectors[block_start:block_end], None if scales is None else scales[block_start:block_end])
+            assign[block_start - start:block_end - start] = np.argmax(block @ centroids.T, axis=1)
+        return assign
+
+    @staticmethod
+    def _top(scores: np.ndarray, k: int) -> np.ndarray:
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(scores))
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    def _search(self, embedding, k: int) -> list:
+        """
+        Returns:
+            list: Le coppie (riga, similarità del coseno) delle k righe più simili
+        """
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        self._schedule_training()
+        with self._lock:
+            rows, vectors, scales, _ = self._snapshot()
+            centroids, lists = self._centroids, self._lists
+        if rows == 0 or k <= 0:
+            return []
+        live = self._live[:rows]
+
+        if self._use_ivf() and centroids is not None:
+            # Se le partizioni più vicine hanno meno di k righe valide se ne confrontano il doppio
+            partition_scores = centroids @ query
+            nprobe = max(1, self.nprobe)
+            while True:
+                probe = self._top(partition_scores, nprobe)
+                with self._lock:
+                    candidates = np.sort(np.concatenate([np.array(lists[p], dtype=np.int64) for p in probe]))
+                candidates = candidates[(candidates < rows) & live[np.minimum(candidates, rows - 1)]]
+                if len(candidates) >= k or nprobe >= len(centroids):
+                    break
+                nprobe *= 2
+            scores = self._decode(vectors[candidates], None if scales is None else scales[candidates]) @ query
+            top = self._top(scores, k)
+            return [(int(candidates[i]), float(scores[i])) for i in top]
+
+        best_rows, best_scores = [], []
+        for start in range(0, rows, _BLOCK_ROWS):
+            end = min(start + _BLOCK_ROWS, rows)
+            scores = np.asarray(vectors[start:end], dtype=np.float32) @ query
+            if scales is not None:
+                scores *= scales[start:end]
+            scores[~live[start:end]] = -np.inf
+            top = self._top(scores, k)
+            best_rows.append(top + start)
+            best_scores.append(scores[top])
+        candidates, scores = np.concatenate(best_rows), np.concatenate(best_scores)
+        return [(int(candidates[i]), float(scores[i])) for i in self._top(scores, k) if np.isfinite(scores[i])]
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, **kwargs) -> list:
+        """
+        Returns:
+            list: Coppie (documento, similarità del coseno), dalla più alta
+        """
+        hits = self._search(embedding, k)
+        _, _, _, offsets = self._snapshot()
+        entries = self._read_documents([row for row, _ in hits], offsets)
+        return [
+            (Document(id=self._ids[row], page_content=entry["text"], metadata=entry["metadata"]), score)
+            for (row, score), entry in zip(hits, entries)
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs) -> list:
+        return self.similarity_search_with_score_by_vector(self.embedding_function.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, **kwargs) -> list:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> list:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: (score + 1) / 2
+
+    def compact(self):
+        """Riscrive i file con le sole righe valide, in una nuova generazione."""
+        with self._lock:
+            rows, vectors, scales, offsets = self._snapshot()
+            live_rows = np.flatnonzero(self._live[:rows])
+            if len(live_rows) == rows:
+                return
+            generation = self.generation + 1
+            with open(self._file("vectors.bin", generation), "wb") as f:
+                for start in range(0, len(live_rows), _BLOCK_ROWS):
+                    f.write(np.asarray(vectors[live_rows[start:start + _BLOCK_ROWS]]).tobytes())
+            if scales is not None:
+                np.asarray(scales[live_rows]).tofile(self._file("scales.f32", generation))
+            new_offsets = np.empty(len(live_rows), dtype=np.uint64)
+            with open(self._file("documents.jsonl"), "rb") as source, open(self._file("documents.jsonl", generation), "wb") as target:
+                for index, row in enumerate(live_rows):
+                    source.seek(int(offsets[row]))
+                    new_offsets[index] = target.tell()
+                    target.write(source.readline())
+            new_offsets.tofile(self._file("offsets.u64", generation))
+            if self._centroids is not None:
+                self._centroids.tofile(self._file("ivf_centroids.f32", generation))
+                self._assign[live_rows].tofile(self._file("ivf_lists.i32", generation))
+            with open(self._file("ids.log", generation), "w", encoding="utf-8") as f:
+                f.writelines(f"+{self._ids[row]}\n" for row in live_rows)
+
+            old_files = [self._file(name) for name in ("vectors.bin", "scales.f32", "documents.jsonl", "offsets.u64", "ivf_centroids.f32", "ivf_lists.i32", "ids.log")]
+            self.generation = generation
+            if self._centroids is None:
+                self.ivf_rows = 0
+            self._save_state()
+            for path in old_files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    # File assente, o ancora mappato da un altro processo (es. su Windows)
+                    pass
+            self._open()
+
+    def disk_usage(self) -> int:
+        """Byte occupati su disco dai file della generazione corrente."""
+        names = ("vectors.bin", "scales.f32", "documents.jsonl", "offsets.u64", "ivf_centroids.f32", "ivf_lists.i32", "ids.log")
+        paths = [self._file(name) for name in names] + [self.path]
+        return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+    def stats(self) -> dict:
+        return {
+            "rows": len(self._rows),
+            "deleted_rows": len(self._ids) - len(self._rows),
+            "dim": self.dim,
+            "dtype": self.dtype,
+            "index": "ivf" if self._use_ivf() else "exact",
+            "partitions": 0 if self._centroids is None else len(self._centroids),
+            "size_bytes": self.disk_usage(),
+        }
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas: list = None, ids: list = None, persist_directory: str = None, **kwargs):
+        if persist_directory is None:
+            raise ValueError("MemmapVectorStore richiede persist_directory")
+        store = cls(persist_directory, embedding_function=embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+def _copy_sidecars(source_dir: str, target_dir: str, backend: str = None):
+    """Copia manifest e indice lessicale, indicando nel manifest il backend di destinazione."""
+    os.makedirs(target_dir, exist_ok=True)
+    manifest_path = os.path.join(source_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        manifest["settings"].pop("vector_backend", None)
+        if backend is not None:
+            manifest["settings"]["vector_backend"] = backend
+        with open(os.path.join(target_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+    index_path = os.path.join(source_dir, INDEX_NAME)
+    if os.path.exists(index_path):
+        shutil.copyfile(index_path, os.path.join(target_dir, INDEX_NAME))
+
+
+def import_chroma(chroma_dir: str, persist_dir: str, dtype: str = "float32", page_size: int = 1000) -> MemmapVectorStore:
+    """Copia un database Chroma in un MemmapVectorStore senza ricalcolare gli embedding.
+
+    Manifest e indice lessicale vengono copiati, così l'ingestione incrementale riparte da lì.
+    """
+    from langchain_chroma import Chroma
+
+    source = Chroma(persist_directory=chroma_dir)
+    store = MemmapVectorStore(persist_dir, dtype=dtype)
+    offset = 0
+    while True:
+        page = source.get(limit=page_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        if not page["ids"]:
+            break
+        store.add_vectors(page["ids"], page["embeddings"], page["documents"], page["metadatas"])
+        offset += len(page["ids"])
+    _copy_sidecars(chroma_dir, persist_dir, backend="memmap")
+    return store
+
+
+def export_chroma(persist_dir: str, chroma_dir: str, page_size: int = 1000):
+    """Copia un MemmapVectorStore in un database Chroma (con i vettori int8 riconvertiti in float32)."""
+    from langchain_chroma import Chroma
+
+    store = MemmapVectorStore(persist_dir)
+    target = Chroma(persist_directory=chroma_dir)
+    offset = 0
+    while True:
+        page = store.get(limit=page_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        if not page["ids"]:
+            break
+        target._collection.upsert(ids=page["ids"], embeddings=page["embeddings"].tolist(), documents=page["documents"], metadatas=page["metadatas"])
+        offset += len(page["ids"])
+    _copy_sidecars(persist_dir, chroma_dir)
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversione tra database Chroma e MemmapVectorStore")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Da Chroma a MemmapVectorStore")
+    import_parser.add_argument("chroma_dir")
+    import_parser.add_argument("persist_dir")
+    import_parser.add_argument("--dtype", choices=sorted(DTYPES), default="float32")
+    export_parser = subparsers.add_parser("export", help="Da MemmapVectorStore a Chroma")
+    export_parser.add_argument("persist_dir")
+    export_parser.add_argument("chroma_dir")
+    args = parser.parse_args()
+
+    if args.command == "import":
+        store = import_chroma(args.chroma_dir, args.persist_dir, dtype=args.dtype)
+        print(json.dumps(store.stats(), indent=2))
+    else:
+        export_chroma(args.persist_dir, args.chroma_dir)
+        print(f"Esportato in {args.chroma_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,226 @@
-from langchain_community.llms import Ollama
-from langchain_community.document_loaders import TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_chroma import Chroma
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
+from ingestion import BatchWriter, ChunkStream, IncrementalIngestor, IngestionManifest, assign_chunk_ids, doc_chunk_id
+from embedding_cache import CachedEmbeddings, EmbeddingCache, OllamaBatchEmbeddings, TracedEmbeddings
+from answer_cache import AnswerCache
+from lexical_index import BM25Index, HybridRetriever
+from memmap_store import DTYPES, MemmapVectorStore
+from context_assembly import ContextAssembler, estimate_tokens
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import contextvars
+import functools
 import os
+import sys
+import threading
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.ollama_client import PooledOllama, get_client
+from common.metrics import StreamMetrics, atimed_stream, timed_stream
+from common.tracing import JsonlExporter, SamplingProfiler, SpanAggregator, Tracer
 
 
 class RAGSystem:
-    def __init__(self, model_url: str, model_name: str, doc_paths: list, embed_url: str, embed_model: str, persist_dir: str):
-        """Inizializza il sistema RAG con il modello, i documenti e il database vettoriale."""
+    CHUNK_SIZE = 1000
+    CHUNK_OVERLAP = 200
+
+    def __init__(
+        self,
+        model_url: str,
+        model_name: str,
+        doc_paths: list,
+        embed_url: str,
+        embed_model: str,
+        persist_dir: str,
+        incremental: bool = False,
+        embed_cache_dir: str = None,
+        embed_batch_size: int = 32,
+        answer_cache: AnswerCache = None,
+        max_in_flight: int = 4,
+        llm=None,
+        embeddings=None,
+        chunk_size: int = CHUNK_SIZE,
+        chunk_overlap: int = CHUNK_OVERLAP,
+        k: int = 2,
+        ingest_workers: int = 0,
+        ingest_batch_size: int = 64,
+        retrieval: str = "vector",
+        vector_backend: str = "chroma",
+        vector_dtype: str = "float32",
+        context_budget: int = None,
+        context_candidates: int = None,
+        tracer: Tracer = None,
+    ):
+        """Inizializza il sistema RAG con il modello, i documenti e il database vettoriale.
+
+        Con incremental=True il database viene sincronizzato a ogni avvio: si indicizzano
+        solo i chunk nuovi o modificati e si eliminano quelli dei file rimossi.
+        Con embed_cache_dir gli embedding di chunk e domande vengono salvati su disco
+        e i testi mancanti sono inviati al backend a lotti di embed_batch_size.
+        Con answer_cache le risposte a domande già viste vengono riutilizzate.
+        max_in_flight limita le generazioni contemporanee verso il modello.
+        llm ed embeddings sostituiscono il modello e gli embedding di Ollama (es. nei benchmark);
+        chunk_size, chunk_overlap e k regolano la suddivisione e i chunk recuperati per domanda.
+        I documenti vengono letti e suddivisi a segmenti, da ingest_workers processi se > 0,
+        e inseriti nel database a lotti di ingest_batch_size mentre la lettura prosegue.
+        Con retrieval="hybrid" si mantiene anche un indice BM25 accanto al database e il
+        recupero fonde risultati lessicali e vettoriali.
+        Con vector_backend="memmap" i vettori sono salvati in un MemmapVectorStore (float32
+        o int8 secondo vector_dtype) al posto di Chroma.
+        Con context_budget il retriever recupera context_candidates chunk (di default 4 * k) e
+        il contesto del prompt è formato dai k più rilevanti e diversi tra loro, senza le parti
+        ripetute tra chunk consecutivi, entro context_budget token.
+        Con tracer ogni domanda registra uno span per stadio: embedding, recupero, contesto,
+        prompt (con i token stimati), modello (con il tempo al primo token) e parsing.
+        """
+        if retrieval not in ("vector", "hybrid"):
+            raise ValueError(f"Modalità di recupero non valida: {retrieval}")
+        if vector_backend not in ("chroma", "memmap"):
+            raise ValueError(f"Database vettoriale non valido: {vector_backend}")
+        if vector_dtype not in DTYPES:
+            raise ValueError(f"Tipo dei vettori non valido: {vector_dtype}")
         self.model_url = model_url
         self.model_name = model_name
         self.doc_paths = doc_paths
         self.embed_url = embed_url
         self.embed_model = embed_model
         self.persist_dir = persist_dir
+        self.incremental = incremental
+        self.embed_cache_dir = embed_cache_dir
+        self.embed_batch_size = embed_batch_size
+        self.answer_cache = answer_cache
+        self.max_in_flight = max_in_flight
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.k = k
+        self.ingest_workers = ingest_workers
+        self.ingest_batch_size = ingest_batch_size
+        self.retrieval = retrieval
+        self.vector_backend = vector_backend
+        self.vector_dtype = vector_dtype
+        self.context_candidates = context_candidates or 4 * k
+        self.context_assembler = ContextAssembler(token_budget=context_budget, max_chunks=k) if context_budget else None
+        # Token del contesto dell'ultima domanda (per thread o task, vedi last_context_stats) e totali
+        self._last_context_stats = contextvars.ContextVar("last_context_stats", default=None)
+        self.context_totals = {"queries": 0, "baseline_tokens": 0, "context_tokens": 0, "tokens_saved": 0}
+        self._context_lock = threading.Lock()
+        # Senza exporter il tracer è disattivato e gli span non costano nulla
+        self.tracer = tracer or Tracer()
+        self.lexical_index = BM25Index(persist_dir) if retrieval == "hybrid" else None
+        self._llm = llm
+        self._embeddings = embeddings
+        self._llm_slots = threading.BoundedSemaphore(max_in_flight)
+        self._async_llm_slots = None
+        self.last_metrics = None
+        self.last_ingest_stats = None
 
         self.model = self.load_model()
-        self.documents = self.load_documents()
+        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        self.embeddings = self.create_embeddings()
         self.vectorstore = self.create_vectorstore()
         self.retriever = self.create_retriever()
+        self.answer_chain = self.create_answer_chain()
         self.rag_chain = self.create_rag_chain()
 
     def load_model(self):
-        """Carica il modello LLM."""
-        return Ollama(base_url=self.model_url, model=self.model_name, verbose=False)
+        """Carica il modello LLM, che condivide il pool di connessioni con le altre richieste."""
+        if self._llm is not None:
+            return self._llm
+        client = get_client(self.model_url, pool_size=self.max_in_flight)
+        return PooledOllama(client=client, model=self.model_name)
+
+    def create_embeddings(self):
+        """Crea il modello di embedding, con la cache su disco se richiesta."""
+        embeddings = self._embeddings
+        if embeddings is None:
+            embeddings = OllamaBatchEmbeddings(get_client(self.embed_url), self.embed_model)
+            if self.embed_cache_dir is not None:
+                cache = EmbeddingCache(self.embed_cache_dir)
+                embeddings = CachedEmbeddings(embeddings, self.embed_model, cache, batch_size=self.embed_batch_size)
+        return TracedEmbeddings(embeddings, self.tracer) if self.tracer.enabled else embeddings
 
     def load_documents(self):
-        """Carica e suddivide i documenti in chunks."""
-        documents = []
-        for path in self.doc_paths:
-            loader = TextLoader(path)
-            documents.extend(loader.load())
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        return text_splitter.split_documents(documents)
+        """Carica e suddivide i documenti in chunks, in modo pigro: un segmento di file alla volta."""
+        for _, chunks, _ in ChunkStream(self.text_splitter, workers=self.ingest_workers)(self.doc_paths):
+            yield from chunks
+
+    def open_vectorstore(self):
+        """Apre il database vettoriale in persist_dir con il backend scelto."""
+        if self.vector_backend == "memmap":
+            return MemmapVectorStore(self.persist_dir, embedding_function=self.embeddings, dtype=self.vector_dtype)
+        # Importato qui: il client di Chroma è lento da caricare e non serve all'altro backend
+        from langchain_chroma import Chroma
+
+        return Chroma(persist_directory=self.persist_dir, embedding_function=self.embeddings)
 
     def create_vectorstore(self):
-        """Crea o carica il database vettoriale."""
-        embeddings = OllamaEmbeddings(base_url=self.embed_url, model=self.embed_model)
-        if not os.path.exists(self.persist_dir):
-            return Chroma.from_documents(documents=self.documents, embedding=embeddings, persist_directory=self.persist_dir)
-        return Chroma(persist_directory=self.persist_dir, embedding_function=embeddings)
+        """Crea o carica il database vettoriale.
+
+        I documenti vengono letti e suddivisi solo se il database va creato o aggiornato.
+        """
+        if self.incremental:
+            vectorstore = self.open_vectorstore()
+            self.ingest(vectorstore)
+            return vectorstore
+        exists = os.path.exists(self.persist_dir)
+        vectorstore = self.open_vectorstore()
+        if not exists:
+            seen = {}
+            with BatchWriter(vectorstore, self.ingest_batch_size) as writer:
+                # Un segmento alla volta, come IncrementalIngestor.sync
+                for _, chunks, _ in ChunkStream(self.text_splitter, workers=self.ingest_workers)(self.doc_paths):
+                    writer.add(chunks, assign_chunk_ids(chunks, seen))
+        if self.lexical_index is not None and not self.lexical_index.exists:
+            # Indice costruito dai testi già salvati nel database, senza ricalcolare embedding
+            self.lexical_index.sync_from(vectorstore)
+            self.lexical_index.save()
+        return vectorstore
+
+    def ingest(self, vectorstore=None) -> dict:
+        """Sincronizza il database vettoriale con doc_paths e restituisce gli ID dei chunk aggiunti e rimossi."""
+        vectorstore = self.vectorstore if vectorstore is None else vectorstore
+        settings = {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "embed_model": self.embed_model,
+            "embedder": type(self.embeddings).__name__,
+        }
+        if self.vector_backend != "chroma":
+            # Assente per Chroma, così i manifest creati prima dell'opzione restano validi
+            settings["vector_backend"] = self.vector_backend
+        manifest = IngestionManifest(self.persist_dir, settings)
+        ingestor = IncrementalIngestor(
+            vectorstore,
+            self.text_splitter,
+            manifest,
+            workers=self.ingest_workers,
+            batch_size=self.ingest_batch_size,
+            lexical_index=self.lexical_index,
+        )
+        changes = ingestor.sync(self.doc_paths)
+        self.last_ingest_stats = ingestor.stats
+        expected_ids = manifest.all_chunk_ids()
+        if self.lexical_index is not None and self.lexical_index.ids != expected_ids:
+            # Indice assente o non allineato (es. database creato prima dell'indice)
+            self.lexical_index.sync_from(vectorstore, expected_ids)
+            self.lexical_index.save()
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate_chunks(changes["removed"])
+        return changes
 
     def create_retriever(self):
         """Crea il retriever per la ricerca nei documenti."""
-        return self.vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 2})
+        # Con l'assemblaggio del contesto si recuperano più candidati tra cui scegliere
+        k = self.k if self.context_assembler is None else max(self.k, self.context_candidates)
+        if self.lexical_index is not None:
+            return HybridRetriever(vectorstore=self.vectorstore, index=self.lexical_index, k=k, fetch_k=max(20, k))
+        return self.vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": k})
 
-    def create_rag_chain(self):
-        """Crea la catena RAG per rispondere alle domande."""
+    def create_answer_chain(self):
+        """Crea la catena che genera la risposta a partire da contesto e domanda."""
         template = """Rispondi e conversa solamente in italiano.
         Rispondi alla domanda prediligendo le informazioni fornite nel contesto.
         Se le informazioni nel contesto non sono sufficienti per rispondere o la domanda risulta scollegata dal contesto, rispondi con la tua conoscenza acquisita durante il tuo training.
@@ -60,12 +230,16 @@ class RAGSystem:
 
         Domanda: {question}
         """
-        prompt = ChatPromptTemplate.from_template(template)
+        # Gli stadi restano accessibili per misurarli uno alla volta (vedi _generate)
+        self.prompt = ChatPromptTemplate.from_template(template)
+        self.output_parser = StrOutputParser()
+        return self.prompt | self.model | self.output_parser
+
+    def create_rag_chain(self):
+        """Crea la catena RAG per rispondere alle domande."""
         return (
-            {"context": self.retriever | self.format_docs, "question": RunnablePassthrough()}
-            | prompt
-            | self.model
-            | StrOutputParser()
+            {"context": self.retriever | self.build_context, "question": RunnablePassthrough()}
+            | self.answer_chain
         )
 
     @staticmethod
@@ -73,25 +247,268 @@ class RAGSystem:
         """Formatta i documenti recuperati in una stringa."""
         return "\n\n".join(doc.page_content for doc in docs)
 
+    @property
+    def last_context_stats(self):
+        """Statistiche del contesto dell'ultima domanda del thread o task corrente (None senza context_budget)."""
+        return self._last_context_stats.get()
+
+    def build_context(self, docs: list) -> str:
+        """Il contesto del prompt: i documenti uniti così come sono o, se configurato, assemblati nel budget di token."""
+        return self._assemble(docs)[0]
+
+    def _assemble(self, docs: list):
+        """
+        Returns:
+            tuple: Il contesto e gli ID dei chunk che contiene, la chiave della cache delle risposte
+        """
+        with self.tracer.span("build_context", docs=len(docs)) as span:
+            if self.context_assembler is None:
+                self._last_context_stats.set(None)
+                return self.format_docs(docs), [doc_chunk_id(doc) for doc in docs]
+            context, stats = self.context_assembler.assemble(docs)
+            span.set("tokens_saved", stats["tokens_saved"])
+        self._last_context_stats.set(stats)
+        with self._context_lock:
+            self.context_totals["queries"] += 1
+            for key in ("baseline_tokens", "context_tokens", "tokens_saved"):
+                self.context_totals[key] += stats[key]
+        return context, stats["chunk_ids"]
+
+    def _retrieve(self, question: str) -> list:
+        # Il tempo proprio dello span (senza il figlio "embed") è quello della ricerca nel database
+        with self.tracer.span("retrieve") as span:
+            docs = self.retriever.invoke(question)
+            span.set("docs", len(docs))
+        return docs
+
+    async def _aretrieve(self, question: str) -> list:
+        with self.tracer.span("retrieve") as span:
+            docs = await self.retriever.ainvoke(question)
+            span.set("docs", len(docs))
+        return docs
+
+    def _build_prompt(self, question: str, context: str):
+        with self.tracer.span("prompt") as span:
+            prompt = self.prompt.invoke({"context": context, "question": question})
+            if span.recording:
+                span.set("prompt_tokens", estimate_tokens(prompt.to_string()))
+        return prompt
+
+    def _generate(self, question: str, context: str) -> str:
+        """Esegue la answer_chain uno stadio alla volta, con uno span per stadio."""
+        prompt = self._build_prompt(question, context)
+        with self.tracer.span("llm"):
+            output = self.model.invoke(prompt)
+        with self.tracer.span("parse"):
+            return self.output_parser.invoke(output)
+
+    async def _agenerate(self, question: str, context: str) -> str:
+        prompt = self._build_prompt(question, context)
+        with self.tracer.span("llm"):
+            output = await self.model.ainvoke(prompt)
+        with self.tracer.span("parse"):
+            return self.output_parser.invoke(output)
+
+    def _stream_generate(self, question: str, context: str):
+        """Come _generate, ma in streaming: lo span "llm.first_token" misura il tempo al primo token,
+        il parsing dei frammenti avviene dentro lo span "llm"."""
+        prompt = self._build_prompt(question, context)
+        with self.tracer.span("llm", stream=True):
+            first_token = self.tracer.start_span("llm.first_token")
+            for token in (self.model | self.output_parser).stream(prompt):
+                first_token.end()
+                yield token
+
+    async def _astream_generate(self, question: str, context: str):
+        prompt = self._build_prompt(question, context)
+        with self.tracer.span("llm", stream=True):
+            first_token = self.tracer.start_span("llm.first_token")
+            async for token in (self.model | self.output_parser).astream(prompt):
+                first_token.end()
+                yield token
+
+    def _cached_answer(self, question: str, chunk_ids: list):
+        """
+        Cerca la risposta nella cache, per i chunk finiti nel contesto; restituisce anche
+        la funzione (memorizzata) di embedding della domanda.
+        """
+        embed_question = functools.lru_cache(maxsize=1)(self.embeddings.embed_query)
+        if self.answer_cache is None:
+            return None, embed_question
+        return self.answer_cache.lookup(question, chunk_ids, embed_question), embed_question
+
+    def _store_answer(self, question: str, chunk_ids: list, answer: str, embed_question):
+        if self.answer_cache is not None:
+            self.answer_cache.store(question, chunk_ids, answer, embed_question(question))
+
+    def _get_async_llm_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._async_llm_slots is None or self._async_llm_slots[0] is not loop:
+            self._async_llm_slots = (loop, asyncio.Semaphore(self.max_in_flight))
+        return self._async_llm_slots[1]
+
     def query(self, question: str) -> str:
         """Interroga il sistema RAG con una domanda."""
-        return self.rag_chain.invoke(question)
+        with self.tracer.span("rag.query") as span:
+            docs = self._retrieve(question)
+            context, chunk_ids = self._assemble(docs)
+            answer, embed_question = self._cached_answer(question, chunk_ids)
+            span.set("cached", answer is not None)
+            if answer is None:
+                with self._llm_slots:
+                    answer = self._generate(question, context)
+                self._store_answer(question, chunk_ids, answer, embed_question)
+            return answer
+
+    async def aquery(self, question: str) -> str:
+        """Versione asincrona di query: il recupero procede libero, la generazione rispetta max_in_flight."""
+        with self.tracer.span("rag.query") as span:
+            docs = await self._aretrieve(question)
+            context, chunk_ids = self._assemble(docs)
+            answer, embed_question = None, None
+            if self.answer_cache is not None:
+                answer, embed_question = await asyncio.to_thread(self._cached_answer, question, chunk_ids)
+            span.set("cached", answer is not None)
+            if answer is None:
+                async with self._get_async_llm_slots():
+                    answer = await self._agenerate(question, context)
+                if embed_question is not None:
+                    await asyncio.to_thread(self._store_answer, question, chunk_ids, answer, embed_question)
+            return answer
+
+    def stream_query(self, question: str):
+        """Come query, ma restituisce i token della risposta man mano che il modello li genera.
+
+        Al termine le metriche (tempo al primo token e totale) sono in self.last_metrics.
+        """
+        metrics = self.last_metrics = StreamMetrics()
+        with self.tracer.span("rag.query", stream=True) as span:
+            docs = self._retrieve(question)
+            context, chunk_ids = self._assemble(docs)
+            answer, embed_question = self._cached_answer(question, chunk_ids)
+            span.set("cached", answer is not None)
+            if answer is not None:
+                yield from timed_stream([answer], metrics)
+                return
+            parts = []
+            with self._llm_slots:
+                for token in timed_stream(self._stream_generate(question, context), metrics):
+                    parts.append(token)
+                    yield token
+            self._store_answer(question, chunk_ids, "".join(parts), embed_question)
+
+    async def astream_query(self, question: str):
+        """Versione asincrona di stream_query."""
+        metrics = self.last_metrics = StreamMetrics()
+        with self.tracer.span("rag.query", stream=True) as span:
+            docs = await self._aretrieve(question)
+            context, chunk_ids = self._assemble(docs)
+            answer, embed_question = None, None
+            if self.answer_cache is not None:
+                answer, embed_question = await asyncio.to_thread(self._cached_answer, question, chunk_ids)
+            span.set("cached", answer is not None)
+            if answer is not None:
+                metrics.mark_token()
+                metrics.finish()
+                yield answer
+                return
+            parts = []
+            async with self._get_async_llm_slots():
+                async for token in atimed_stream(self._astream_generate(question, context), metrics):
+                    parts.append(token)
+                    yield token
+            if embed_question is not None:
+                await asyncio.to_thread(self._store_answer, question, chunk_ids, "".join(parts), embed_question)
+
+    def query_batch(self, questions: list, max_workers: int = None) -> list:
+        """Risponde a più domande in parallelo.
+
+        Returns:
+            list: Le risposte nello stesso ordine delle domande; una domanda fallita
+            ha al suo posto l'eccezione sollevata, senza interrompere le altre
+        """
+        if not questions:
+            return []
+        results = []
+        with ThreadPoolExecutor(max_workers=max_workers or 2 * self.max_in_flight) as pool:
+            futures = [pool.submit(self.query, question) for question in questions]
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append(e)
+        return results
+
+    async def aquery_batch(self, questions: list) -> list:
+        """Versione asincrona di query_batch, con la stessa gestione degli errori."""
+        return await asyncio.gather(*(self.aquery(question) for question in questions), return_exceptions=True)
 
 def main():
+    parser = argparse.ArgumentParser(description="Sistema RAG sul regno di Nordland")
+    parser.add_argument("--domande", help="File con una domanda per riga da elaborare in batch")
+    parser.add_argument("--vettori", choices=["chroma", "memmap"], default="chroma", help="Database vettoriale (memmap usa db_memmap, vedi memmap_store.py import)")
+    parser.add_argument("--tipo-vettori", choices=sorted(DTYPES), default="float32", help="Tipo dei vettori salvati dal backend memmap")
+    parser.add_argument("--budget-contesto", type=int, help="Token massimi del contesto inviato al modello")
+    parser.add_argument("--traccia", help="File JSONL dove scrivere gli span di ogni domanda; all'uscita stampa i percentili per stadio")
+    parser.add_argument("--profilo", help="Attiva il profiler a campionamento e salva gli stack in questo file")
+    args = parser.parse_args()
+
+    aggregator = SpanAggregator()
+    tracer = Tracer([aggregator, JsonlExporter(args.traccia)]) if args.traccia else None
+    profiler = SamplingProfiler().start() if args.profilo else None
+    try:
+        run(args, tracer)
+    finally:
+        if tracer is not None:
+            tracer.close()
+            print(f"\n{aggregator}")
+        if profiler is not None:
+            profiler.stop()
+            profiler.write_collapsed(args.profilo)
+            print(f"\nFunzioni più campionate ({profiler.samples} campioni, stack in {args.profilo}):")
+            for label, count, share in profiler.top():
+                print(f"  {share:6.1%}  {label}")
+
+
+def run(args, tracer):
     rag = RAGSystem(
         model_url="https://huge-ape-apparent.ngrok-free.app",
         model_name="deepseek-r1:8b",
         doc_paths=["./dati/ReEric.txt"],
         embed_url="https://huge-ape-apparent.ngrok-free.app",
         embed_model="nomic-embed-text",
-        persist_dir="db_vectoriale",
+        persist_dir="db_vectoriale" if args.vettori == "chroma" else "db_memmap",
+        incremental=True,
+        embed_cache_dir="cache_embedding",
+        answer_cache=AnswerCache(similarity_threshold=0.95, ttl=24 * 3600),
+        vector_backend=args.vettori,
+        vector_dtype=args.tipo_vettori,
+        context_budget=args.budget_contesto,
+        tracer=tracer,
     )
 
+    if args.domande:
+        with open(args.domande, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+        for question, answer in zip(questions, rag.query_batch(questions)):
+            if isinstance(answer, Exception):
+                answer = f"Errore: {answer}"
+            print(f"\nDomanda: {question}\nRisposta: {answer}")
+        if rag.context_assembler is not None:
+            print(f"\nToken del contesto: {rag.context_totals}")
+        return
+
     while True:
         question = input("\nFai una domanda (o scrivi '/exit' per uscire): ")
         if question.lower() == "/exit":
             break
-        print("\nRisposta:", rag.query(question))
+        print("\nRisposta: ", end="", flush=True)
+        for token in rag.stream_query(question):
+            print(token, end="", flush=True)
+        if rag.last_context_stats is not None:
+            stats = rag.last_context_stats
+            print(f"\n(contesto: {stats['context_tokens']} token, {stats['tokens_saved']} risparmiati)", end="")
+        print(f"\n({rag.last_metrics})")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
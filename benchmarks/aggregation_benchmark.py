@@ -0,0 +1,181 @@
+"""
+Confronto tra la somma dei pari e prodotto dei dispari originale (13-02-2025_Esercizi/es2)
+e il motore a blocchi di aggregatore.py.
+
+Per ogni dimensione genera un file di numeri casuali e misura, ognuno in un processo
+nuovo perché la memoria di picco sia quella dello stadio:
+- originale: la funzione di partenza, con i numeri già in memoria (solo fino a --reference-max);
+- vettoriale: operazioni.somma_pari_prodotto_dispari con i numeri già in memoria (fino a --in-memory-max);
+- streaming: aggrega_file che legge il file a blocchi;
+- processi: aggrega_file con un pool di --processi processi.
+I risultati di tutti gli stadi devono coincidere, e su alcuni input piccoli (anche float
+e interi oltre int64) la nuova funzione deve restituire esattamente quelli della originale.
+
+Esempio:
+    python benchmarks/aggregation_benchmark.py --sizes 1000000,10000000,100000000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from harness import add_report_arguments, peak_rss_mb, report
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "13-02-2025_Esercizi", "es2"))
+
+STAGES = ("originale", "vettoriale", "streaming", "processi")
+# Input piccoli su cui la nuova funzione deve restituire esattamente il risultato originale
+CASI_EQUIVALENZA = (
+    (),
+    (2, 4, 6),
+    (1, 2, 3, 4, 5),
+    (1.5, 3),
+    (1.1, 2.3, 3.7, 5, 7.9, 9.3, 11.0),
+    (2.0, 4, -3),
+    (2**64 + 1, -(2**70) - 3, 2**63, 7),
+    (True, 3, 4),
+)
+
+
+def somma_pari_prodotto_dispari_originale(*numeri):
+    """La versione di partenza di operazioni.somma_pari_prodotto_dispari."""
+    somma_pari = sum(n for n in numeri if n % 2 == 0)
+    prodotto_dispari = 1
+    almeno_un_dispari = False
+
+    for n in numeri:
+        if n % 2 != 0:
+            prodotto_dispari *= n
+            almeno_un_dispari = True
+
+    if not almeno_un_dispari:
+        prodotto_dispari = 0
+
+    return somma_pari, prodotto_dispari
+
+
+def check_equivalence() -> dict:
+    """Confronta la funzione originale e operazioni.somma_pari_prodotto_dispari sui CASI_EQUIVALENZA."""
+    from operazioni import somma_pari_prodotto_dispari
+
+    mismatches = []
+    for numeri in CASI_EQUIVALENZA:
+        expected = somma_pari_prodotto_dispari_originale(*numeri)
+        try:
+            result = somma_pari_prodotto_dispari(*numeri)
+        except Exception as e:
+            result = f"{type(e).__name__}: {e}"
+        if result != expected or [type(v) for v in result] != [type(v) for v in expected]:
+            mismatches.append({"input": repr(numeri), "expected": repr(expected), "result": repr(result)})
+    return {"cases": len(CASI_EQUIVALENZA), "mismatches": mismatches}
+
+
+def write_numbers(path: str, size: int, low: int, high: int, seed: int):
+    """Scrive size numeri casuali in [low, high], separati da virgole e a capo ogni 100 mila."""
+    rng = np.random.default_rng(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for start in range(0, size, 100_000):
+            values = rng.integers(low, high, size=min(100_000, size - start), endpoint=True)
+            f.write(",".join(map(str, values.tolist())) + "\n")
+
+
+def fingerprint(somma: int, prodotto: int) -> dict:
+    """Il risultato in forma confrontabile senza stampare un prodotto di milioni di cifre."""
+    from aggregatore import MODULO_CONTROLLO
+
+    return {"somma_pari": somma, "prodotto_bits": prodotto.bit_length(), "prodotto_mod": prodotto % MODULO_CONTROLLO}
+
+
+def run_probe(stage: str, path: str, processi: int):
+    """Eseguita in un processo nuovo: tempo dello stadio, risultato e memoria di picco."""
+    from aggregatore import aggrega_file
+    from operazioni import somma_pari_prodotto_dispari
+
+    if stage in ("originale", "vettoriale"):
+        with open(path, encoding="utf-8") as f:
+            numeri = [int(n) for n in f.read().replace("\n", ",").split(",") if n]
+        function = somma_pari_prodotto_dispari_originale if stage == "originale" else somma_pari_prodotto_dispari
+        start = time.perf_counter()
+        somma, prodotto = function(*numeri)
+        seconds = time.perf_counter() - start
+    else:
+        start = time.perf_counter()
+        with open(path, encoding="utf-8") as f:
+            somma, prodotto = aggrega_file(f, processi=processi if stage == "processi" else 0).risultato()
+        seconds = time.perf_counter() - start
+    print(json.dumps({"seconds": seconds, "peak_rss_mb": peak_rss_mb(), **fingerprint(somma, prodotto)}))
+
+
+def measure_stage(stage: str, path: str, size: int, processi: int) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), "--probe", stage, path, "--processi", str(processi)]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["numbers_per_s"] = size / result["seconds"] if result["seconds"] > 0 else None
+    return result
+
+
+def run_size(size: int, args, workdir: str) -> dict:
+    path = os.path.join(workdir, f"numeri_{size}.txt")
+    start = time.perf_counter()
+    write_numbers(path, size, args.low, args.high, args.seed)
+    stages = {"generate": {"seconds": time.perf_counter() - start, "size_bytes": os.path.getsize(path)}}
+
+    limits = {"originale": args.reference_max, "vettoriale": args.in_memory_max}
+    expected = None
+    for stage in STAGES:
+        if size > limits.get(stage, size) or (stage == "processi" and not args.processi):
+            stages[stage] = {"skipped": True}
+            continue
+        print(f"  {stage}...", file=sys.stderr)
+        result = measure_stage(stage, path, size, args.processi)
+        outcome = {key: result.pop(key) for key in ("somma_pari", "prodotto_bits", "prodotto_mod")}
+        expected = expected or outcome
+        result["match"] = outcome == expected
+        if "seconds" in stages.get("originale", {}):
+            result["speedup"] = stages["originale"]["seconds"] / result["seconds"]
+        stages[stage] = result
+    os.remove(path)
+    return {"result": expected, "stages": stages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronto tra la funzione originale e il motore a blocchi")
+    parser.add_argument("--sizes", default="1000000,10000000", help="Quantità di numeri da aggregare, separate da virgole")
+    parser.add_argument("--low", type=int, default=-1000, help="Valore minimo dei numeri generati")
+    parser.add_argument("--high", type=int, default=1000, help="Valore massimo dei numeri generati")
+    parser.add_argument("--reference-max", type=int, default=1_000_000, help="Numeri massimi per la funzione originale (tempo quadratico)")
+    parser.add_argument("--in-memory-max", type=int, default=10_000_000, help="Numeri massimi per gli stadi con tutti i numeri in memoria")
+    parser.add_argument("--processi", type=int, default=os.cpu_count(), help="Processi dello stadio con il pool (0 = non eseguirlo)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--probe", nargs=2, metavar=("STAGE", "FILE"), help=argparse.SUPPRESS)
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    if args.probe:
+        run_probe(args.probe[0], args.probe[1], args.processi)
+        return
+
+    results = {
+        "config": {k: getattr(args, k) for k in ("low", "high", "processi", "seed")},
+        "equivalence": check_equivalence(),
+        "results": {},
+        "stages": {},
+    }
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as workdir:
+        for size in (int(s) for s in args.sizes.split(",")):
+            print(f"{size} numeri...", file=sys.stderr)
+            outcome = run_size(size, args, workdir)
+            for name, stage in outcome.pop("stages").items():
+                results["stages"][f"{size}/{name}"] = stage
+            results["results"][str(size)] = outcome["result"]
+    code = report(results, args.out, args.baseline, args.save_baseline, args.tolerance)
+    sys.exit(code or int(bool(results["equivalence"]["mismatches"])))
+
+
+if __name__ == "__main__":
+    main()
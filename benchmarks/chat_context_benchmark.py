@@ -0,0 +1,65 @@
+"""
+Benchmark dello StatefulChatbot contro il server Ollama finto (common/fake_ollama.py).
+
+Confronta il prompt completo a ogni turno con il riuso del contesto di Ollama
+(reuse_context=True): per ogni turno riporta i token del prompt che il server ha
+dovuto elaborare, oltre a latenza e throughput dei turni. --prefill-delay dà un
+costo in secondi a ogni token elaborato, così la differenza si vede anche nei tempi.
+
+Esempio:
+    python benchmarks/chat_context_benchmark.py --turns 40 --prefill-delay 0.0005
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "20-03-2025_Generative AI"))
+from stateful_chatbot import StatefulChatbot
+from harness import add_report_arguments, measure, report
+from common.fake_ollama import FakeOllama
+from common.ollama_client import OllamaClient, PooledOllama
+
+
+def run_mode(server: FakeOllama, reuse_context: bool, args) -> dict:
+    chatbot = StatefulChatbot(
+        llm=PooledOllama(client=OllamaClient(server.url), model=f"finto-{reuse_context}"),
+        token_budget=args.token_budget,
+        reuse_context=reuse_context,
+    )
+    prompt_tokens = []
+
+    def turn(index):
+        chatbot.chat(f"Domanda {index}: raccontami qualcosa del regno di Nordland e di re Eric, parte {index}.")
+        prompt_tokens.append(server.requests[-1]["prompt_eval_count"])
+
+    stage = measure(turn, range(args.turns), warmup=0)
+    stage["prompt_tokens_per_turn"] = prompt_tokens
+    stage["prompt_tokens_total"] = sum(prompt_tokens)
+    stage["prompt_tokens_last"] = prompt_tokens[-1]
+    if reuse_context:
+        stage.update(chatbot.context_stats)
+    return stage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Token del prompt per turno con e senza il contesto di Ollama")
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--token-budget", type=int, default=1500, help="Budget di token della memoria del chatbot")
+    parser.add_argument("--prefill-delay", type=float, default=0.0, help="Secondi per token del prompt elaborato dal server finto")
+    parser.add_argument("--response-words", type=int, default=24, help="Parole di ogni risposta del server finto")
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    results = {
+        "config": {k: getattr(args, k) for k in ("turns", "token_budget", "prefill_delay", "response_words")},
+        "stages": {},
+    }
+    with FakeOllama(response_words=args.response_words, prefill_delay=args.prefill_delay) as server:
+        results["stages"]["full_prompt"] = run_mode(server, False, args)
+        results["stages"]["reuse_context"] = run_mode(server, True, args)
+    sys.exit(report(results, args.out, args.baseline, args.save_baseline, args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Funzioni comuni ai benchmark: misura degli stadi, memoria di picco, report JSON
+e confronto con un baseline salvato per segnalare le regressioni.
+"""
+import json
+import os
+import platform
+import resource
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.metrics import LatencyHistogram
+
+
+def peak_rss_mb() -> float:
+    """Memoria residente di picco del processo (ru_maxrss è in KB su Linux, in byte su macOS)."""
+    # Su Linux ru_maxrss di un processo avviato con subprocess parte dal picco del padre
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure(fn, items, warmup: int = 5) -> dict:
+    """
+    Esegue fn su ogni elemento e ne misura la latenza; i primi warmup elementi
+    non vengono conteggiati.
+    Returns:
+        dict: Percentili in ms, throughput (elementi/s) e memoria di picco in MB
+    """
+    histogram = LatencyHistogram(max_samples=1_000_000)
+    measured_time = 0.0
+    for index, item in enumerate(items):
+        start = time.perf_counter()
+        fn(item)
+        elapsed = time.perf_counter() - start
+        if index >= warmup:
+            histogram.record(elapsed)
+            measured_time += elapsed
+    result = histogram.summary()
+    result["throughput_per_s"] = histogram.count / measured_time if measured_time > 0 else None
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.10) -> list:
+    """
+    Confronta gli stadi con quelli del baseline.
+    Una regressione è una latenza (p50/p95) o una memoria più alta, oppure un
+    throughput o una recall più bassi, oltre la tolleranza relativa.
+    Returns:
+        list: Descrizione delle regressioni trovate
+    """
+    regressions = []
+    for stage, current in results.get("stages", {}).items():
+        previous = baseline.get("stages", {}).get(stage)
+        if not previous or "skipped" in current or "skipped" in previous:
+            continue
+        for key, higher_is_worse in (("p50_ms", True), ("p95_ms", True), ("throughput_per_s", False), ("peak_rss_mb", True), ("recall_at_k", False)):
+            old, new = previous.get(key), current.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change > tolerance) if higher_is_worse else (change < -tolerance):
+                regressions.append(f"{stage}.{key}: {old:.3f} -> {new:.3f} ({change:+.1%})")
+    return regressions
+
+
+def report(results: dict, out_path: str = None, baseline_path: str = None, save_baseline: str = None, tolerance: float = 0.10) -> int:
+    """
+    Stampa e salva i risultati, li confronta con il baseline se presente.
+    Returns:
+        int: Codice di uscita, 1 se ci sono regressioni
+    """
+    results.setdefault("environment", environment())
+    text = json.dumps(results, indent=2)
+    print(text)
+    if out_path:
+        with open(out_path, "w") as f:
+            f.write(text)
+    if save_baseline:
+        with open(save_baseline, "w") as f:
+            f.write(text)
+        print(f"Baseline salvato in {save_baseline}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            regressions = compare(results, json.load(f), tolerance)
+        if regressions:
+            print(f"\nRegressioni rispetto a {baseline_path} (tolleranza {tolerance:.0%}):")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNessuna regressione rispetto a {baseline_path}")
+    return 0
+
+
+def add_report_arguments(parser):
+    parser.add_argument("--out", help="File JSON dove salvare i risultati")
+    parser.add_argument("--baseline", help="Risultati precedenti con cui confrontarsi")
+    parser.add_argument("--save-baseline", help="Salva questi risultati come nuovo baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Peggioramento relativo tollerato (0.10 = 10%%)")
@@ -0,0 +1,85 @@
+"""
+Benchmark di OllamaClient contro il server Ollama finto con ritardi ed errori iniettati.
+
+Confronta tre configurazioni del client sulle stesse richieste a /api/generate:
+- plain: un solo tentativo, senza richieste duplicate;
+- retry: tentativi con backoff e jitter;
+- hedged: tentativi e una copia della richiesta dopo --hedge-after secondi (con retry_generate).
+Per ognuna riporta latenze, richieste riuscite e contatori del client. Lo stadio
+outage simula un server che non risponde: con il circuito aperto le chiamate
+falliscono subito invece di esaurire ogni volta tentativi e attese.
+
+Esempio:
+    python benchmarks/ollama_client_benchmark.py --requests 300 --slow-rate 0.05 --error-rate 0.05
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from harness import add_report_arguments, measure, report
+from common.fake_ollama import FakeOllama
+from common.ollama_client import CircuitBreaker, OllamaClient, OllamaError, RetryPolicy
+
+
+def configurations(args) -> dict:
+    return {
+        "plain": {"retry": RetryPolicy(attempts=1), "breaker": CircuitBreaker(failure_threshold=0)},
+        "retry": {"retry": RetryPolicy(attempts=args.attempts, base_delay=args.base_delay), "breaker": CircuitBreaker(failure_threshold=0)},
+        "hedged": {"retry": RetryPolicy(attempts=args.attempts, base_delay=args.base_delay), "breaker": CircuitBreaker(failure_threshold=0), "hedge_after": args.hedge_after, "retry_generate": True},
+    }
+
+
+def run_client(client: OllamaClient, requests: int, deadline: float = None) -> dict:
+    errors = []
+
+    def call(index):
+        try:
+            client.generate("finto", f"Domanda numero {index} sul regno di Nordland", deadline=deadline)
+        except (OllamaError, OSError) as e:
+            errors.append(type(e).__name__)
+
+    stage = measure(call, range(requests), warmup=0)
+    stage["success_rate"] = 1 - len(errors) / requests
+    stage["errors"] = {name: errors.count(name) for name in sorted(set(errors))}
+    stats = client.stats()
+    stage.update({key: stats[key] for key in ("attempts", "retries", "hedges", "hedge_wins", "rejected", "deadline_exceeded")})
+    client.close()
+    return stage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tentativi, richieste duplicate e circuito del client Ollama")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.005, help="Latenza di ogni risposta del server finto")
+    parser.add_argument("--slow-rate", type=float, default=0.05, help="Frazione di richieste lente")
+    parser.add_argument("--slow-latency", type=float, default=0.3, help="Secondi in più delle richieste lente")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Frazione di richieste con errore 503")
+    parser.add_argument("--attempts", type=int, default=3)
+    parser.add_argument("--base-delay", type=float, default=0.02, help="Attesa massima dopo il primo errore")
+    parser.add_argument("--hedge-after", type=float, default=0.03, help="Secondi dopo cui inviare la copia della richiesta")
+    parser.add_argument("--seed", type=int, default=0)
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    config_keys = ("requests", "latency", "slow_rate", "slow_latency", "error_rate", "attempts", "base_delay", "hedge_after", "seed")
+    results = {"config": {k: getattr(args, k) for k in config_keys}, "stages": {}}
+    for name, options in configurations(args).items():
+        # Stesso seme per ogni configurazione: le stesse richieste sono lente o falliscono
+        with FakeOllama(latency=args.latency, slow_rate=args.slow_rate, slow_latency=args.slow_latency, error_rate=args.error_rate, seed=args.seed) as server:
+            results["stages"][name] = run_client(OllamaClient(server.url, **options), args.requests)
+            results["stages"][name]["injected"] = dict(server.injected)
+
+    # Server che chiude tutte le connessioni: con e senza circuito
+    for name, breaker in (("outage/no_breaker", CircuitBreaker(failure_threshold=0)), ("outage/breaker", CircuitBreaker(failure_threshold=5, reset_timeout=60))):
+        with FakeOllama(seed=args.seed) as server:
+            server.fail_next(10 * args.requests, status=None)
+            # Le connessioni chiuse dopo l'invio si ripetono solo con retry_generate
+            client = OllamaClient(server.url, retry=RetryPolicy(attempts=args.attempts, base_delay=args.base_delay), breaker=breaker, retry_generate=True)
+            results["stages"][name] = run_client(client, min(args.requests, 50))
+            results["stages"][name]["server_requests"] = server.injected["dropped"]
+    sys.exit(report(results, args.out, args.baseline, args.save_baseline, args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
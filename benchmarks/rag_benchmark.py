@@ -0,0 +1,212 @@
+"""
+Benchmark end-to-end del RAGSystem senza Ollama: LLM ed embedding sono sostituiti
+da stub locali e deterministici (rag_stubs.py).
+
+Per ogni dimensione del corpus (ReEric.txt più N documenti sintetici) misura
+separatamente le fasi di ingestione (caricamento, suddivisione, embedding,
+inserimento nel database), il recupero, la generazione e la domanda completa,
+e calcola la recall@k sulle domande etichettate: quelle di
+fixtures/rag_questions.json e una per documento sintetico. Una domanda è
+recuperata se uno dei k chunk contiene la frase attesa.
+
+Esempi:
+    python benchmarks/rag_benchmark.py --sizes 0,100,1000
+    python benchmarks/rag_benchmark.py --chunk-size 500 --chunk-overlap 50 --k 4 --baseline baseline_rag.json
+    python benchmarks/rag_benchmark.py --sizes 1000 --trace    # percentili per stadio della domanda completa
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "27-03-2025_RAG"))
+from langchain_community.document_loaders import TextLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from rag import RAGSystem
+from context_assembly import estimate_tokens
+from harness import add_report_arguments, measure, peak_rss_mb, report
+from rag_stubs import HashingEmbeddings, StubLLM, TimedEmbeddings
+from common.metrics import LatencyHistogram, StreamMetrics, timed_stream
+from common.tracing import SpanAggregator, Tracer
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "rag_questions.json")
+
+SYLLABLES = ["ba", "ce", "di", "fo", "gu", "la", "me", "ni", "po", "ru", "sa", "te", "vi", "zo", "ran", "del", "mor", "tis"]
+
+
+def _word(rng: random.Random, syllables: int) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(syllables))
+
+
+def synthetic_corpus(directory: str, count: int, words_per_doc: int = 180, seed: int = 0):
+    """
+    Scrive count documenti di parole inventate, ognuno con un fatto univoco
+    (il nome del custode di un archivio numerato).
+    Returns:
+        tuple: Percorsi dei file e domande etichettate (domanda, frase attesa)
+    """
+    rng = random.Random(seed)
+    vocabulary = [_word(rng, rng.randint(2, 4)) for _ in range(2000)]
+    paths, questions = [], []
+    for i in range(count):
+        name = _word(rng, 4).capitalize()
+        words = rng.choices(vocabulary, k=words_per_doc)
+        sentences = [" ".join(words[j:j + 12]).capitalize() + "." for j in range(0, len(words), 12)]
+        sentences.insert(rng.randrange(len(sentences) + 1), f"Il custode dell'archivio {i} si chiama {name}.")
+        path = os.path.join(directory, f"documento_{i:05d}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(" ".join(sentences))
+        paths.append(path)
+        questions.append((f"Come si chiama il custode dell'archivio {i}?", name))
+    return paths, questions
+
+
+def load_questions(path: str = QUESTIONS_PATH):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return os.path.join(ROOT, data["source"]), [(q["question"], q["evidence"]) for q in data["questions"]]
+
+
+def phase(seconds: float, items: int) -> dict:
+    return {"seconds": seconds, "items": items, "throughput_per_s": items / seconds if seconds > 0 else None, "peak_rss_mb": peak_rss_mb()}
+
+
+def run_size(size: int, args, workdir: str) -> dict:
+    source, questions = load_questions()
+    corpus_dir = os.path.join(workdir, f"corpus_{size}")
+    os.makedirs(corpus_dir)
+    synthetic_paths, synthetic_questions = synthetic_corpus(corpus_dir, size, seed=args.seed)
+    paths = [source] + synthetic_paths
+    questions = questions + random.Random(args.seed).sample(synthetic_questions, min(args.questions, size))
+
+    start = time.perf_counter()
+    documents = [doc for path in paths for doc in TextLoader(path).load()]
+    load_seconds = time.perf_counter() - start
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    start = time.perf_counter()
+    chunks = splitter.split_documents(documents)
+    split_seconds = time.perf_counter() - start
+
+    # L'ingestione del RAGSystem ripete caricamento e suddivisione, sovrapponendole
+    # a embedding e inserimento: il tempo totale misura l'effetto della sovrapposizione
+    embeddings = TimedEmbeddings(HashingEmbeddings(args.dim))
+    tracer = Tracer([SpanAggregator()]) if args.trace else None
+    start = time.perf_counter()
+    rag = RAGSystem(
+        model_url=None,
+        model_name="stub",
+        doc_paths=paths,
+        embed_url=None,
+        embed_model="hashing",
+        persist_dir=os.path.join(workdir, f"db_{size}"),
+        incremental=True,
+        llm=StubLLM(max_tokens=args.answer_tokens, token_delay=args.token_delay),
+        embeddings=embeddings,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        k=args.k,
+        ingest_workers=args.ingest_workers,
+        ingest_batch_size=args.ingest_batch_size,
+        context_budget=args.context_budget,
+        context_candidates=args.context_candidates,
+        tracer=tracer,
+    )
+    ingest_seconds = time.perf_counter() - start
+    embed_seconds = embeddings.document_seconds
+
+    stages = {
+        "load": phase(load_seconds, len(paths)),
+        "split": phase(split_seconds, len(chunks)),
+        "embed": phase(embed_seconds, embeddings.documents),
+        "upsert": phase(max(rag.last_ingest_stats["write_seconds"] - embed_seconds, 0.0), embeddings.documents),
+        "ingest_total": phase(ingest_seconds, len(chunks)),
+    }
+
+    warmup = questions[: args.warmup]
+    texts = [q for q, _ in questions]
+    retrieved = []
+    stages["retrieval"] = measure(lambda q: retrieved.append(rag.retriever.invoke(q)), [q for q, _ in warmup] + texts, len(warmup))
+    retrieved = retrieved[len(warmup):]
+    hits = sum(
+        any(evidence.lower() in doc.page_content.lower() for doc in docs)
+        for docs, (_, evidence) in zip(retrieved, questions)
+    )
+    stages["retrieval"]["recall_at_k"] = hits / len(questions)
+
+    contexts = [rag.build_context(docs) for docs in retrieved]
+    # Recall sul contesto inviato al modello, dopo l'eventuale selezione nel budget di token
+    context_hits = sum(evidence.lower() in context.lower() for context, (_, evidence) in zip(contexts, questions))
+    first_token = LatencyHistogram()
+
+    def generate(item):
+        metrics = StreamMetrics()
+        for _ in timed_stream(rag.answer_chain.stream({"context": item[0], "question": item[1]}), metrics):
+            pass
+        first_token.record(metrics.time_to_first_token)
+
+    stages["generation"] = measure(generate, list(zip(contexts, texts)), 0)
+    stages["generation"]["time_to_first_token"] = first_token.summary()
+    stages["generation"]["context_recall"] = context_hits / len(questions)
+    stages["generation"]["context_tokens_mean"] = sum(estimate_tokens(c) for c in contexts) / len(contexts)
+    if rag.context_assembler is not None:
+        stages["generation"]["tokens_saved_mean"] = rag.context_totals["tokens_saved"] / rag.context_totals["queries"]
+    if tracer is not None:
+        # Solo gli span delle domande complete, non quelli dell'ingestione e delle fasi precedenti
+        aggregator = tracer.exporters[0] = SpanAggregator()
+    stages["query"] = measure(rag.query, texts, 0)
+
+    outcome = {
+        "documents": len(paths),
+        "chunks": len(chunks),
+        "questions": len(questions),
+        "stages": stages,
+    }
+    if tracer is not None:
+        outcome["spans"] = aggregator.summary()
+        print(f"\nSpan delle domande ({size} documenti sintetici):\n{aggregator}", file=sys.stderr)
+    return outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del RAG con LLM ed embedding locali")
+    parser.add_argument("--sizes", default="0,100,1000", help="Documenti sintetici da aggiungere a ReEric.txt, separati da virgole")
+    parser.add_argument("--questions", type=int, default=50, help="Domande sintetiche per dimensione del corpus")
+    parser.add_argument("--chunk-size", type=int, default=RAGSystem.CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=RAGSystem.CHUNK_OVERLAP)
+    parser.add_argument("--k", type=int, default=2, help="Chunk recuperati per domanda")
+    parser.add_argument("--dim", type=int, default=384, help="Dimensione degli embedding a feature hashing")
+    parser.add_argument("--answer-tokens", type=int, default=64, help="Token generati dallo stub LLM")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Secondi per token simulati dallo stub LLM")
+    parser.add_argument("--ingest-workers", type=int, default=0, help="Processi che suddividono i documenti")
+    parser.add_argument("--ingest-batch-size", type=int, default=64, help="Chunk per lotto di embedding e inserimento")
+    parser.add_argument("--context-budget", type=int, help="Token massimi del contesto; se assente i chunk vengono uniti così come sono")
+    parser.add_argument("--context-candidates", type=int, help="Chunk recuperati tra cui scegliere il contesto (di default 4 * k)")
+    parser.add_argument("--trace", action="store_true", help="Registra gli span di ogni stadio della domanda completa e ne riporta i percentili")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    results = {
+        "config": {k: getattr(args, k) for k in ("chunk_size", "chunk_overlap", "k", "dim", "answer_tokens", "token_delay", "ingest_workers", "ingest_batch_size", "context_budget", "context_candidates", "trace", "seed")},
+        "corpora": {},
+        "stages": {},
+    }
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as workdir:
+        for size in sizes:
+            print(f"Corpus con {size} documenti sintetici...", file=sys.stderr)
+            outcome = run_size(size, args, workdir)
+            for name, stage in outcome.pop("stages").items():
+                results["stages"][f"{size}/{name}"] = stage
+            results["corpora"][str(size)] = outcome
+    sys.exit(report(results, args.out, args.baseline, args.save_baseline, args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Sostituti locali e deterministici di LLM ed embedding per i benchmark del RAG:
+nessuna chiamata di rete, stessi risultati a ogni esecuzione.
+"""
+import functools
+import hashlib
+import os
+import sys
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "27-03-2025_RAG"))
+# Stessa suddivisione in parole dell'indice BM25, così i due retriever vedono gli stessi termini
+from lexical_index import tokenize
+
+
+@functools.lru_cache(maxsize=200_000)
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Embedding a feature hashing: ogni parola (esclusi articoli e preposizioni) finisce
+    in una delle dim componenti con segno pseudo-casuale; il vettore è normalizzato.
+    Le domande trovano i chunk con cui condividono le parole, come una ricerca lessicale.
+    delay simula la latenza di rete di ogni chiamata a un servizio di embedding remoto.
+    """
+
+    def __init__(self, dim: int = 384, delay: float = 0.0):
+        self.dim = dim
+        self.delay = delay
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            h = _token_hash(token)
+            vector[h % self.dim] += 1.0 if h >> 63 else -1.0
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.delay:
+            time.sleep(self.delay)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.delay:
+            time.sleep(self.delay)
+        return self._embed(text)
+
+
+class TimedEmbeddings(Embeddings):
+    """Inoltra le chiamate a un altro modello di embedding e ne accumula i tempi."""
+
+    def __init__(self, inner: Embeddings):
+        self.inner = inner
+        self.document_seconds = 0.0
+        self.documents = 0
+        self.query_seconds = 0.0
+        self.queries = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        vectors = self.inner.embed_documents(texts)
+        self.document_seconds += time.perf_counter() - start
+        self.documents += len(texts)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        start = time.perf_counter()
+        vector = self.inner.embed_query(text)
+        self.query_seconds += time.perf_counter() - start
+        self.queries += 1
+        return vector
+
+
+class StubLLM(LLM):
+    """
+    LLM deterministico: risponde con le prime max_tokens parole del contesto
+    presente nel prompt, una parola per token, con un ritardo opzionale per
+    token per simulare la velocità di generazione di un modello vero.
+    """
+
+    max_tokens: int = 64
+    token_delay: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"max_tokens": self.max_tokens, "token_delay": self.token_delay}
+
+    def _tokens(self, prompt: str) -> List[str]:
+        context = prompt.split("Contesto:", 1)[-1].split("Domanda:", 1)[0]
+        words = context.split()[: self.max_tokens] or ["Nessun", "contesto."]
+        return [word + " " for word in words]
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        tokens = self._tokens(prompt)
+        if self.token_delay:
+            time.sleep(self.token_delay * len(tokens))
+        return "".join(tokens)
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        for token in self._tokens(prompt):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            chunk = GenerationChunk(text=token)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
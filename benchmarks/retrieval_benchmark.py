@@ -0,0 +1,121 @@
+"""
+Confronto tra il retriever vettoriale e quello ibrido (BM25 + vettori con RRF).
+
+Sullo stesso corpus di rag_benchmark.py (ReEric.txt più N documenti sintetici)
+misura la costruzione dell'indice BM25 e la sua dimensione su disco, poi latenza e
+recall@k dei due retriever. --embed-delay simula la latenza di rete della chiamata
+di embedding, che il retriever ibrido salta quando il risultato lessicale è netto.
+
+Esempio:
+    python benchmarks/retrieval_benchmark.py --sizes 0,1000 --embed-delay 0.02
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from rag_benchmark import load_questions, synthetic_corpus
+from lexical_index import BM25Index
+from rag import RAGSystem
+from harness import add_report_arguments, measure, peak_rss_mb, report
+from rag_stubs import HashingEmbeddings, StubLLM, TimedEmbeddings
+
+
+def recall(retrieved: list, questions: list) -> float:
+    hits = sum(
+        any(evidence.lower() in doc.page_content.lower() for doc in docs)
+        for docs, (_, evidence) in zip(retrieved, questions)
+    )
+    return hits / len(questions)
+
+
+def run_size(size: int, args, workdir: str) -> dict:
+    source, questions = load_questions()
+    corpus_dir = os.path.join(workdir, f"corpus_{size}")
+    os.makedirs(corpus_dir)
+    synthetic_paths, synthetic_questions = synthetic_corpus(corpus_dir, size, seed=args.seed)
+    questions = questions + random.Random(args.seed).sample(synthetic_questions, min(args.questions, size))
+
+    embeddings = TimedEmbeddings(HashingEmbeddings(args.dim, delay=args.embed_delay))
+    persist_dir = os.path.join(workdir, f"db_{size}")
+    rag = RAGSystem(
+        model_url=None,
+        model_name="stub",
+        doc_paths=[source] + synthetic_paths,
+        embed_url=None,
+        embed_model="hashing",
+        persist_dir=persist_dir,
+        incremental=True,
+        llm=StubLLM(),
+        embeddings=embeddings,
+        k=args.k,
+        retrieval="hybrid",
+    )
+
+    # Ricostruzione da zero dell'indice, con gli stessi testi già nel database
+    stored = rag.vectorstore.get(include=["documents"])
+    index = BM25Index(os.path.join(workdir, f"index_{size}"))
+    start = time.perf_counter()
+    index.add(stored["ids"], stored["documents"])
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    index.save()
+    save_seconds = time.perf_counter() - start
+
+    stages = {
+        "index_build": {
+            "seconds": build_seconds,
+            "save_seconds": save_seconds,
+            "throughput_per_s": len(stored["ids"]) / build_seconds if build_seconds > 0 else None,
+            "size_bytes": os.path.getsize(index.path),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    }
+
+    warmup = [q for q, _ in questions[: args.warmup]]
+    texts = [q for q, _ in questions]
+    retrievers = {
+        "vector": rag.vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": args.k}),
+        "hybrid": rag.retriever,
+    }
+    for name, retriever in retrievers.items():
+        retrieved = []
+        queries_before = embeddings.queries
+        stages[name] = measure(lambda q: retrieved.append(retriever.invoke(q)), warmup + texts, len(warmup))
+        stages[name]["recall_at_k"] = recall(retrieved[len(warmup):], questions)
+        stages[name]["embedding_calls"] = embeddings.queries - queries_before
+    stages["hybrid"].update(rag.retriever.stats())
+    return {"chunks": len(stored["ids"]), "questions": len(questions), "stages": stages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronto tra retriever vettoriale e ibrido")
+    parser.add_argument("--sizes", default="0,100,1000", help="Documenti sintetici da aggiungere a ReEric.txt, separati da virgole")
+    parser.add_argument("--questions", type=int, default=50, help="Domande sintetiche per dimensione del corpus")
+    parser.add_argument("--k", type=int, default=2, help="Chunk recuperati per domanda")
+    parser.add_argument("--dim", type=int, default=384, help="Dimensione degli embedding a feature hashing")
+    parser.add_argument("--embed-delay", type=float, default=0.0, help="Latenza simulata di ogni chiamata di embedding, in secondi")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    results = {
+        "config": {k: getattr(args, k) for k in ("k", "dim", "embed_delay", "seed")},
+        "corpora": {},
+        "stages": {},
+    }
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as workdir:
+        for size in (int(s) for s in args.sizes.split(",")):
+            print(f"Corpus con {size} documenti sintetici...", file=sys.stderr)
+            outcome = run_size(size, args, workdir)
+            for name, stage in outcome.pop("stages").items():
+                results["stages"][f"{size}/{name}"] = stage
+            results["corpora"][str(size)] = outcome
+    sys.exit(report(results, args.out, args.baseline, args.save_baseline, args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
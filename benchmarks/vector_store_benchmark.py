@@ -0,0 +1,212 @@
+"""
+Confronto tra Chroma e MemmapVectorStore (float32, int8 e int8 con ricerca IVF).
+
+Sullo stesso corpus di rag_benchmark.py (ReEric.txt più N documenti sintetici)
+il database Chroma viene creato dal RAGSystem e poi importato nel formato memmap.
+Per ogni backend misura lo spazio su disco, il tempo di caricamento in un processo
+nuovo (import delle librerie, apertura e prima ricerca, con la memoria di picco
+di quel processo), la latenza di ricerca e la recall@k sulle domande etichettate.
+Lo stadio churn controlla che aggiunte e cancellazioni dopo il calcolo delle partizioni
+IVF lascino il database coerente anche dopo la compattazione.
+
+Esempio:
+    python benchmarks/vector_store_benchmark.py --sizes 0,1000 --nprobe 4
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Solo i moduli che servono anche al processo di misura del caricamento: gli altri
+# (RAGSystem, Chroma) sono importati dove servono, per non falsarne i tempi
+from harness import add_report_arguments, measure, peak_rss_mb, report
+from rag_stubs import HashingEmbeddings
+
+# Nome del backend: (tipo dei vettori, modalità di ricerca); None per Chroma
+BACKENDS = {
+    "chroma": None,
+    "memmap_f32": ("float32", "exact"),
+    "memmap_i8": ("int8", "exact"),
+    "memmap_i8_ivf": ("int8", "ivf"),
+}
+
+
+def directory_size(path: str, exclude: tuple = ()) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files if name not in exclude)
+    return total
+
+
+def open_store(backend: str, persist_dir: str, embeddings, nprobe: int = 8):
+    if BACKENDS[backend] is None:
+        from langchain_chroma import Chroma
+
+        return Chroma(persist_directory=persist_dir, embedding_function=embeddings)
+    from memmap_store import MemmapVectorStore
+
+    _, index = BACKENDS[backend]
+    return MemmapVectorStore(persist_dir, embedding_function=embeddings, index=index, nprobe=nprobe)
+
+
+def load_probe(backend: str, persist_dir: str, dim: int, nprobe: int, query: str):
+    """Eseguita in un processo nuovo: tempo di apertura, della prima ricerca e memoria di picco."""
+    start = time.perf_counter()
+    store = open_store(backend, persist_dir, HashingEmbeddings(dim), nprobe)
+    open_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    store.similarity_search(query, k=1)
+    first_query_seconds = time.perf_counter() - start
+    print(json.dumps({
+        "open_seconds": open_seconds,
+        "first_query_seconds": first_query_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+
+def measure_load(backend: str, persist_dir: str, args, query: str) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), "--probe", backend, persist_dir, "--dim", str(args.dim), "--nprobe", str(args.nprobe), "--probe-query", query]
+    start = time.perf_counter()
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_seconds"] = time.perf_counter() - start
+    return result
+
+
+def recall(retrieved: list, questions: list) -> float:
+    hits = sum(
+        any(evidence.lower() in doc.page_content.lower() for doc in docs)
+        for docs, (_, evidence) in zip(retrieved, questions)
+    )
+    return hits / len(questions)
+
+
+def churn(source_dir: str, workdir: str, embeddings, args) -> dict:
+    """
+    Su una copia del database int8 con IVF: partizioni, nuove righe, cancellazione della
+    metà delle righe originali (che fa scattare la compattazione) e riapertura. Ogni riga
+    rimasta deve essere trovata dalla ricerca IVF con il proprio vettore.
+    """
+    from memmap_store import MemmapVectorStore
+
+    persist_dir = os.path.join(workdir, os.path.basename(source_dir) + "_churn")
+    shutil.copytree(source_dir, persist_dir)
+    store = MemmapVectorStore(persist_dir, embedding_function=embeddings, index="ivf", nprobe=args.nprobe)
+    start = time.perf_counter()
+    store.train_ivf()
+    original = store.get(include=["documents", "metadatas", "embeddings"])
+    added = [f"churn-{cid}" for cid in original["ids"]]
+    store.add_vectors(added, original["embeddings"], original["documents"], original["metadatas"])
+    store.delete(original["ids"][: len(original["ids"]) // 2 + 1])
+    store.compact()
+    seconds = time.perf_counter() - start
+
+    store = MemmapVectorStore(persist_dir, embedding_function=embeddings, index="ivf", nprobe=store.stats()["partitions"])
+    remaining = store.get(include=["embeddings"])
+    found = sum(
+        any(doc.id == cid for doc in store.similarity_search_by_vector(vector, k=2))
+        for cid, vector in zip(remaining["ids"], remaining["embeddings"])
+    )
+    expected = len(original["ids"]) - (len(original["ids"]) // 2 + 1) + len(added)
+    return {"seconds": seconds, "rows": len(store), "consistent": len(store) == expected and found == len(remaining["ids"])}
+
+
+def run_size(size: int, args, workdir: str) -> dict:
+    from rag_benchmark import load_questions, synthetic_corpus
+    from memmap_store import import_chroma
+    from rag import RAGSystem
+    from rag_stubs import StubLLM
+
+    source, questions = load_questions()
+    corpus_dir = os.path.join(workdir, f"corpus_{size}")
+    os.makedirs(corpus_dir)
+    synthetic_paths, synthetic_questions = synthetic_corpus(corpus_dir, size, seed=args.seed)
+    questions = questions + random.Random(args.seed).sample(synthetic_questions, min(args.questions, size))
+
+    embeddings = HashingEmbeddings(args.dim)
+    directories = {"chroma": os.path.join(workdir, f"chroma_{size}")}
+    RAGSystem(
+        model_url=None,
+        model_name="stub",
+        doc_paths=[source] + synthetic_paths,
+        embed_url=None,
+        embed_model="hashing",
+        persist_dir=directories["chroma"],
+        incremental=True,
+        llm=StubLLM(),
+        embeddings=embeddings,
+        k=args.k,
+    )
+
+    stages = {}
+    for backend, (dtype, _) in ((b, c) for b, c in BACKENDS.items() if c is not None):
+        # Le due varianti int8 condividono gli stessi file
+        directories[backend] = os.path.join(workdir, f"memmap_{dtype}_{size}")
+        if not os.path.exists(directories[backend]):
+            start = time.perf_counter()
+            store = import_chroma(directories["chroma"], directories[backend], dtype=dtype)
+            stages[f"{dtype}/import"] = {"seconds": time.perf_counter() - start, "rows": len(store)}
+
+    warmup = [q for q, _ in questions[: args.warmup]]
+    texts = [q for q, _ in questions]
+    for backend, persist_dir in directories.items():
+        if BACKENDS[backend] is not None and BACKENDS[backend][1] == "ivf":
+            # Senza partizioni la ricerca resta esatta finché il thread in background non le calcola
+            start = time.perf_counter()
+            open_store(backend, persist_dir, embeddings, args.nprobe).train_ivf()
+            stages[f"{backend}/train"] = {"seconds": time.perf_counter() - start}
+        stage = measure_load(backend, persist_dir, args, texts[0])
+        stage["size_bytes"] = directory_size(persist_dir, exclude=("manifest.json", "lexical_index.json"))
+        stages[f"{backend}/load"] = stage
+
+        store = open_store(backend, persist_dir, embeddings, args.nprobe)
+        retrieved = []
+        stages[f"{backend}/query"] = measure(lambda q: retrieved.append(store.similarity_search(q, k=args.k)), warmup + texts, len(warmup))
+        stages[f"{backend}/query"]["recall_at_k"] = recall(retrieved[len(warmup):], questions)
+        if hasattr(store, "stats"):
+            stages[f"{backend}/query"].update(store.stats())
+    stages["memmap_i8_ivf/churn"] = churn(directories["memmap_i8_ivf"], workdir, embeddings, args)
+    return {"questions": len(questions), "stages": stages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronto tra Chroma e MemmapVectorStore")
+    parser.add_argument("--sizes", default="0,100,1000", help="Documenti sintetici da aggiungere a ReEric.txt, separati da virgole")
+    parser.add_argument("--questions", type=int, default=50, help="Domande sintetiche per dimensione del corpus")
+    parser.add_argument("--k", type=int, default=2, help="Chunk recuperati per domanda")
+    parser.add_argument("--dim", type=int, default=384, help="Dimensione degli embedding a feature hashing")
+    parser.add_argument("--nprobe", type=int, default=8, help="Partizioni confrontate dalla ricerca IVF")
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--probe", nargs=2, metavar=("BACKEND", "DIR"), help=argparse.SUPPRESS)
+    parser.add_argument("--probe-query", help=argparse.SUPPRESS)
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    if args.probe:
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "27-03-2025_RAG"))
+        load_probe(args.probe[0], args.probe[1], args.dim, args.nprobe, args.probe_query)
+        return
+
+    results = {
+        "config": {k: getattr(args, k) for k in ("k", "dim", "nprobe", "seed")},
+        "corpora": {},
+        "stages": {},
+    }
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as workdir:
+        for size in (int(s) for s in args.sizes.split(",")):
+            print(f"Corpus con {size} documenti sintetici...", file=sys.stderr)
+            outcome = run_size(size, args, workdir)
+            for name, stage in outcome.pop("stages").items():
+                results["stages"][f"{size}/{name}"] = stage
+            results["corpora"][str(size)] = outcome
+    sys.exit(report(results, args.out, args.baseline, args.save_baseline, args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
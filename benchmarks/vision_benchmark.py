@@ -0,0 +1,168 @@
+"""
+Benchmark headless degli stadi di visione: riconoscimento dei visi, disegno dei
+risultati, riconoscimento dei gesti e tracciamento del puntatore.
+
+I frame arrivano da una fixture registrata (.npz con l'array "frames", file video
+o cartella di immagini) oppure vengono generati in modo deterministico, quindi
+non serve una webcam. Per ogni stadio vengono riportati p50/p95/p99, throughput
+e memoria di picco in JSON; con --baseline i risultati vengono confrontati con
+un'esecuzione precedente e il processo esce con codice 1 se ci sono regressioni.
+
+Esempi:
+    python benchmarks/vision_benchmark.py --save-baseline baseline_visione.json
+    python benchmarks/vision_benchmark.py --frames registrazione.npz --baseline baseline_visione.json
+"""
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "13-03-2025_Computer Vision"))
+sys.path.insert(0, os.path.join(ROOT, "20-02-2025_Computer Vision"))
+import mediapipe as mp
+from face_recognition import MODEL_PATH as FACE_MODEL_PATH, create_detector, visualize
+from gesture_stream import MODEL_PATH as GESTURE_MODEL_PATH
+from pointer_tracker import PointerTracker
+from harness import add_report_arguments, measure, report
+from common.vision_runtime import DELEGATES, VisionRunningMode, VisionRuntime
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def synthetic_frames(count: int = 300, width: int = 640, height: int = 480, seed: int = 0) -> np.ndarray:
+    """
+    Sequenza riproducibile: sfondo con gradiente e rumore e un ovale color pelle
+    con occhi e bocca che si sposta sull'immagine, come un viso davanti alla webcam.
+    """
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(40, 160, width, dtype=np.float32)[None, :, None]
+    background = np.broadcast_to(gradient, (height, width, 3)).astype(np.uint8)
+    frames = np.empty((count, height, width, 3), dtype=np.uint8)
+    for i in range(count):
+        frame = cv2.add(background, rng.integers(0, 20, (height, width, 3), dtype=np.uint8))
+        cx = int(width / 2 + width / 4 * np.sin(2 * np.pi * i / count))
+        cy = int(height / 2 + height / 8 * np.cos(2 * np.pi * i / count))
+        axes = (width // 8, height // 5)
+        cv2.ellipse(frame, (cx, cy), axes, 0, 0, 360, (150, 180, 225), -1)
+        for dx in (-axes[0] // 2, axes[0] // 2):
+            cv2.circle(frame, (cx + dx, cy - axes[1] // 4), axes[0] // 8, (40, 40, 40), -1)
+        cv2.ellipse(frame, (cx, cy + axes[1] // 2), (axes[0] // 3, axes[1] // 10), 0, 0, 180, (60, 60, 150), -1)
+        frames[i] = frame
+    return frames
+
+
+def load_frames(source: str, limit: int = None) -> np.ndarray:
+    """Legge i frame da un .npz ("frames"), da un video o da una cartella di immagini."""
+    if source.endswith(".npz"):
+        return np.load(source)["frames"][:limit]
+    if os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if os.path.splitext(n)[1].lower() in IMAGE_EXTENSIONS)
+        frames = [cv2.imread(os.path.join(source, n)) for n in names[:limit]]
+    else:
+        cap = cv2.VideoCapture(source)
+        frames = []
+        while limit is None or len(frames) < limit:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    if not frames:
+        raise ValueError(f"Nessun frame letto da {source}")
+    return np.stack(frames)
+
+
+def video_timestamps(step_ms: int = 33):
+    """Timestamp strettamente crescenti per le modalità VIDEO di MediaPipe."""
+    state = {"timestamp": 0}
+
+    def next_timestamp() -> int:
+        state["timestamp"] += step_ms
+        return state["timestamp"]
+
+    return next_timestamp
+
+
+def run(frames: np.ndarray, runtime: VisionRuntime, face_model: str, gesture_model: str, repeat: int, warmup: int) -> dict:
+    sequence = [frame for _ in range(repeat) for frame in frames]
+    stages = {}
+
+    detector = create_detector(runtime, face_model)
+    timestamp = video_timestamps()
+    detections = []
+
+    def detect(frame):
+        image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame)
+        detections.append(detector.detect_for_video(image, timestamp()))
+
+    stages["face_detect"] = measure(detect, sequence, warmup)
+
+    buffer = np.empty_like(frames[0])
+    stages["face_visualize"] = measure(
+        lambda item: visualize(item[0], item[1], out=buffer), list(zip(sequence, detections)), warmup
+    )
+    stages["face_detect"]["faces_per_frame"] = sum(len(d.detections) for d in detections) / len(detections)
+
+    if os.path.exists(gesture_model):
+        recognizer = runtime.task("gesture_recognizer", gesture_model, running_mode=VisionRunningMode.VIDEO, num_hands=1)
+        timestamp = video_timestamps()
+        stages["gesture_recognize"] = measure(
+            lambda frame: recognizer.recognize_for_video(
+                mp.Image(image_format=mp.ImageFormat.SRGB, data=frame), timestamp()
+            ),
+            sequence,
+            warmup,
+        )
+    else:
+        stages["gesture_recognize"] = {"skipped": f"modello non trovato: {gesture_model}"}
+
+    # Solo il filtro: il thread che muove il puntatore non viene avviato
+    tracker = PointerTracker(lambda x, y: None)
+    path = [(960 + 600 * np.sin(i / 50), 540 + 300 * np.cos(i / 70), i / 30) for i in range(len(sequence) * 10)]
+    stages["pointer_update"] = measure(lambda p: tracker.update(*p), path, warmup)
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark headless degli stadi di visione")
+    parser.add_argument("--frames", help="Fixture registrata: .npz, video o cartella di immagini (default: frame sintetici)")
+    parser.add_argument("--count", type=int, default=300, help="Frame sintetici da generare o frame massimi da leggere")
+    parser.add_argument("--size", default="640x480", help="Dimensione dei frame sintetici")
+    parser.add_argument("--save-fixture", help="Salva i frame usati in un .npz riutilizzabile")
+    parser.add_argument("--repeat", type=int, default=1, help="Passate sulla sequenza di frame")
+    parser.add_argument("--warmup", type=int, default=10, help="Chiamate iniziali escluse dalle misure")
+    parser.add_argument("--face-model", default=FACE_MODEL_PATH)
+    parser.add_argument("--gesture-model", default=GESTURE_MODEL_PATH)
+    parser.add_argument("--delegate", choices=sorted(DELEGATES), default="cpu")
+    parser.add_argument("--threads", type=int, default=None, help="Thread usati da OpenCV")
+    add_report_arguments(parser)
+    args = parser.parse_args()
+
+    if args.frames:
+        frames = load_frames(args.frames, args.count)
+    else:
+        width, height = (int(v) for v in args.size.split("x"))
+        frames = synthetic_frames(args.count, width, height)
+    if args.save_fixture:
+        np.savez_compressed(args.save_fixture, frames=frames)
+
+    with VisionRuntime(delegate=args.delegate, num_threads=args.threads) as runtime:
+        stages = run(frames, runtime, args.face_model, args.gesture_model, args.repeat, args.warmup)
+        results = {
+            "fixture": {
+                "source": args.frames or "synthetic",
+                "frames": len(frames),
+                "shape": list(frames.shape[1:]),
+                "repeat": args.repeat,
+            },
+            "runtime": runtime.timings(),
+            "stages": stages,
+        }
+    sys.exit(report(results, args.out, args.baseline, args.save_baseline, args.tolerance))
+
+
+if __name__ == "__main__":
+    main()
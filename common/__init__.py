@@ -0,0 +1 @@
+"""Moduli condivisi tra gli esercizi del corso."""
@@ -0,0 +1,151 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class AdaptiveScheduler:
+    """
+    Sceglie per ogni frame se eseguire l'inferenza e a quale risoluzione.
+
+    La risoluzione e il passo tra i frame analizzati si adattano al tempo di
+    inferenza misurato rispetto a un budget di latenza: se l'inferenza è troppo
+    lenta prima si riduce la risoluzione, poi si analizza un frame ogni N;
+    quando torna margine si fa il percorso inverso. I frame quasi identici al
+    precedente (differenza media su una miniatura in scala di grigi) non vengono
+    analizzati e si riusa l'ultimo risultato.
+
+    Uso:
+        scale = scheduler.plan(frame)
+        if scale is None:
+            ...riusa l'ultimo risultato...
+        else:
+            result = infer(scheduler.resize(frame, scale))
+            scheduler.observe(tempo_di_inferenza)
+    """
+
+    def __init__(
+        self,
+        target_latency_ms: float = 33.0,
+        scales: tuple = (1.0, 0.75, 0.5, 0.375, 0.25),
+        max_stride: int = 4,
+        motion_threshold: float = 2.0,
+        max_reuse: int = 15,
+        min_width: int = 160,
+        smoothing: float = 0.2,
+        adjust_every: int = 10,
+    ):
+        """
+        Args:
+            target_latency_ms (float): Tempo di inferenza desiderato per frame
+            scales (tuple): Fattori di scala ammessi, dal più grande al più piccolo
+            max_stride (int): Massimo numero di frame tra due inferenze
+            motion_threshold (float): Differenza media (0-255) sotto la quale il frame è considerato fermo; 0 disattiva il controllo
+            max_reuse (int): Massimo numero di frame consecutivi che riusano l'ultimo risultato
+            min_width (int): Larghezza minima dell'immagine passata al modello
+            smoothing (float): Peso dell'ultima misura nella media mobile esponenziale
+            adjust_every (int): Inferenze tra due adattamenti, per evitare oscillazioni
+        """
+        self.target = target_latency_ms / 1000
+        self.scales = scales
+        self.max_stride = max_stride
+        self.motion_threshold = motion_threshold
+        self.max_reuse = max_reuse
+        self.min_width = min_width
+        self.smoothing = smoothing
+        self.adjust_every = adjust_every
+
+        self.scale_index = 0
+        self.stride = 1
+        self.average = None
+        self._frame_count = 0
+        self._reused = 0
+        self._observations = 0
+        self._last_thumbnail = None
+        self._has_result = False
+        self._lock = threading.Lock()
+
+        self.inferences = 0
+        self.skipped_stride = 0
+        self.skipped_motion = 0
+
+    @property
+    def scale(self) -> float:
+        return self.scales[self.scale_index]
+
+    @staticmethod
+    def _thumbnail(frame: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        return cv2.resize(gray, (32, 24), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def plan(self, frame: np.ndarray):
+        """
+        Returns:
+            float | None: Il fattore di scala da usare, oppure None se il frame va saltato
+        """
+        with self._lock:
+            self._frame_count += 1
+            can_reuse = self._has_result and self._reused < self.max_reuse
+            if can_reuse and self._frame_count % self.stride != 0:
+                self._reused += 1
+                self.skipped_stride += 1
+                return None
+
+            thumbnail = None
+            if self.motion_threshold > 0:
+                thumbnail = self._thumbnail(frame)
+                if can_reuse and self._last_thumbnail is not None:
+                    motion = float(np.mean(np.abs(thumbnail - self._last_thumbnail)))
+                    if motion < self.motion_threshold:
+                        self._reused += 1
+                        self.skipped_motion += 1
+                        return None
+
+            self._last_thumbnail = thumbnail
+            self._has_result = True
+            self._reused = 0
+            self.inferences += 1
+            scale = self.scale
+            if frame.shape[1] * scale < self.min_width:
+                scale = min(1.0, self.min_width / frame.shape[1])
+            return scale
+
+    @staticmethod
+    def resize(frame: np.ndarray, scale: float) -> np.ndarray:
+        """Ridimensiona il frame; con scala 1 restituisce il frame stesso senza copie."""
+        if scale >= 1.0:
+            return frame
+        h, w = frame.shape[:2]
+        return cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+    def observe(self, inference_seconds: float):
+        """Registra il tempo di un'inferenza e, periodicamente, adatta risoluzione e passo."""
+        with self._lock:
+            if self.average is None:
+                self.average = inference_seconds
+            else:
+                self.average += self.smoothing * (inference_seconds - self.average)
+            self._observations += 1
+            if self._observations % self.adjust_every != 0:
+                return
+
+            if self.average > self.target * 1.1:
+                if self.scale_index < len(self.scales) - 1:
+                    self.scale_index += 1
+                elif self.stride < self.max_stride:
+                    self.stride += 1
+            elif self.average < self.target * 0.6:
+                if self.stride > 1:
+                    self.stride -= 1
+                elif self.scale_index > 0:
+                    self.scale_index -= 1
+
+    def stats(self) -> dict:
+        return {
+            "scale": self.scale,
+            "stride": self.stride,
+            "average_inference_ms": None if self.average is None else self.average * 1000,
+            "inferences": self.inferences,
+            "skipped_stride": self.skipped_stride,
+            "skipped_motion": self.skipped_motion,
+        }
@@ -0,0 +1,345 @@
+"""
+Server locale che imita le API di Ollama usate nel progetto (/api/generate e /api/embed),
+per provare client e chatbot senza un modello vero né la rete.
+
+Il "modello" conta una parola come un token e risponde con parole prese dal prompt.
+Come Ollama tiene per ogni modello l'ultima sequenza elaborata (la cache KV) per
+keep_alive secondi: di una nuova richiesta vengono elaborati solo i token successivi
+al prefisso in comune, e prompt_eval_count lo riporta. Il campo context della risposta
+contiene tutti i token della conversazione e può essere inviato con la richiesta seguente.
+
+Per provare timeout, tentativi e richieste duplicate del client si possono iniettare
+ritardi ed errori: una latenza fissa, una frazione di richieste lente (la coda delle
+latenze), una frazione di risposte con un codice di errore e gli errori delle prossime
+N richieste con fail_next.
+
+Esempio:
+    python common/fake_ollama.py --port 11434 --prefill-delay 0.001 --slow-rate 0.05 --error-rate 0.02
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DURATION_PATTERN = re.compile(r"^(-?\d+(?:\.\d+)?)(ms|s|m|h)?$")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, None: 1}
+
+
+def parse_keep_alive(value, default: float) -> float:
+    """Secondi di keep_alive: un numero o una durata come "30s", "5m"; un valore negativo vale per sempre."""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        match = DURATION_PATTERN.match(value.strip())
+        if not match:
+            raise ValueError(f"keep_alive non valido: {value}")
+        value = float(match.group(1)) * DURATION_UNITS[match.group(2)]
+    return math.inf if value < 0 else float(value)
+
+
+class FakeOllama:
+    """Server HTTP in un thread, da usare come context manager nei test e nei benchmark."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, response_words: int = 8, prefill_delay: float = 0.0, token_delay: float = 0.0, keep_alive: float = 300.0, embed_dim: int = 64, latency: float = 0.0, slow_rate: float = 0.0, slow_latency: float = 1.0, error_rate: float = 0.0, error_status: int = 503, seed: int = None):
+        """
+        Args:
+            port (int): 0 per una porta libera qualsiasi (vedi url)
+            response_words (int): Parole di ogni risposta
+            prefill_delay (float): Secondi per ogni token del prompt da elaborare
+            token_delay (float): Secondi per ogni token generato
+            keep_alive (float): Secondi per cui la cache di un modello resta valida, se la richiesta non lo indica
+            latency (float): Secondi di attesa prima di ogni risposta
+            slow_rate (float): Frazione delle richieste che attendono slow_latency secondi in più
+            error_rate (float): Frazione delle richieste che ricevono error_status invece della risposta
+            seed (int): Seme della scelta di richieste lente ed errori, per esperimenti ripetibili
+        """
+        self.response_words = response_words
+        self.prefill_delay = prefill_delay
+        self.token_delay = token_delay
+        self.keep_alive = keep_alive
+        self.embed_dim = embed_dim
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        # Codici di errore delle prossime richieste (None = connessione chiusa senza risposta)
+        self._failures = []
+        # Ritardi ed errori iniettati finora
+        self.injected = {"slow": 0, "errors": 0, "dropped": 0}
+        # Con reject_context=True le richieste con un context vengono rifiutate (es. modello cambiato)
+        self.reject_context = False
+        self.vocabulary = {}
+        self.words = []
+        # Modello -> (token in cache, istante di scadenza)
+        self.cache = {}
+        # Una voce per richiesta a /api/generate: modello, token del prompt e token elaborati
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def reset(self):
+        """Svuota la cache di tutti i modelli, come se Ollama li avesse scaricati."""
+        with self._lock:
+            self.cache.clear()
+
+    def fail_next(self, count: int = 1, status: int = 503):
+        """Le prossime count richieste falliscono con status; con status=None la connessione viene chiusa."""
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def _fault(self):
+        """
+        Decide il guasto da simulare per una richiesta.
+        Returns:
+            tuple: (secondi di attesa, False se nessun errore, altrimenti il codice o None per chiudere la connessione)
+        """
+        with self._lock:
+            delay = self.latency
+            if self.slow_rate and self._random.random() < self.slow_rate:
+                delay += self.slow_latency
+                self.injected["slow"] += 1
+            if self._failures:
+                status = self._failures.pop(0)
+            elif self.error_rate and self._random.random() < self.error_rate:
+                status = self.error_status
+            else:
+                return delay, False
+            self.injected["errors" if status is not None else "dropped"] += 1
+            return delay, status
+
+    def tokenize(self, text: str) -> list:
+        with self._lock:
+            tokens = []
+            for word in text.split():
+                token = self.vocabulary.get(word)
+                if token is None:
+                    token = self.vocabulary[word] = len(self.words)
+                    self.words.append(word)
+                tokens.append(token)
+            return tokens
+
+    def _prompt_tokens(self, request: dict) -> list:
+        """Token del prompt come li vedrebbe il modello: contesto precedente più il turno applicato al template."""
+        context = request.get("context") or []
+        if request.get("raw"):
+            return list(context) + self.tokenize(request.get("prompt", ""))
+        turn = f"<utente> {request.get('prompt', '')} <assistente>"
+        # Come in Ollama il messaggio di sistema si aggiunge solo all'inizio della conversazione
+        if request.get("system") and not context:
+            turn = f"<sistema> {request['system']} {turn}"
+        return list(context) + self.tokenize(turn)
+
+    def _respond(self, request: dict) -> tuple:
+        """
+        Elabora il prompt aggiornando la cache del modello.
+        Returns:
+            tuple: (parole della risposta, campi finali della risposta)
+        """
+        model = request.get("model", "")
+        keep_alive = parse_keep_alive(request.get("keep_alive"), self.keep_alive)
+        prompt_tokens = self._prompt_tokens(request)
+        words = [w for w in request.get("prompt", "").split() if not w.startswith("<")][-self.response_words:] or ["Ciao!"]
+        response_tokens = self.tokenize(" ".join(words))
+
+        with self._lock:
+            now = time.monotonic()
+            cached, expires = self.cache.get(model, ([], 0.0))
+            if now > expires:
+                cached = []
+            common = 0
+            for a, b in zip(cached, prompt_tokens):
+                if a != b:
+                    break
+                common += 1
+            sequence = prompt_tokens + response_tokens
+            if keep_alive > 0:
+                self.cache[model] = (sequence, now + keep_alive)
+            else:
+                self.cache.pop(model, None)
+            evaluated = len(prompt_tokens) - common
+            self.requests.append({"model": model, "prompt_tokens": len(prompt_tokens), "prompt_eval_count": evaluated, "context": bool(request.get("context"))})
+
+        prefill = evaluated * self.prefill_delay
+        if prefill:
+            time.sleep(prefill)
+        final = {
+            "model": model,
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": evaluated,
+            "eval_count": len(response_tokens),
+            "prompt_eval_duration": int(prefill * 1e9),
+            "eval_duration": int(self.token_delay * len(response_tokens) * 1e9),
+            "load_duration": 0,
+        }
+        if not request.get("raw"):
+            final["context"] = sequence
+        return words, final
+
+    def embed(self, inputs: list) -> list:
+        """Vettori deterministici e normalizzati, uguali per testi uguali."""
+        vectors = []
+        for text in inputs:
+            digest = hashlib.shake_256(text.encode("utf-8")).digest(self.embed_dim)
+            vector = [byte - 127.5 for byte in digest]
+            norm = math.sqrt(sum(x * x for x in vector))
+            vectors.append([x / norm for x in vector])
+        return vectors
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Senza, ogni frammento dello stream attende l'ACK ritardato del client (~40 ms)
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle(self):
+                # Con scadenze e richieste duplicate il client chiude spesso la connessione prima della risposta
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _send_json(self, status: int, payload: dict):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_chunk(self, payload: dict):
+                data = (json.dumps(payload) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": "invalid JSON"})
+                    return
+                delay, status = fake._fault()
+                if delay:
+                    time.sleep(delay)
+                if status is None:
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+                    return
+                if status:
+                    self._send_json(status, {"error": "errore simulato"})
+                    return
+                if self.path == "/api/embed":
+                    inputs = request.get("input", [])
+                    inputs = [inputs] if isinstance(inputs, str) else inputs
+                    self._send_json(200, {"model": request.get("model"), "embeddings": fake.embed(inputs)})
+                elif self.path == "/api/generate":
+                    self._generate(request)
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def _generate(self, request: dict):
+                if fake.reject_context and request.get("context"):
+                    self._send_json(400, {"error": "context does not match the loaded model"})
+                    return
+                start = time.perf_counter()
+                try:
+                    words, final = fake._respond(request)
+                except ValueError as e:
+                    self._send_json(400, {"error": str(e)})
+                    return
+                if not request.get("stream", True):
+                    if fake.token_delay:
+                        time.sleep(fake.token_delay * len(words))
+                    final["total_duration"] = int((time.perf_counter() - start) * 1e9)
+                    self._send_json(200, {**final, "response": " ".join(words)})
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for index, word in enumerate(words):
+                    if fake.token_delay:
+                        time.sleep(fake.token_delay)
+                    text = word if index == len(words) - 1 else word + " "
+                    self._send_chunk({"model": final["model"], "response": text, "done": False})
+                final["total_duration"] = int((time.perf_counter() - start) * 1e9)
+                self._send_chunk({**final, "response": ""})
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server locale che imita le API di Ollama")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--response-words", type=int, default=8)
+    parser.add_argument("--prefill-delay", type=float, default=0.0, help="Secondi per token del prompt elaborato")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Secondi per token generato")
+    parser.add_argument("--latency", type=float, default=0.0, help="Secondi di attesa prima di ogni risposta")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Frazione di richieste lente")
+    parser.add_argument("--slow-latency", type=float, default=1.0, help="Secondi in più delle richieste lente")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Frazione di richieste che ricevono un errore 503")
+    args = parser.parse_args()
+
+    server = FakeOllama(
+        args.host,
+        args.port,
+        args.response_words,
+        args.prefill_delay,
+        args.token_delay,
+        latency=args.latency,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        error_rate=args.error_rate,
+    )
+    with server:
+        print(f"Ollama finto in ascolto su {server.url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
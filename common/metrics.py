@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import deque
+
+
+class StreamMetrics:
+    """Misura il tempo al primo token e la latenza totale di una risposta in streaming."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.end = None
+        self.tokens = 0
+
+    def mark_token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.tokens += 1
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    @property
+    def time_to_first_token(self):
+        return None if self.first_token is None else self.first_token - self.start
+
+    @property
+    def total(self):
+        return None if self.end is None else self.end - self.start
+
+    def as_dict(self) -> dict:
+        return {"ttft": self.time_to_first_token, "total": self.total, "tokens": self.tokens}
+
+    def __str__(self):
+        ttft = "-" if self.time_to_first_token is None else f"{self.time_to_first_token:.2f}s"
+        total = "-" if self.total is None else f"{self.total:.2f}s"
+        return f"primo token: {ttft}, totale: {total}"
+
+
+def timed_stream(stream, metrics: StreamMetrics):
+    """Inoltra i token di uno stream aggiornando le metriche."""
+    for token in stream:
+        metrics.mark_token()
+        yield token
+    metrics.finish()
+
+
+async def atimed_stream(stream, metrics: StreamMetrics):
+    """Versione asincrona di timed_stream."""
+    async for token in stream:
+        metrics.mark_token()
+        yield token
+    metrics.finish()
+
+
+class LatencyHistogram:
+    """Raccoglie le ultime latenze misurate e ne calcola i percentili."""
+
+    def __init__(self, max_samples: int = 10000):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+
+    @staticmethod
+    def _pick(values: list, p: float) -> float:
+        return values[min(len(values) - 1, round(p / 100 * (len(values) - 1)))]
+
+    def percentile(self, p: float):
+        """Percentile p (0-100) delle latenze, in secondi."""
+        with self._lock:
+            values = sorted(self.samples)
+        return self._pick(values, p) if values else None
+
+    def summary(self) -> dict:
+        """Percentili p50/p95/p99 e media, in millisecondi."""
+        with self._lock:
+            values = sorted(self.samples)
+        if not values:
+            return {"count": self.count}
+        return {
+            "count": self.count,
+            "mean_ms": sum(values) / len(values) * 1000,
+            "p50_ms": self._pick(values, 50) * 1000,
+            "p95_ms": self._pick(values, 95) * 1000,
+            "p99_ms": self._pick(values, 99) * 1000,
+        }
+
+    def __str__(self):
+        s = self.summary()
+        if "p50_ms" not in s:
+            return "nessun campione"
+        return f"p50 {s['p50_ms']:.1f}ms, p95 {s['p95_ms']:.1f}ms, p99 {s['p99_ms']:.1f}ms"
+
+
+class RateCounter:
+    """Conta eventi al secondo (es. FPS) dall'inizio della misura."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.count = 0
+
+    def tick(self, n: int = 1):
+        self.count += n
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.start
+        return self.count / elapsed if elapsed > 0 else 0.0
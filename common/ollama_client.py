@@ -0,0 +1,583 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, List, Optional
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from common.metrics import LatencyHistogram
+
+
+def normalize_base_url(base_url: str) -> str:
+    """Aggiunge lo schema se manca e rimuove la barra finale."""
+    if "://" not in base_url:
+        base_url = f"https://{base_url}"
+    return base_url.rstrip("/")
+
+
+class OllamaError(Exception):
+    """Errore del client Ollama che non dipende dalla singola risposta HTTP."""
+
+
+class CircuitOpenError(OllamaError):
+    """Il server ha fallito troppe volte di seguito: le richieste vengono rifiutate senza inviarle."""
+
+
+class DeadlineExceeded(OllamaError, TimeoutError):
+    """La chiamata non si è conclusa entro la scadenza, tentativi compresi."""
+
+
+class RetryPolicy:
+    """
+    Quali errori ripetere e quanto attendere: backoff esponenziale con jitter completo
+    (un'attesa casuale tra 0 e base_delay * 2^tentativo), così i client che hanno
+    fallito insieme non riprovano tutti nello stesso istante.
+    """
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.2, max_delay: float = 5.0, retry_statuses: tuple = (408, 429, 500, 502, 503, 504)):
+        """
+        Args:
+            attempts (int): Tentativi massimi per chiamata, 1 per non ripetere mai
+            base_delay (float): Attesa massima in secondi dopo il primo errore
+            max_delay (float): Limite dell'attesa tra due tentativi
+            retry_statuses (tuple): Codici HTTP da ripetere; gli altri errori 4xx arrivano al chiamante
+        """
+        if attempts < 1:
+            raise ValueError(f"Serve almeno un tentativo per chiamata, non {attempts}")
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = retry_statuses
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def server_failure(self, error: Exception) -> bool:
+        """Errori di rete, timeout e risposte con uno dei retry_statuses: contano per il circuito."""
+        if isinstance(error, requests.HTTPError):
+            return error.response is not None and error.response.status_code in self.retry_statuses
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status in self.retry_statuses
+        return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError, aiohttp.ClientError, asyncio.TimeoutError))
+
+    def retryable(self, error: Exception, idempotent: bool = True) -> bool:
+        """
+        Con idempotent=False (es. una generazione, costosa da ripetere) solo gli errori
+        per cui il server non ha ricevuto la richiesta, oppure l'ha rifiutata con uno dei
+        retry_statuses: un timeout di lettura vuol dire che la generazione è forse ancora in corso.
+        """
+        if idempotent or isinstance(error, (requests.HTTPError, aiohttp.ClientResponseError)):
+            return self.server_failure(error)
+        if isinstance(error, (requests.ConnectTimeout, aiohttp.ClientConnectorError)):
+            return True
+        # requests segnala il fallimento della connessione come MaxRetryError(reason=NewConnectionError)
+        reason = getattr(error.args[0], "reason", None) if isinstance(error, requests.ConnectionError) and error.args else None
+        return isinstance(reason, NewConnectionError)
+
+
+class CircuitBreaker:
+    """
+    Dopo failure_threshold errori consecutivi il circuito si apre e le richieste falliscono
+    subito per reset_timeout secondi; poi ne passa una di prova: se va a buon fine il
+    circuito si richiude, altrimenti resta aperto per altri reset_timeout secondi.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold (int): Errori consecutivi che aprono il circuito, 0 per non aprirlo mai
+            reset_timeout (float): Secondi prima della richiesta di prova
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._probing = True
+            return True
+
+    def retry_in(self) -> float:
+        with self._lock:
+            return 0.0 if self.opened_at is None else max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def release(self):
+        """La richiesta non dice nulla sul server (es. errore locale): i contatori restano invariati,
+        ma se era quella di prova la prossima richiesta potrà riprovare."""
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or (self.failure_threshold and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class ClientMetrics:
+    """Latenze per endpoint, contatori di tentativi ed errori e velocità di generazione riportata da Ollama."""
+
+    COUNTERS = ("requests", "attempts", "retries", "failures", "rejected", "deadline_exceeded", "hedges", "hedge_wins")
+
+    def __init__(self):
+        self.latency = {}
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        # Token e nanosecondi di generazione e di elaborazione del prompt
+        self.tokens = {"eval_count": 0, "eval_duration": 0, "prompt_eval_count": 0, "prompt_eval_duration": 0}
+        self._lock = threading.Lock()
+
+    def histogram(self, endpoint: str) -> LatencyHistogram:
+        with self._lock:
+            histogram = self.latency.get(endpoint)
+            if histogram is None:
+                histogram = self.latency[endpoint] = LatencyHistogram()
+            return histogram
+
+    def record(self, endpoint: str, seconds: float):
+        self.histogram(endpoint).record(seconds)
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    def record_generation(self, final: dict):
+        """Aggiunge i conteggi dell'ultimo frammento (o della risposta completa) di /api/generate."""
+        with self._lock:
+            for key in self.tokens:
+                self.tokens[key] += final.get(key) or 0
+
+    def summary(self) -> dict:
+        with self._lock:
+            tokens = dict(self.tokens)
+            summary = dict(self.counters)
+            endpoints = list(self.latency.items())
+        summary["latency"] = {endpoint: histogram.summary() for endpoint, histogram in endpoints}
+        summary["eval_tokens"] = tokens["eval_count"]
+        summary["prompt_tokens"] = tokens["prompt_eval_count"]
+        summary["tokens_per_s"] = tokens["eval_count"] / tokens["eval_duration"] * 1e9 if tokens["eval_duration"] else None
+        summary["prompt_tokens_per_s"] = tokens["prompt_eval_count"] / tokens["prompt_eval_duration"] * 1e9 if tokens["prompt_eval_duration"] else None
+        return summary
+
+
+class OllamaClient:
+    """Client HTTP per Ollama con un pool di connessioni keep-alive condiviso.
+
+    Le chiamate sincrone usano una requests.Session, quelle asincrone una
+    aiohttp.ClientSession legata all'event loop corrente.
+
+    Ogni chiamata ha una scadenza complessiva (deadline, tentativi compresi): gli errori
+    di rete e del server vengono ripetuti secondo la RetryPolicy finché il CircuitBreaker
+    lo consente. Con hedge_after embed invia una copia della richiesta se la prima non ha
+    risposto dopo hedge_after secondi ("auto": il p95 delle latenze misurate) e usa la
+    risposta che arriva prima. Le generazioni, stream compresi, vengono ripetute solo se
+    la richiesta non è arrivata al server o è stata rifiutata con uno dei retry_statuses,
+    e non sono duplicate; con retry_generate=True valgono le stesse regole di embed.
+    Gli stream vengono ripetuti solo se falliscono prima che il server inizi a rispondere.
+    """
+
+    def __init__(self, base_url: str, pool_size: int = 16, timeout: float = 300.0, deadline: float = None, retry: RetryPolicy = None, breaker: CircuitBreaker = None, hedge_after=None, retry_generate: bool = False):
+        """
+        Args:
+            timeout (float): Secondi massimi di un singolo tentativo
+            deadline (float): Secondi massimi di una chiamata, tentativi e attese comprese (None = nessun limite)
+            retry (RetryPolicy): Tentativi e attese, di default 3 tentativi
+            breaker (CircuitBreaker): Circuito condiviso da tutte le chiamate del client
+            hedge_after (float | str): Secondi dopo cui duplicare embed (e generate con retry_generate), "auto" o None
+            retry_generate (bool): Ripete anche le generazioni andate in timeout e le duplica con hedge_after
+        """
+        self.base_url = normalize_base_url(base_url)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_after = hedge_after
+        self.retry_generate = retry_generate
+        self.metrics = ClientMetrics()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._async_session = None
+        self._async_loop = None
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _payload(self, model: str, prompt: str, options: Optional[dict], params: dict, stream: bool = False) -> dict:
+        payload = {"model": model, "prompt": prompt, "stream": stream, **params}
+        if options:
+            payload["options"] = options
+        return payload
+
+    def _deadline_at(self, deadline: Optional[float]) -> Optional[float]:
+        deadline = self.deadline if deadline is None else deadline
+        return None if deadline is None else time.monotonic() + deadline
+
+    def _admit(self, deadline_at: Optional[float]) -> float:
+        """Controlla scadenza e circuito prima di un tentativo e ne restituisce il timeout."""
+        timeout = self.timeout
+        if deadline_at is not None:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                self.metrics.count("deadline_exceeded")
+                raise DeadlineExceeded(f"Scadenza superata per {self.base_url}")
+            timeout = min(timeout, remaining)
+        if not self.breaker.allow():
+            self.metrics.count("rejected")
+            raise CircuitOpenError(f"{self.base_url} non risponde, nuovo tentativo tra {self.breaker.retry_in():.0f}s")
+        self.metrics.count("attempts")
+        return timeout
+
+    def _after_failure(self, error: Exception, attempt: int, deadline_at: Optional[float], idempotent: bool = True) -> float:
+        """Registra l'errore di un tentativo e restituisce l'attesa prima del successivo, oppure rilancia l'errore."""
+        if not self.retry.server_failure(error):
+            if isinstance(error, (requests.HTTPError, aiohttp.ClientResponseError)):
+                # Il server ha risposto (es. 400 per un contesto non valido): non è un guasto
+                self.breaker.record_success()
+            else:
+                # Errore locale (es. JSON non valido): non dice se il server funziona
+                self.breaker.release()
+            self.metrics.count("failures")
+            raise error
+        self.breaker.record_failure()
+        if attempt + 1 >= self.retry.attempts or not self.retry.retryable(error, idempotent):
+            self.metrics.count("failures")
+            raise error
+        delay = self.retry.delay(attempt)
+        if deadline_at is not None and time.monotonic() + delay >= deadline_at:
+            self.metrics.count("failures")
+            self.metrics.count("deadline_exceeded")
+            raise DeadlineExceeded(f"Scadenza superata dopo {attempt + 1} tentativi: {error}") from error
+        self.metrics.count("retries")
+        return delay
+
+    def _hedge_delay(self, endpoint: str) -> Optional[float]:
+        if self.hedge_after != "auto":
+            return self.hedge_after
+        histogram = self.metrics.histogram(endpoint)
+        # Con pochi campioni il p95 non è affidabile
+        return histogram.percentile(95) if histogram.count >= 20 else None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                # Una richiesta superata dalla sua copia occupa il thread finché non termina
+                self._executor = ThreadPoolExecutor(max_workers=2 * self.pool_size, thread_name_prefix="ollama-hedge")
+            return self._executor
+
+    def _hedged(self, send, timeout: float, delay: float):
+        """Esegue send e, se non termina entro delay secondi, anche una copia: vince la prima risposta valida."""
+        executor = self._get_executor()
+        primary = executor.submit(send, timeout)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        self.metrics.count("hedges")
+        hedge = executor.submit(send, max(0.001, timeout - delay))
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.metrics.count("hedge_wins")
+                    return future.result()
+        raise future.exception()
+
+    def _call(self, endpoint: Optional[str], send, deadline_at: Optional[float], hedge: bool = False, idempotent: bool = True):
+        """
+        Esegue send(timeout) con tentativi, scadenza e circuito.
+        Con endpoint la latenza complessiva viene registrata nelle metriche.
+        """
+        start = time.perf_counter()
+        self.metrics.count("requests")
+        for attempt in range(self.retry.attempts):
+            timeout = self._admit(deadline_at)
+            delay = self._hedge_delay(endpoint) if hedge else None
+            try:
+                result = send(timeout) if delay is None else self._hedged(send, timeout, delay)
+            except Exception as e:
+                time.sleep(self._after_failure(e, attempt, deadline_at, idempotent))
+                continue
+            self.breaker.record_success()
+            if endpoint:
+                self.metrics.record(endpoint, time.perf_counter() - start)
+            return result
+
+    def generate(self, model: str, prompt: str, options: Optional[dict] = None, deadline: float = None, **params) -> dict:
+        """Chiama /api/generate e restituisce la risposta JSON completa."""
+        payload = self._payload(model, prompt, options, params)
+
+        def send(timeout):
+            response = self.session.post(f"{self.base_url}/api/generate", json=payload, timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+
+        result = self._call("generate", send, self._deadline_at(deadline), hedge=self.retry_generate, idempotent=self.retry_generate)
+        self.metrics.record_generation(result)
+        return result
+
+    def stream_generate(self, model: str, prompt: str, options: Optional[dict] = None, deadline: float = None, **params):
+        """Chiama /api/generate in streaming e restituisce i frammenti JSON man mano che arrivano."""
+        payload = self._payload(model, prompt, options, params, stream=True)
+        deadline_at = self._deadline_at(deadline)
+        start = time.perf_counter()
+
+        def send(timeout):
+            response = self.session.post(f"{self.base_url}/api/generate", json=payload, timeout=timeout, stream=True)
+            try:
+                response.raise_for_status()
+            except requests.HTTPError:
+                response.close()
+                raise
+            return response
+
+        first = True
+        with self._call(None, send, deadline_at, idempotent=self.retry_generate) as response:
+            for line in response.iter_lines():
+                if deadline_at is not None and time.monotonic() > deadline_at:
+                    self.metrics.count("deadline_exceeded")
+                    raise DeadlineExceeded(f"Scadenza superata durante la risposta di {self.base_url}")
+                if not line:
+                    continue
+                part = json.loads(line)
+                if first:
+                    self.metrics.record("first_token", time.perf_counter() - start)
+                    first = False
+                if part.get("done"):
+                    self.metrics.record_generation(part)
+                    self.metrics.record("generate_stream", time.perf_counter() - start)
+                yield part
+
+    def embed(self, model: str, inputs: list, deadline: float = None) -> list:
+        """Chiama /api/embed con più testi in una sola richiesta."""
+
+        def send(timeout):
+            response = self.session.post(f"{self.base_url}/api/embed", json={"model": model, "input": inputs}, timeout=timeout)
+            response.raise_for_status()
+            return response.json()["embeddings"]
+
+        return self._call("embed", send, self._deadline_at(deadline), hedge=True)
+
+    def _get_async_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._async_session is None or self._async_session.closed or self._async_loop is not loop:
+            if self._async_session is not None and not self._async_session.closed:
+                self._close_stale_session(self._async_session, self._async_loop)
+            self._async_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._async_loop = loop
+        return self._async_session
+
+    @staticmethod
+    def _close_stale_session(session: aiohttp.ClientSession, loop: asyncio.AbstractEventLoop):
+        """Chiude la sessione di un event loop precedente, sul suo loop se è ancora aperto."""
+        if not loop.is_closed():
+            # Se il loop è fermo la chiusura avviene quando riparte
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        # Le connessioni sono legate a un loop già chiuso e non si possono più chiudere in modo
+        # ordinato: si staccano dalla sessione e i socket vengono chiusi dal garbage collector.
+        # Per evitarlo chiamare aclose() prima che il loop termini (es. alla fine di asyncio.run)
+        session.detach()
+
+    async def _ahedged(self, send, timeout: float, delay: float):
+        """Versione asincrona di _hedged: la richiesta superata viene annullata."""
+        tasks = [asyncio.ensure_future(send(timeout))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return tasks[0].result()
+            self.metrics.count("hedges")
+            tasks.append(asyncio.ensure_future(send(max(0.001, timeout - delay))))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is tasks[1]:
+                            self.metrics.count("hedge_wins")
+                        return task.result()
+            raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _acall(self, endpoint: Optional[str], send, deadline_at: Optional[float], hedge: bool = False, idempotent: bool = True):
+        """Versione asincrona di _call."""
+        start = time.perf_counter()
+        self.metrics.count("requests")
+        for attempt in range(self.retry.attempts):
+            timeout = self._admit(deadline_at)
+            delay = self._hedge_delay(endpoint) if hedge else None
+            try:
+                result = await (send(timeout) if delay is None else self._ahedged(send, timeout, delay))
+            except Exception as e:
+                await asyncio.sleep(self._after_failure(e, attempt, deadline_at, idempotent))
+                continue
+            self.breaker.record_success()
+            if endpoint:
+                self.metrics.record(endpoint, time.perf_counter() - start)
+            return result
+
+    async def agenerate(self, model: str, prompt: str, options: Optional[dict] = None, deadline: float = None, **params) -> dict:
+        """Versione asincrona di generate."""
+        session = self._get_async_session()
+        payload = self._payload(model, prompt, options, params)
+
+        async def send(timeout):
+            async with session.post(f"{self.base_url}/api/generate", json=payload, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                response.raise_for_status()
+                return await response.json()
+
+        result = await self._acall("generate", send, self._deadline_at(deadline), hedge=self.retry_generate, idempotent=self.retry_generate)
+        self.metrics.record_generation(result)
+        return result
+
+    async def astream_generate(self, model: str, prompt: str, options: Optional[dict] = None, deadline: float = None, **params):
+        """Versione asincrona di stream_generate."""
+        session = self._get_async_session()
+        payload = self._payload(model, prompt, options, params, stream=True)
+        deadline_at = self._deadline_at(deadline)
+        start = time.perf_counter()
+
+        async def send(timeout):
+            # Il timeout totale di aiohttp copre anche la lettura dello stream
+            response = await session.post(f"{self.base_url}/api/generate", json=payload, timeout=aiohttp.ClientTimeout(total=timeout))
+            try:
+                response.raise_for_status()
+            except aiohttp.ClientResponseError:
+                response.release()
+                raise
+            return response
+
+        first = True
+        async with await self._acall(None, send, deadline_at, idempotent=self.retry_generate) as response:
+            try:
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    part = json.loads(line)
+                    if first:
+                        self.metrics.record("first_token", time.perf_counter() - start)
+                        first = False
+                    if part.get("done"):
+                        self.metrics.record_generation(part)
+                        self.metrics.record("generate_stream", time.perf_counter() - start)
+                    yield part
+            except asyncio.TimeoutError as e:
+                if deadline_at is None or time.monotonic() < deadline_at:
+                    raise
+                self.metrics.count("deadline_exceeded")
+                raise DeadlineExceeded(f"Scadenza superata durante la risposta di {self.base_url}") from e
+
+    def stats(self) -> dict:
+        """Metriche delle chiamate e stato del circuito."""
+        return {"circuit": self.breaker.state, **self.metrics.summary()}
+
+    def close(self):
+        self.session.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    async def aclose(self):
+        if self._async_session is not None and not self._async_session.closed:
+            await self._async_session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url: str, pool_size: int = 16, timeout: float = 300.0, **options) -> OllamaClient:
+    """
+    Restituisce il client condiviso per base_url, creandolo alla prima richiesta.
+    options (deadline, retry, breaker, hedge_after) valgono solo alla creazione.
+    """
+    key = normalize_base_url(base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = OllamaClient(key, pool_size=pool_size, timeout=timeout, **options)
+        return client
+
+
+class PooledOllama(LLM):
+    """LLM LangChain che usa un OllamaClient condiviso invece di aprire una connessione per chiamata."""
+
+    client: Any
+    model: str
+    options: Optional[dict] = None
+    # Scadenza di ogni chiamata in secondi, se diversa da quella del client
+    deadline: Optional[float] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "pooled-ollama"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"base_url": self.client.base_url, "model": self.model, "options": self.options}
+
+    def _options(self, stop: Optional[List[str]]) -> Optional[dict]:
+        options = dict(self.options or {})
+        if stop:
+            options["stop"] = stop
+        return options or None
+
+    def _params(self, kwargs: dict) -> dict:
+        return {"deadline": self.deadline, **kwargs}
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return self.client.generate(self.model, prompt, options=self._options(stop), **self._params(kwargs))["response"]
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        result = await self.client.agenerate(self.model, prompt, options=self._options(stop), **self._params(kwargs))
+        return result["response"]
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        for part in self.client.stream_generate(self.model, prompt, options=self._options(stop), **self._params(kwargs)):
+            chunk = GenerationChunk(text=part.get("response", ""))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        async for part in self.client.astream_generate(self.model, prompt, options=self._options(stop), **self._params(kwargs)):
+            chunk = GenerationChunk(text=part.get("response", ""))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
@@ -0,0 +1,77 @@
+import threading
+import time
+
+from common.metrics import LatencyHistogram
+
+
+class LatestQueue:
+    """
+    Coda con un solo posto in cui vince l'elemento più recente.
+    Se il consumatore è più lento del produttore gli elementi vecchi vengono
+    scartati invece di accumularsi, così la latenza resta bassa.
+    """
+
+    def __init__(self):
+        self._item = None
+        self._has_item = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._has_item:
+                self.dropped += 1
+            self._item = item
+            self._has_item = True
+            self._cond.notify()
+
+    def get(self, timeout: float = None):
+        """Restituisce l'elemento più recente; None se la coda è chiusa e vuota (o scade il timeout)."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._has_item or self._closed, timeout):
+                return None
+            if not self._has_item:
+                return None
+            item = self._item
+            self._item = None
+            self._has_item = False
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed and not self._has_item
+
+
+class StageStats:
+    """Latenza di ogni stadio di una pipeline, più la latenza dall'acquisizione all'output."""
+
+    def __init__(self, stages: list):
+        self.stages = {name: LatencyHistogram() for name in stages}
+        self.end_to_end = LatencyHistogram()
+
+    def time(self, stage: str):
+        return _StageTimer(self.stages[stage])
+
+    def summary(self) -> dict:
+        result = {name: hist.summary() for name, hist in self.stages.items()}
+        result["end_to_end"] = self.end_to_end.summary()
+        return result
+
+
+class _StageTimer:
+    def __init__(self, histogram: LatencyHistogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.record(time.perf_counter() - self.start)
+        return False
@@ -0,0 +1,317 @@
+"""
+Tracciamento degli stadi di una richiesta (span) e profiler a campionamento.
+
+Uno span misura un tratto di codice e ne registra attributi (es. i token del prompt);
+gli span aperti dentro un altro ne diventano figli, anche tra coroutine, grazie a
+contextvars. Alla chiusura ogni span viene passato agli exporter: JsonlExporter
+lo scrive su file, SpanAggregator ne calcola i percentili per nome.
+
+Un Tracer senza exporter è disattivato: span() restituisce sempre lo stesso oggetto
+vuoto, quindi il codice instrumentato costa una chiamata di funzione per stadio.
+
+Uso:
+    tracer = Tracer([SpanAggregator(), JsonlExporter("tracce.jsonl")])
+    with tracer.span("retrieve", k=4) as span:
+        docs = retriever.invoke(question)
+        span.set("docs", len(docs))
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from common.metrics import LatencyHistogram
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    """Un tratto di codice misurato. Con recording=False (traccia non campionata) non viene esportato."""
+
+    def __init__(self, tracer, name: str, parent, attributes: dict, recording: bool = True):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.recording = recording
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(8).hex()
+        self.span_id = os.urandom(4).hex()
+        self.attributes = attributes
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        # Durata dei figli, per ricavare il tempo speso nello span stesso
+        self.children_time = 0.0
+        self._token = None
+
+    @property
+    def self_time(self) -> float:
+        return max(0.0, self.duration - self.children_time)
+
+    def set(self, key: str, value):
+        if self.recording:
+            self.attributes[key] = value
+
+    def end(self):
+        """Chiude lo span ed esporta la misura; le chiamate successive non hanno effetto."""
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self.start
+        # Uno span aperto con start_span si sovrappone al genitore, non è una sua parte
+        if self.parent is not None and self._token is not None:
+            self.parent.children_time += self.duration
+        if self.recording:
+            self.tracer.export(self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Generatore chiuso in un contesto diverso da quello in cui è stato aperto
+            pass
+        if exc_type is not None:
+            self.set("error", exc_type.__name__)
+        self.end()
+        return False
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "start": self.start_time,
+            "duration_ms": self.duration * 1000,
+            "self_ms": self.self_time * 1000,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Span del tracer disattivato: non misura nulla e non cambia il contesto."""
+
+    recording = False
+
+    def set(self, key: str, value):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    def __init__(self, exporters: list = None, sample_rate: float = 1.0):
+        """
+        Args:
+            exporters (list): Oggetti con un metodo export(span); senza exporter il tracer è disattivato
+            sample_rate (float): Frazione delle tracce registrate, decisa allo span radice
+        """
+        self.exporters = list(exporters or [])
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    def start_span(self, name: str, parent=None, **attributes):
+        """
+        Apre uno span senza renderlo quello corrente (es. il tempo al primo token di uno stream),
+        da chiudere con end(). Il genitore di default è lo span corrente; la durata non viene
+        sottratta al suo tempo proprio.
+        """
+        if not self.exporters:
+            return NOOP_SPAN
+        parent = _current_span.get() if parent is None else parent
+        if parent is None:
+            recording = self.sample_rate >= 1 or random.random() < self.sample_rate
+        else:
+            recording = parent.recording
+        return Span(self, name, parent, attributes, recording)
+
+    def span(self, name: str, **attributes):
+        """Span da usare con with: gli span aperti al suo interno ne diventano figli."""
+        return self.start_span(name, **attributes)
+
+    def export(self, span: Span):
+        for exporter in self.exporters:
+            exporter.export(span)
+
+    def close(self):
+        for exporter in self.exporters:
+            close = getattr(exporter, "close", None)
+            if close is not None:
+                close()
+
+
+class JsonlExporter:
+    """Scrive ogni span chiuso come una riga JSON in fondo al file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.as_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class SpanAggregator:
+    """Percentili della durata totale e del tempo proprio (senza i figli) per nome di span,
+    con la media degli attributi numerici."""
+
+    def __init__(self, max_samples: int = 10000):
+        self.max_samples = max_samples
+        self.durations = {}
+        self.self_times = {}
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            if span.name not in self.durations:
+                self.durations[span.name] = LatencyHistogram(self.max_samples)
+                self.self_times[span.name] = LatencyHistogram(self.max_samples)
+                self.attributes[span.name] = {}
+            sums = self.attributes[span.name]
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    total, count = sums.get(key, (0, 0))
+                    sums[key] = (total + value, count + 1)
+        self.durations[span.name].record(span.duration)
+        self.self_times[span.name].record(span.self_time)
+
+    def summary(self) -> dict:
+        with self._lock:
+            names = list(self.durations)
+            attributes = {name: dict(sums) for name, sums in self.attributes.items()}
+        summary = {}
+        for name in names:
+            stage = self.durations[name].summary()
+            own = self.self_times[name].summary()
+            stage.update({f"self_{key}": own[key] for key in ("p50_ms", "p95_ms") if key in own})
+            stage.update({f"{key}_mean": total / count for key, (total, count) in attributes[name].items()})
+            summary[name] = stage
+        return summary
+
+    def __str__(self):
+        lines = [f"{'span':<24}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'proprio p50':>13}"]
+        for name, stage in self.summary().items():
+            if "p50_ms" not in stage:
+                continue
+            lines.append(f"{name:<24}{stage['count']:>7}{stage['p50_ms']:>10.1f}{stage['p95_ms']:>10.1f}{stage['p99_ms']:>10.1f}{stage['self_p50_ms']:>13.1f}")
+        return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """
+    Profiler a campionamento: un thread separato legge ogni interval secondi lo stack
+    di tutti gli altri thread (sys._current_frames) e conta gli stack visti.
+    Non modifica il codice profilato, quindi si può attivare anche in produzione:
+    il costo dipende solo da interval e scompare quando il profiler è fermo.
+
+    Uso:
+        with SamplingProfiler(interval=0.005) as profiler:
+            ...
+        profiler.write_collapsed("profilo.txt")  # per flamegraph.pl o speedscope
+    """
+
+    # Funzioni in cima allo stack di un thread fermo in attesa di lavoro (es. i worker di un pool)
+    IDLE = ("thread.py:_worker", "threading.py:wait")
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64, ignore_idle: bool = True):
+        """
+        Args:
+            interval (float): Secondi tra due campioni
+            max_depth (int): Frame massimi registrati per stack, dal più interno
+            ignore_idle (bool): Non conta i thread fermi in attesa (vedi IDLE)
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self.ignore_idle = ignore_idle
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _label(frame) -> str:
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+    def _sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or (self.ignore_idle and self._label(frame) in self.IDLE):
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(self._label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def top(self, n: int = 15, inclusive: bool = False) -> list:
+        """
+        Le n funzioni più frequenti negli stack campionati.
+        Returns:
+            list: (funzione, campioni, frazione dei campioni) in ordine decrescente; con
+            inclusive=False conta solo la funzione in cima allo stack (tempo proprio)
+        """
+        counts = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            for label in (set(frames) if inclusive else frames[-1:]):
+                counts[label] += count
+        total = sum(self.stacks.values()) or 1
+        return [(label, count, count / total) for label, count in counts.most_common(n)]
+
+    def write_collapsed(self, path: str):
+        """Salva gli stack nel formato "a;b;c campioni", una riga per stack."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
@@ -0,0 +1,242 @@
+"""
+Runtime condiviso per gli script di visione basati su MediaPipe Tasks.
+
+- I modelli (.tflite/.task) vengono letti dal disco una sola volta per processo
+  (ModelPool) e passati ai task con model_asset_buffer.
+- I task vengono creati in modo pigro, al primo utilizzo dell'handle.
+- Delegate (CPU/GPU) e numero di thread di OpenCV sono configurabili; le API
+  Python di MediaPipe non espongono il numero di thread dell'inferenza.
+- VisionRuntime è un context manager che chiude task e sorgenti video all'uscita
+  e misura separatamente il caricamento dei modelli e l'avvio a freddo.
+
+Esempio:
+    with VisionRuntime(delegate="cpu", num_threads=2) as runtime:
+        detector = runtime.task("face_detector", "modello.tflite")
+        cap = runtime.capture(0)
+        ...
+        print(runtime.timings())
+"""
+import os
+import threading
+import time
+
+import cv2
+import mediapipe as mp
+
+BaseOptions = mp.tasks.BaseOptions
+VisionRunningMode = mp.tasks.vision.RunningMode
+
+# Nome del task -> (classe del task, classe delle opzioni) in mp.tasks.vision
+TASKS = {
+    "face_detector": ("FaceDetector", "FaceDetectorOptions"),
+    "gesture_recognizer": ("GestureRecognizer", "GestureRecognizerOptions"),
+}
+
+DELEGATES = {
+    "cpu": BaseOptions.Delegate.CPU,
+    "gpu": BaseOptions.Delegate.GPU,
+}
+
+
+class ModelPool:
+    """
+    Condivide i modelli caricati tra tutte le pipeline di un processo.
+
+    I byte di ogni modello vengono letti una volta sola. Le istanze dei task
+    MediaPipe non sono thread-safe, quindi ogni handle ha la propria istanza
+    creata dagli stessi byte; le istanze in modalità IMAGE non hanno stato e
+    quando vengono rilasciate restano nel pool per il prossimo handle.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+        self._idle = {}
+        self._lock = threading.Lock()
+        # Percorso del modello -> secondi impiegati per leggerlo
+        self.read_times = {}
+
+    def model_bytes(self, model_path: str) -> bytes:
+        path = os.path.abspath(model_path)
+        with self._lock:
+            data = self._buffers.get(path)
+            if data is None:
+                start = time.perf_counter()
+                with open(path, "rb") as f:
+                    data = f.read()
+                self.read_times[path] = time.perf_counter() - start
+                self._buffers[path] = data
+        return data
+
+    @staticmethod
+    def pool_key(kind: str, model_path: str, delegate: str, running_mode, options: dict):
+        """Chiave di riuso dell'istanza, oppure None se l'istanza ha stato (VIDEO, LIVE_STREAM)."""
+        if running_mode != VisionRunningMode.IMAGE:
+            return None
+        return kind, os.path.abspath(model_path), delegate, tuple(sorted(options.items()))
+
+    def acquire(self, kind: str, model_path: str, delegate: str = "cpu", running_mode=VisionRunningMode.IMAGE, **options):
+        key = self.pool_key(kind, model_path, delegate, running_mode, options)
+        if key is not None:
+            with self._lock:
+                idle = self._idle.get(key)
+                if idle:
+                    return idle.pop()
+
+        task_name, options_name = TASKS[kind]
+        base_options = BaseOptions(model_asset_buffer=self.model_bytes(model_path), delegate=DELEGATES[delegate])
+        task_options = getattr(mp.tasks.vision, options_name)(
+            base_options=base_options, running_mode=running_mode, **options
+        )
+        return getattr(mp.tasks.vision, task_name).create_from_options(task_options)
+
+    def release(self, key, task):
+        if key is None:
+            task.close()
+            return
+        with self._lock:
+            self._idle.setdefault(key, []).append(task)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+            self._buffers.clear()
+        for tasks in idle.values():
+            for task in tasks:
+                task.close()
+
+
+class TaskHandle:
+    """
+    Handle pigro su un task MediaPipe: l'istanza viene creata al primo metodo
+    chiamato (detect_for_video, recognize_async, ...), che viene poi inoltrato
+    direttamente all'istanza senza costi aggiuntivi.
+    """
+
+    def __init__(self, runtime, kind: str, model_path: str, running_mode, options: dict):
+        self.runtime = runtime
+        self.kind = kind
+        self.model_path = model_path
+        self.running_mode = running_mode
+        self.options = options
+        self.create_seconds = None
+        self.first_result_at = None
+        self._task = None
+        self._bound = []
+        self._key = ModelPool.pool_key(kind, model_path, runtime.delegate, running_mode, options)
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._task is not None
+
+    @property
+    def task(self):
+        if self._task is None:
+            with self._lock:
+                if self._task is None:
+                    start = time.perf_counter()
+                    self._task = self.runtime.pool.acquire(
+                        self.kind, self.model_path, self.runtime.delegate, self.running_mode, **self.options
+                    )
+                    self.create_seconds = time.perf_counter() - start
+        return self._task
+
+    def mark_result(self):
+        """Registra il primo risultato; i metodi asincroni lo chiamano dalla callback."""
+        if self.first_result_at is None:
+            self.first_result_at = time.perf_counter()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        attr = getattr(self.task, name)
+        if not callable(attr):
+            return attr
+
+        def first_call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if not name.endswith("_async"):
+                self.mark_result()
+            # Le chiamate successive vanno direttamente all'istanza
+            self.__dict__[name] = attr
+            self._bound.append(name)
+            return result
+
+        return first_call
+
+    def close(self):
+        with self._lock:
+            task, self._task = self._task, None
+            for name in self._bound:
+                self.__dict__.pop(name, None)
+            self._bound.clear()
+        if task is not None:
+            self.runtime.pool.release(self._key, task)
+
+
+class VisionRuntime:
+    """Raccoglie task e sorgenti video di uno script e li chiude tutti all'uscita."""
+
+    def __init__(self, delegate: str = "cpu", num_threads: int = None, pool: ModelPool = None):
+        """
+        Args:
+            delegate (str): "cpu" oppure "gpu"
+            num_threads (int): Thread usati da OpenCV; None lascia il default
+            pool (ModelPool): Pool da condividere con altri runtime, uno nuovo di default
+        """
+        if delegate not in DELEGATES:
+            raise ValueError(f"Delegate non valido: {delegate} (ammessi: {', '.join(DELEGATES)})")
+        self.opened_at = time.perf_counter()
+        self.delegate = delegate
+        if num_threads is not None:
+            cv2.setNumThreads(num_threads)
+        self._owns_pool = pool is None
+        self.pool = pool or ModelPool()
+        self._handles = []
+        self._captures = []
+
+    def task(self, kind: str, model_path: str, running_mode=VisionRunningMode.VIDEO, **options) -> TaskHandle:
+        """Restituisce un handle sul task; il modello viene caricato al primo utilizzo."""
+        if kind not in TASKS:
+            raise ValueError(f"Task sconosciuto: {kind} (ammessi: {', '.join(TASKS)})")
+        handle = TaskHandle(self, kind, model_path, running_mode, options)
+        self._handles.append(handle)
+        return handle
+
+    def capture(self, source=0) -> cv2.VideoCapture:
+        """Apre una webcam (indice) o un file video, rilasciato alla chiusura del runtime."""
+        cap = cv2.VideoCapture(source)
+        self._captures.append(cap)
+        return cap
+
+    def timings(self) -> dict:
+        """
+        Returns:
+            dict: Lettura dei modelli e creazione dei task (caricamento) e tempo
+            dall'apertura del runtime al primo risultato (avvio a freddo), in ms
+        """
+        first_results = [h.first_result_at for h in self._handles if h.first_result_at is not None]
+        return {
+            "model_read_ms": {os.path.basename(p): s * 1000 for p, s in self.pool.read_times.items()},
+            "task_create_ms": {
+                f"{h.kind}:{os.path.basename(h.model_path)}": h.create_seconds * 1000
+                for h in self._handles
+                if h.create_seconds is not None
+            },
+            "cold_start_ms": (min(first_results) - self.opened_at) * 1000 if first_results else None,
+        }
+
+    def close(self):
+        for cap in self._captures:
+            cap.release()
+        for handle in self._handles:
+            handle.close()
+        self._captures.clear()
+        if self._owns_pool:
+            self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()